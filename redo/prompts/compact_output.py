@@ -0,0 +1,42 @@
+import json
+
+# Output contract used when VALUATION_DATE and PRODUCT_TYPE are known before the call;
+# the model then returns four short fields per row and the caller fills in the rest
+COMPACT_ROWS_FORMAT = '''JSON array of arrays. The first array is the header
+["RISK_TYPE", "GREEK_TYPE", "RIDER_VALUE", "ASSET_VALUE"]
+and every following array is one table row with the values in that order:
+- RISK_TYPE (categorized risk)
+- GREEK_TYPE (specific risk measure; "" if not applicable)
+- RIDER_VALUE (number from the Liability column)
+- ASSET_VALUE (number from the Asset column)
+Do NOT output VALUATION_DATE or PRODUCT_TYPE; they are filled in separately.'''
+
+COMPACT_OUTPUT_FORMAT = "OUTPUT FORMAT:\nReturn a " + COMPACT_ROWS_FORMAT
+
+
+def compact_example_rows(example_rows):
+    """
+    Render example rows as a compact output array.
+
+    Args:
+        example_rows: List of [risk_type, greek_type, rider_value, asset_value] rows
+
+    Returns:
+        JSON array text, header first
+    """
+    header = ["RISK_TYPE", "GREEK_TYPE", "RIDER_VALUE", "ASSET_VALUE"]
+    lines = ",\n".join("    " + json.dumps(row) for row in [header] + example_rows)
+    return f"[\n{lines}\n]"
+
+
+def compact_example_output(example_rows):
+    """
+    Render the example section for the compact output contract.
+
+    Args:
+        example_rows: List of [risk_type, greek_type, rider_value, asset_value] rows
+
+    Returns:
+        Example section text
+    """
+    return "EXAMPLE OUTPUT FORMAT:\n" + compact_example_rows(example_rows)
@@ -1,18 +1,126 @@
-def get_llm_prompt(data_str):
-    """Return the LLM prompt for transforming Excel data into a structured format."""
-    return f'''Given the following Excel data:
-{data_str}
+from prompts.compact_output import COMPACT_ROWS_FORMAT, compact_example_rows
+from prompts.partial_output import PARTIAL_ROW_SELECTION
 
-TASK: Transform this DBIB Total Dynamic Hedge P&L Excel data into a structured format.
+# Cache key version for this template
+PROMPT_VERSION = "excel-v4"
 
-OUTPUT FORMAT:
-Return a JSON array of objects with these columns:
+FULL_ROWS_FORMAT = '''JSON array of objects with these columns:
 - VALUATION_DATE (YYYYMMDD format)
 - PRODUCT_TYPE (e.g., "DBIB")
 - RISK_TYPE (categorized risk)
 - GREEK_TYPE (specific risk measure)
 - RIDER_VALUE (from Liability column)
-- ASSET_VALUE (from Asset column)
+- ASSET_VALUE (from Asset column)'''
+
+FULL_EXAMPLE_ROWS = '''[
+    {
+        "VALUATION_DATE": "20240801",
+        "PRODUCT_TYPE": "DBIB",
+        "RISK_TYPE": "Equity",
+        "GREEK_TYPE": "Delta",
+        "RIDER_VALUE": 123.45,
+        "ASSET_VALUE": 67.89
+    },
+    {
+        "VALUATION_DATE": "20240801",
+        "PRODUCT_TYPE": "DBIB",
+        "RISK_TYPE": "Interest_Rate",
+        "GREEK_TYPE": "Rho",
+        "RIDER_VALUE": 234.56,
+        "ASSET_VALUE": 78.90
+    }
+]'''
+
+CHECKLIST_RULES = '''ROW ORDER REQUIREMENT:
+For each of the following RISK_TYPE and GREEK_TYPE pairs, you SHOULD output a row, even if RIDER_VALUE and ASSET_VALUE is 0.
+CRITICAL: Output rows in the EXACT ORDER they appear in the source table. Do NOT rearrange rows to match any checklist order.
+
+OUTPUT CHECKLIST (for completeness only):
+Use this checklist only to ensure you don't miss any rows that appear in the table. The checklist order does NOT determine output order.
+
+- ("Interest_Rate", "Basis")
+- ("Interest_Rate", "Rho")
+- ("Interest_Rate", "Convexity_Residual")
+- ("Equity", "Delta")
+- ("Equity", "Gamma_Residual")
+- ("Credit", "HY_Total")
+- ("Credit", "AGG_Credit")
+- ("Credit", "Agg_Risk_Free_Growth")
+- ("Credit", "ILP_Update")
+- ("Fund_Basis_Fund_Mapping", "")
+- ("Passage_Of_Time", "")
+- ("Other_Inforce", "")
+- ("New_Business", "")
+- ("Cross_Impact_True_up", "")
+
+FLEXIBLE OUTPUT:
+If the data contains additional RISK_TYPE and GREEK_TYPE pairs not listed above, you MUST also include them in the output, using the same format.
+
+DO NOT merge RISK_TYPE and GREEK_TYPE into a single field.
+If a pair above is not found, output it with zeros.
+If a new pair is found in the data, include it as-is.
+
+IMPORTANT:
+- CRITICAL: Maintain the EXACT row order from the source table. Do not reorder rows to match checklist sequence order.
+- Always output the pairs if they are shown up in the table which may be covered in the checklist above, even if the values are zero or missing (including rows with dashes).
+- Also output any additional RISK_TYPE/GREEK_TYPE pairs found in the data.
+- Do not merge RISK_TYPE and GREEK_TYPE into a single field.
+- Include ALL pairs that appear in the table, converting dashes to zeros.
+- Do not round up the values, use the exact values shown up in the table.'''
+
+COMPACT_EXAMPLE_ROWS = compact_example_rows([
+    ["Equity", "Delta", 123.45, 67.89],
+    ["Interest_Rate", "Rho", 234.56, 78.90]
+])
+
+PARTIAL_ATTRIBUTE = ' partial="true"'
+
+
+def _single_output(compact):
+    """Output format and example sections for a prompt answered with one row array."""
+    rows_format = COMPACT_ROWS_FORMAT if compact else FULL_ROWS_FORMAT
+    example_rows = COMPACT_EXAMPLE_ROWS if compact else FULL_EXAMPLE_ROWS
+    output_format = f'''OUTPUT FORMAT:
+Return a {rows_format}
+Return ONLY the JSON array, no explanations or additional text.'''
+    return output_format, f"EXAMPLE OUTPUT FORMAT:\n{example_rows}"
+
+
+def _multi_sheet_output(compact, partial_note):
+    """
+    Output format and example sections for a prompt answered with one array per sheet.
+
+    The sections do not name the sheets, so they stay part of the cacheable prefix.
+    """
+    rows_format = COMPACT_ROWS_FORMAT if compact else FULL_ROWS_FORMAT
+    example_rows = COMPACT_EXAMPLE_ROWS if compact else FULL_EXAMPLE_ROWS
+    output_format = f'''OUTPUT FORMAT:
+The Excel data below contains several sheets, each inside a <sheet name="..."> section.
+Apply all of the rules to each sheet on its own and never move rows between sheets.
+{partial_note}Return ONE JSON object with exactly one key per sheet section, spelled exactly as its name attribute.
+The value of each key is that sheet's output: a {rows_format}
+Return ONLY the JSON object, no explanations or additional text.'''
+    example_output = f'''EXAMPLE OUTPUT FORMAT (for a sheet named "Sheet1"; one key per sheet):
+{{
+"Sheet1": {example_rows}
+}}'''
+    return output_format, example_output
+
+
+def get_llm_prompt(data_str, compact=False, partial=False, output_sections=None):
+    """
+    Return the LLM prompt for transforming Excel data into a structured format.
+    With compact=True the model returns only [risk, greek, rider, asset] rows.
+    With partial=True the data holds only the rows the mapping rules did not extract,
+    so the output checklist is replaced by "output only the rows shown".
+    output_sections replaces the single-array output format and example sections.
+    """
+    output_format, example_output = output_sections or _single_output(compact)
+    row_rules = PARTIAL_ROW_SELECTION if partial else CHECKLIST_RULES
+    # Static instructions first and the table last, so the provider can reuse the cached prefix
+    return f'''TASK: Transform this DBIB Total Dynamic Hedge P&L Excel data into a structured format.
+
+{output_format}
 
 DATA EXTRACTION RULES:
 
@@ -61,61 +169,34 @@ IMPORTANT EXTRACTION INSTRUCTIONS:
 - Do not shift values between columns or rows!!!!!
 - Rider value is always the value in the Liability column, and Asset value is always the value in the Asset column.
 
-ROW ORDER REQUIREMENT:
-For each of the following RISK_TYPE and GREEK_TYPE pairs, you SHOULD output a row, even if RIDER_VALUE and ASSET_VALUE is 0.
-CRITICAL: Output rows in the EXACT ORDER they appear in the source table. Do NOT rearrange rows to match any checklist order.
-
-OUTPUT CHECKLIST (for completeness only):
-Use this checklist only to ensure you don't miss any rows that appear in the table. The checklist order does NOT determine output order.
-
-- ("Interest_Rate", "Basis")
-- ("Interest_Rate", "Rho")
-- ("Interest_Rate", "Convexity_Residual")
-- ("Equity", "Delta")
-- ("Equity", "Gamma_Residual")
-- ("Credit", "HY_Total")
-- ("Credit", "AGG_Credit")
-- ("Credit", "Agg_Risk_Free_Growth")
-- ("Credit", "ILP_Update")
-- ("Fund_Basis_Fund_Mapping", "")
-- ("Passage_Of_Time", "")
-- ("Other_Inforce", "")
-- ("New_Business", "")
-- ("Cross_Impact_True_up", "")
+{row_rules}
 
-FLEXIBLE OUTPUT:
-If the data contains additional RISK_TYPE and GREEK_TYPE pairs not listed above, you MUST also include them in the output, using the same format.
+{example_output}
 
-DO NOT merge RISK_TYPE and GREEK_TYPE into a single field.
-If a pair above is not found, output it with zeros.
-If a new pair is found in the data, include it as-is.
-
-IMPORTANT:
-- CRITICAL: Maintain the EXACT row order from the source table. Do not reorder rows to match checklist sequence order.
-- Always output the pairs if they are shown up in the table which may be covered in the checklist above, even if the values are zero or missing (including rows with dashes).
-- Also output any additional RISK_TYPE/GREEK_TYPE pairs found in the data.
-- Do not merge RISK_TYPE and GREEK_TYPE into a single field.
-- Return ONLY the JSON array, no explanations or additional text.
-- Include ALL pairs that appear in the table, converting dashes to zeros.
-- Do not round up the values, use the exact values shown up in the table.
-
-EXAMPLE OUTPUT FORMAT:
-[
-    {{
-        "VALUATION_DATE": "20240801",
-        "PRODUCT_TYPE": "DBIB",
-        "RISK_TYPE": "Equity",
-        "GREEK_TYPE": "Delta",
-        "RIDER_VALUE": 123.45,
-        "ASSET_VALUE": 67.89
-    }},
-    {{
-        "VALUATION_DATE": "20240801",
-        "PRODUCT_TYPE": "DBIB",
-        "RISK_TYPE": "Interest_Rate",
-        "GREEK_TYPE": "Rho",
-        "RIDER_VALUE": 234.56,
-        "ASSET_VALUE": 78.90
-    }}
-]
-''' 
\ No newline at end of file
+EXCEL DATA:
+{data_str}
+'''
+
+
+def get_multi_sheet_llm_prompt(sheet_data, compact=False, partial_sheets=()):
+    """
+    Return one prompt covering several cleaned sheets, each in a tagged section.
+    The model answers with a JSON object keyed by sheet name; the output format
+    section says so instead of asking for a single array.
+    Sheets in partial_sheets hold only the rows the mapping rules did not extract.
+    """
+    partial_sheets = [name for name in sheet_data if name in partial_sheets]
+    sections = "\n".join(
+        f'<sheet name="{name}"{PARTIAL_ATTRIBUTE if name in partial_sheets else ""}>\n{data_str}\n</sheet>'
+        for name, data_str in sheet_data.items()
+    )
+    # All sheets partial: the whole prompt uses the partial row rules
+    all_partial = len(partial_sheets) == len(sheet_data)
+    partial_note = ""
+    if partial_sheets and not all_partial:
+        partial_note = '''Sheets marked partial="true" contain only rows that were not already extracted.
+For those sheets the OUTPUT CHECKLIST does not apply: output exactly one row per data row shown
+and do NOT add zero rows for pairs that are not shown.
+'''
+    output_sections = _multi_sheet_output(compact, partial_note)
+    return get_llm_prompt(sections, compact=compact, partial=all_partial, output_sections=output_sections)
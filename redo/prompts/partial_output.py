@@ -0,0 +1,16 @@
+# Replaces the output checklist when the mapping rules already extracted some rows:
+# the table then shows only the remaining rows, and checklist pairs it no longer
+# contains must not come back as zero rows. The selection rules carry no output
+# instruction, so prompts returning something other than one array can reuse them
+PARTIAL_ROW_SELECTION = '''ROW SELECTION:
+Some rows of this table were already extracted and have been removed from the data below.
+Output exactly one row for each data row shown in the table data, and no other rows.
+- Do NOT add rows for risk/greek pairs that are not shown, not even with zero values.
+- Section header rows are shown only for context; do not output them.
+- If a row is shown with dashes (-) or blank values, include it with zero values.
+- Output rows in the EXACT ORDER they appear in the table data.
+- Do not merge RISK_TYPE and GREEK_TYPE into a single field.
+- Do not round up the values, use the exact values shown up in the table.'''
+
+PARTIAL_ROWS_RULES = PARTIAL_ROW_SELECTION + '''
+- Return ONLY the JSON array, no explanations or additional text.'''
@@ -3,26 +3,103 @@ import json
 import pandas as pd
 from openai import OpenAI
 import os
+from prompts.compact_output import COMPACT_OUTPUT_FORMAT, compact_example_output
+from prompts.partial_output import PARTIAL_ROWS_RULES
 
-def get_llm_prompt(data_str, extracted_date=None):
-    """Return the LLM prompt for transforming Excel data into a structured format."""
-    date_instruction = ""
-    if extracted_date:
-        date_instruction = f"\n- IMPORTANT: Use VALUATION_DATE = {extracted_date} if no date is visible in the table data."
-    
-    return f'''Given the following Excel data:
-{data_str}
-
-TASK: Transform this DBIB Total Dynamic Hedge P&L Excel data into a structured format.
+# Bump when the template text changes so cached LLM responses are not reused
+PROMPT_VERSION = "blue-v4"
 
-OUTPUT FORMAT:
+FULL_OUTPUT_FORMAT = '''OUTPUT FORMAT:
 Return a JSON array of objects with these columns:
 - VALUATION_DATE (YYYYMMDD format)
 - PRODUCT_TYPE (e.g., "DBIB")
 - RISK_TYPE (categorized risk)
 - GREEK_TYPE (specific risk measure)
 - RIDER_VALUE (from Liability column)
-- ASSET_VALUE (from Asset column)
+- ASSET_VALUE (from Asset column)'''
+
+FULL_EXAMPLE_OUTPUT = '''EXAMPLE OUTPUT FORMAT:
+[
+    {
+        "VALUATION_DATE": "20240801",
+        "PRODUCT_TYPE": "DBIB",
+        "RISK_TYPE": "Equity",
+        "GREEK_TYPE": "Delta",
+        "RIDER_VALUE": 123.45,
+        "ASSET_VALUE": 67.89
+    },
+    {
+        "VALUATION_DATE": "20240801",
+        "PRODUCT_TYPE": "DBIB",
+        "RISK_TYPE": "Interest_Rate",
+        "GREEK_TYPE": "Rho",
+        "RIDER_VALUE": 234.56,
+        "ASSET_VALUE": 78.90
+    }
+]'''
+
+CHECKLIST_RULES = '''ROW ORDER REQUIREMENT:
+For each of the following RISK_TYPE and GREEK_TYPE pairs, you SHOULD output a row, even if RIDER_VALUE and ASSET_VALUE is 0.
+CRITICAL: Output rows in the EXACT ORDER they appear in the source table. Do NOT rearrange rows to match any checklist order.
+
+OUTPUT CHECKLIST (for completeness only):
+Use this checklist only to ensure you don't miss any rows that appear in the table. The checklist order does NOT determine output order.
+
+- ("Interest_Rate", "Basis")
+- ("Interest_Rate", "Rho")
+- ("Interest_Rate", "Convexity_Residual")
+- ("Equity", "Delta")
+- ("Equity", "Gamma_Residual")
+- ("Credit", "HY_Total")
+- ("Credit", "AGG_Credit")
+- ("Credit", "Agg_Risk_Free_Growth")
+- ("Credit", "ILP_Update")
+- ("Fund_Basis_Fund_Mapping", "")
+- ("Passage_Of_Time", "")
+- ("Other_Inforce", "")
+- ("New_Business", "")
+- ("Cross_Impact_True_up", "")
+
+FLEXIBLE OUTPUT:
+If the data contains additional RISK_TYPE and GREEK_TYPE pairs not listed above, you MUST also include them in the output, using the same format.
+
+DO NOT merge RISK_TYPE and GREEK_TYPE into a single field.
+If a pair above is not found in the table, output it with zeros.
+If a new pair is found in the data, include it as-is.
+IMPORTANT: If a row appears in the table with dashes (-), include it with zero values. For example, if ILP_Update appears with dashes, include it as zeros rather than skipping it.
+
+IMPORTANT:
+- CRITICAL: Maintain the EXACT row order from the source table. Do not reorder rows to match checklist sequence.
+- Always output the pairs if they are shown up in the table which may be covered in the checklist above, even if the values are zero or missing (including rows with dashes).
+- Also output any additional RISK_TYPE/GREEK_TYPE pairs found in the data.
+- Do not merge RISK_TYPE and GREEK_TYPE into a single field.
+- Return ONLY the JSON array, no explanations or additional text.
+- Include ALL pairs that appear in the table, converting dashes to zeros.
+- Do not round up the values, use the exact values shown up in the table.'''
+
+COMPACT_EXAMPLE_OUTPUT = compact_example_output([
+    ["Equity", "Delta", 123.45, 67.89],
+    ["Interest_Rate", "Rho", 234.56, 78.90]
+])
+
+def get_llm_prompt(data_str, extracted_date=None, compact=False, partial=False):
+    """
+    Return the LLM prompt for transforming Excel data into a structured format.
+    With compact=True the valuation date and product type are filled in by the caller.
+    With partial=True the data holds only the rows the mapping rules did not extract,
+    so the output checklist is replaced by "output only the rows shown".
+    """
+    output_format = COMPACT_OUTPUT_FORMAT if compact else FULL_OUTPUT_FORMAT
+    example_output = COMPACT_EXAMPLE_OUTPUT if compact else FULL_EXAMPLE_OUTPUT
+    row_rules = PARTIAL_ROWS_RULES if partial else CHECKLIST_RULES
+    date_instruction = ""
+    if extracted_date and not compact:
+        date_instruction = f"\nIMPORTANT: Use VALUATION_DATE = {extracted_date} if no date is visible in the table data."
+    
+    # Static instructions first and the table last, so the provider can reuse the cached prefix
+    return f'''TASK: Transform this DBIB Total Dynamic Hedge P&L Excel data into a structured format.
+
+{output_format}
 
 DATA EXTRACTION RULES:
 
@@ -30,7 +107,7 @@ DATA EXTRACTION RULES:
    - Extract PRODUCT_TYPE by looking for either "WB" or "DBIB" in the header row (ignore "VA Rider" prefix)
    - For headers like "VA Rider WB", extract "WB" as the PRODUCT_TYPE
    - For headers with "DBIB", extract "DBIB" as the PRODUCT_TYPE
-   - Extract VALUATION_DATE from "as of MM/DD/YYYY" and convert to YYYYMMDD{date_instruction}
+   - Extract VALUATION_DATE from "as of MM/DD/YYYY" and convert to YYYYMMDD
 
 2. Section Processing:
    Main sections to identify:
@@ -72,62 +149,10 @@ IMPORTANT EXTRACTION INSTRUCTIONS:
 - DO NOT include any rows where the label is a section header or a total/subtotal row (e.g., "Total", "Total Equity", "Total Interest Rate", "Total Credit", "Sub Total", "Total P&L", etc.), or where RISK_TYPE is just the section name with no GREEK_TYPE.
   Only include rows with a specific risk/greek type (e.g., "Delta", "Gamma", "Rho", etc.), or standalone rows that are not totals.
 
-ROW ORDER REQUIREMENT:
-For each of the following RISK_TYPE and GREEK_TYPE pairs, you SHOULD output a row, even if RIDER_VALUE and ASSET_VALUE is 0.
-CRITICAL: Output rows in the EXACT ORDER they appear in the source table. Do NOT rearrange rows to match any checklist order.
+{row_rules}
 
-OUTPUT CHECKLIST (for completeness only):
-Use this checklist only to ensure you don't miss any rows that appear in the table. The checklist order does NOT determine output order.
+{example_output}
 
-- ("Interest_Rate", "Basis")
-- ("Interest_Rate", "Rho")
-- ("Interest_Rate", "Convexity_Residual")
-- ("Equity", "Delta")
-- ("Equity", "Gamma_Residual")
-- ("Credit", "HY_Total")
-- ("Credit", "AGG_Credit")
-- ("Credit", "Agg_Risk_Free_Growth")
-- ("Credit", "ILP_Update")
-- ("Fund_Basis_Fund_Mapping", "")
-- ("Passage_Of_Time", "")
-- ("Other_Inforce", "")
-- ("New_Business", "")
-- ("Cross_Impact_True_up", "")
-
-FLEXIBLE OUTPUT:
-If the data contains additional RISK_TYPE and GREEK_TYPE pairs not listed above, you MUST also include them in the output, using the same format.
-
-DO NOT merge RISK_TYPE and GREEK_TYPE into a single field.
-If a pair above is not found in the table, output it with zeros.
-If a new pair is found in the data, include it as-is.
-IMPORTANT: If a row appears in the table with dashes (-), include it with zero values. For example, if ILP_Update appears with dashes, include it as zeros rather than skipping it.
-
-IMPORTANT:
-- CRITICAL: Maintain the EXACT row order from the source table. Do not reorder rows to match checklist sequence.
-- Always output the pairs if they are shown up in the table which may be covered in the checklist above, even if the values are zero or missing (including rows with dashes).
-- Also output any additional RISK_TYPE/GREEK_TYPE pairs found in the data.
-- Do not merge RISK_TYPE and GREEK_TYPE into a single field.
-- Return ONLY the JSON array, no explanations or additional text.
-- Include ALL pairs that appear in the table, converting dashes to zeros.
-- Do not round up the values, use the exact values shown up in the table.
-
-EXAMPLE OUTPUT FORMAT:
-[
-    {{
-        "VALUATION_DATE": "20240801",
-        "PRODUCT_TYPE": "DBIB",
-        "RISK_TYPE": "Equity",
-        "GREEK_TYPE": "Delta",
-        "RIDER_VALUE": 123.45,
-        "ASSET_VALUE": 67.89
-    }},
-    {{
-        "VALUATION_DATE": "20240801",
-        "PRODUCT_TYPE": "DBIB",
-        "RISK_TYPE": "Interest_Rate",
-        "GREEK_TYPE": "Rho",
-        "RIDER_VALUE": 234.56,
-        "ASSET_VALUE": 78.90
-    }}
-]
-''' 
\ No newline at end of file
+TABLE DATA:
+{data_str}
+{date_instruction}''' 
\ No newline at end of file
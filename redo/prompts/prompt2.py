@@ -1,17 +1,80 @@
-def get_llm_prompt2(data_str):
-    return f'''Given the following table image data:
-{data_str}
+from prompts.compact_output import COMPACT_OUTPUT_FORMAT, compact_example_output
 
-TASK: Extract and transform the WB Total Dynamic Hedge P&L table into a structured JSON array.
+# Template version, part of the LLM response cache key
+PROMPT_VERSION = "red-v2"
 
-OUTPUT FORMAT:
+FULL_OUTPUT_FORMAT = '''OUTPUT FORMAT:
 Return a JSON array of objects with these columns:
 - VALUATION_DATE (YYYYMMDD format, from the date in the table title)
 - PRODUCT_TYPE (e.g., "WB", from the first word in the title)
 - RISK_TYPE (e.g., "Equity", "Rates", "Credit", "Underlying_Fund", "Theta_Carry", "Other_Unhedged", "Fees", "ILP", "New_Business", "Claims", "Model_Change")
 - GREEK_TYPE (e.g., "Delta", "Gamma", "Volatility", "Dynamic_Rho", "Credit", "ILP"; blank if not applicable)
 - RIDER_VALUE (value from the Liability column)
-- ASSET_VALUE (value from the Asset column)
+- ASSET_VALUE (value from the Asset column)'''
+
+FULL_EXAMPLE_OUTPUT = '''EXAMPLE OUTPUT FORMATS:
+
+**Scenario 1 - When "New Business / Model Change" appears as ONE compound row:**
+[
+    {
+        "VALUATION_DATE": "20240501",
+        "PRODUCT_TYPE": "WB",
+        "RISK_TYPE": "Equity",
+        "GREEK_TYPE": "Delta",
+        "RIDER_VALUE": -14,
+        "ASSET_VALUE": 14
+    },
+    {
+        "VALUATION_DATE": "20240501",
+        "PRODUCT_TYPE": "WB",
+        "RISK_TYPE": "New_Business_Model_Change",
+        "GREEK_TYPE": "",
+        "RIDER_VALUE": 0,
+        "ASSET_VALUE": 0
+    }
+]
+
+**Scenario 2 - When "New Business" and "Model Change" appear as SEPARATE rows:**
+[
+    {
+        "VALUATION_DATE": "20240501",
+        "PRODUCT_TYPE": "WB",
+        "RISK_TYPE": "Equity",
+        "GREEK_TYPE": "Delta",
+        "RIDER_VALUE": -14,
+        "ASSET_VALUE": 14
+    },
+    {
+        "VALUATION_DATE": "20240501",
+        "PRODUCT_TYPE": "WB",
+        "RISK_TYPE": "New_Business",
+        "GREEK_TYPE": "",
+        "RIDER_VALUE": 0,
+        "ASSET_VALUE": 0
+    },
+    {
+        "VALUATION_DATE": "20240501",
+        "PRODUCT_TYPE": "WB",
+        "RISK_TYPE": "Model_Change",
+        "GREEK_TYPE": "",
+        "RIDER_VALUE": 0,
+        "ASSET_VALUE": 0
+    }
+]'''
+
+COMPACT_EXAMPLE_OUTPUT = compact_example_output([
+    ["Equity", "Delta", -14, 14],
+    ["Underlying_Fund", "", 3, 0],
+    ["New_Business_Model_Change", "", 0, 0]
+])
+
+def get_llm_prompt2(data_str, compact=False):
+    output_format = COMPACT_OUTPUT_FORMAT if compact else FULL_OUTPUT_FORMAT
+    example_output = COMPACT_EXAMPLE_OUTPUT if compact else FULL_EXAMPLE_OUTPUT
+    # Static instructions first and the table last, so the provider can reuse the cached prefix
+    return f'''TASK: Extract and transform the WB Total Dynamic Hedge P&L table into a structured JSON array.
+
+{output_format}
 
 DATA EXTRACTION RULES:
 
@@ -58,55 +121,10 @@ IMPORTANT:
 - Extract the actual date from the table title, not use a hardcoded date.
 - **CRITICAL**: ALWAYS match the EXACT row structure from the source table. Count the actual rows you see - if "New Business" and "Model Change" are on separate lines, output 2 rows. If "New Business / Model Change" is on one line, output 1 row.
 
-EXAMPLE OUTPUT FORMATS:
-
-**Scenario 1 - When "New Business / Model Change" appears as ONE compound row:**
-[
-    {{
-        "VALUATION_DATE": "20240501",
-        "PRODUCT_TYPE": "WB",
-        "RISK_TYPE": "Equity",
-        "GREEK_TYPE": "Delta",
-        "RIDER_VALUE": -14,
-        "ASSET_VALUE": 14
-    }},
-    {{
-        "VALUATION_DATE": "20240501",
-        "PRODUCT_TYPE": "WB",
-        "RISK_TYPE": "New_Business_Model_Change",
-        "GREEK_TYPE": "",
-        "RIDER_VALUE": 0,
-        "ASSET_VALUE": 0
-    }}
-]
+{example_output}
 
-**Scenario 2 - When "New Business" and "Model Change" appear as SEPARATE rows:**
-[
-    {{
-        "VALUATION_DATE": "20240501",
-        "PRODUCT_TYPE": "WB",
-        "RISK_TYPE": "Equity",
-        "GREEK_TYPE": "Delta",
-        "RIDER_VALUE": -14,
-        "ASSET_VALUE": 14
-    }},
-    {{
-        "VALUATION_DATE": "20240501",
-        "PRODUCT_TYPE": "WB",
-        "RISK_TYPE": "New_Business",
-        "GREEK_TYPE": "",
-        "RIDER_VALUE": 0,
-        "ASSET_VALUE": 0
-    }},
-    {{
-        "VALUATION_DATE": "20240501",
-        "PRODUCT_TYPE": "WB",
-        "RISK_TYPE": "Model_Change",
-        "GREEK_TYPE": "",
-        "RIDER_VALUE": 0,
-        "ASSET_VALUE": 0
-    }}
-]
+TABLE IMAGE DATA:
+{data_str}
 
 Return ONLY the JSON array, no other text or explanations.
 ''' 
\ No newline at end of file
@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible replay server for offline performance runs.
+Answers /v1/chat/completions (text and image prompts, streamed or not) from recorded
+responses keyed by prompt hash, with configurable latency, 429s and malformed payloads,
+so concurrency, retry and caching changes can be load-tested without API quota.
+/v1/files and /v1/batches are served too, so batch-submit and batch-collect run offline:
+a batch answers each of its lines from the same recordings.
+
+Point the pipeline at it in config/secrets.toml:
+    [openai]
+    base_url = "http://127.0.0.1:8765/v1"
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+import email.parser
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prompt prefixes shorter than this are never served from the simulated prompt cache
+CACHE_MIN_PREFIX_CHARS = 4096
+CACHE_PREFIX_STEP_CHARS = 512
+
+
+def parse_latency(spec: str):
+    """
+    Parse a latency distribution spec into a sampler returning seconds.
+
+    Supported: "0", "fixed:S", "uniform:LOW,HIGH", "normal:MEAN,STDDEV",
+    "lognormal:MU,SIGMA" (of the underlying normal, in log-seconds).
+
+    Args:
+        spec: Distribution spec
+
+    Returns:
+        Zero-argument callable returning a non-negative latency
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+    if kind in ("", "0", "none"):
+        return lambda: 0.0
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _message_text(messages: list) -> str:
+    """Flatten chat messages to one string; images contribute a hash of their data URL."""
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                parts.append(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                url = part.get("image_url", {}).get("url", "")
+                parts.append("<image " + hashlib.sha256(url.encode("utf-8")).hexdigest() + ">")
+    return "\n".join(parts)
+
+
+def request_key(body: dict) -> str:
+    """
+    Replay key of a chat completion request: hash of the messages and response format.
+
+    The model is not part of the key, so recordings also answer hedged requests
+    sent to a fallback model.
+    """
+    response_format = body.get("response_format") or {}
+    schema_name = (response_format.get("json_schema") or {}).get("name", response_format.get("type", ""))
+    payload = json.dumps({"messages": body.get("messages", []), "response_format": schema_name}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecordingStore:
+    def __init__(self, path: str):
+        """
+        JSONL file of recorded responses, one {"key", "model", "content", "latency"} object per line.
+
+        Args:
+            path: Recordings file; created on the first recorded response
+        """
+        self.path = path
+        self.recordings = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recordings[entry["key"]] = entry
+        print(f"Loaded {len(self.recordings)} recorded responses from {path}")
+
+    def get(self, key: str):
+        return self.recordings.get(key)
+
+    def add(self, entry: dict):
+        with self._lock:
+            self.recordings[entry["key"]] = entry
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class PromptCacheSimulator:
+    """Report cached_tokens for prompts sharing a long prefix with an earlier one, like provider prompt caching."""
+
+    def __init__(self):
+        self.prefixes = set()
+        self._lock = threading.Lock()
+
+    def cached_chars(self, text: str) -> int:
+        boundaries = range(CACHE_MIN_PREFIX_CHARS, len(text) + 1, CACHE_PREFIX_STEP_CHARS)
+        hashes = [(n, hashlib.sha1(text[:n].encode("utf-8")).hexdigest()) for n in boundaries]
+        with self._lock:
+            cached = max((n for n, digest in hashes if digest in self.prefixes), default=0)
+            self.prefixes.update(digest for _, digest in hashes)
+        return cached
+
+
+class ReplayError(Exception):
+    """A request the server answers with an OpenAI-style error object."""
+
+    def __init__(self, status: int, message: str, error_type: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.error_type = error_type
+        self.headers = headers
+
+    def payload(self) -> dict:
+        return {"error": {"message": self.message, "type": self.error_type, "code": self.error_type}}
+
+
+def _multipart_fields(content_type: str, data: bytes) -> dict:
+    """
+    Parse a multipart/form-data body.
+
+    Returns:
+        Dictionary of field name to (filename, bytes)
+    """
+    message = email.parser.BytesParser().parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + data
+    )
+    if not message.is_multipart():
+        raise ReplayError(400, "Expected a multipart/form-data body", "invalid_request_error")
+    fields = {}
+    for part in message.get_payload():
+        name = part.get_param("name", header="content-disposition")
+        if name:
+            fields[name] = (part.get_filename(), part.get_payload(decode=True) or b"")
+    return fields
+
+
+class ReplayState:
+    def __init__(self, args):
+        self.store = RecordingStore(args.recordings)
+        self.latency = parse_latency(args.latency)
+        self.replay_latency = args.replay_latency
+        self.chunk_delay = args.chunk_delay
+        self.rate_429 = args.rate_429
+        self.rate_malformed = args.rate_malformed
+        self.fallback_content = args.fallback_content
+        self.upstream = args.upstream.rstrip("/") if args.upstream else None
+        self.prompt_cache = PromptCacheSimulator()
+        self.counters = {"requests": 0, "replayed": 0, "recorded": 0, "misses": 0, "429": 0, "malformed": 0}
+        # Uploaded and generated batch files, and batch jobs; kept in memory for the server's lifetime
+        self.files = {}
+        self.batches = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def add_file(self, filename: str, purpose: str, data: bytes) -> dict:
+        """Store a file and return its OpenAI file object."""
+        file_object = {
+            "id": f"file-replay-{uuid.uuid4().hex[:12]}",
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed"
+        }
+        with self._lock:
+            self.files[file_object["id"]] = (file_object, data)
+        return file_object
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    server_version = "ReplayServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> ReplayState:
+        return self.server.replay_state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, error_type: str, headers: dict = None):
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": error_type}}, headers)
+
+    def _read_body(self) -> bytes:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            raise ReplayError(400, "Invalid Content-Length header", "invalid_request_error")
+        return self.rfile.read(length)
+
+    def _read_json(self) -> dict:
+        """Read the request body as a JSON object."""
+        try:
+            body = json.loads(self._read_body() or b"{}")
+        except ValueError as e:
+            raise ReplayError(400, f"Could not parse the JSON body of your request: {e}", "invalid_request_error")
+        if not isinstance(body, dict):
+            raise ReplayError(400, "The request body must be a JSON object", "invalid_request_error")
+        return body
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        parts = path.split("/")
+        if path.endswith("/stats"):
+            self._send_json(200, dict(self.state.counters, recordings=len(self.state.store.recordings)))
+        elif len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content":
+            stored = self.state.files.get(parts[-2])
+            if stored is None:
+                self._send_error(404, f"No such file: {parts[-2]}", "not_found")
+                return
+            data = stored[1]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif len(parts) >= 2 and parts[-2] == "batches":
+            batch = self.state.batches.get(parts[-1])
+            if batch is None:
+                self._send_error(404, f"No such batch: {parts[-1]}", "not_found")
+            else:
+                self._send_json(200, batch)
+        else:
+            self._send_error(404, f"Unknown path {self.path}", "not_found")
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        try:
+            if path.endswith("/chat/completions"):
+                self._chat_completion()
+            elif path.endswith("/files"):
+                self._upload_file()
+            elif path.endswith("/batches"):
+                self._create_batch()
+            else:
+                raise ReplayError(404, f"Only chat completions, files and batches are served, not {self.path}", "not_found")
+        except ReplayError as e:
+            self._send_json(e.status, e.payload(), e.headers)
+
+    def _chat_completion(self):
+        body = self._read_json()
+        state = self.state
+        state.count("requests")
+
+        if random.random() < state.rate_429:
+            state.count("429")
+            raise ReplayError(429, "Rate limit reached (injected by replay server)", "rate_limit_exceeded", {
+                "retry-after-ms": "1000",
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": "1s"
+            })
+
+        content, finish_reason, usage, model, latency = self._answer(body)
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            self._stream(model, content, finish_reason, usage if include_usage else None, latency)
+            return
+
+        time.sleep(latency)
+        self._send_json(200, self._completion(model, content, finish_reason, usage))
+
+    def _answer(self, body: dict):
+        """
+        Resolve a chat completion request from the recordings (or upstream, or the fallback).
+
+        Returns:
+            Tuple of (content, finish_reason, usage, model, latency)
+
+        Raises:
+            ReplayError: If the prompt has no answer
+        """
+        state = self.state
+        key = request_key(body)
+        entry = state.store.get(key)
+        if entry is not None:
+            state.count("replayed")
+        elif state.upstream:
+            entry = self._record(body, key)
+        elif state.fallback_content is not None:
+            state.count("misses")
+            entry = {"key": key, "model": body.get("model"), "content": state.fallback_content, "latency": 0.0}
+        else:
+            state.count("misses")
+            raise ReplayError(404, f"No recorded response for prompt hash {key}", "replay_miss")
+
+        content = entry["content"]
+        finish_reason = "stop"
+        if random.random() < state.rate_malformed:
+            state.count("malformed")
+            # Truncated payload, as if the model stopped mid-array
+            content = content[:random.randint(0, max(0, len(content) - 1))]
+            finish_reason = "length"
+
+        latency = entry.get("latency", 0.0) if state.replay_latency else state.latency()
+        prompt_text = _message_text(body.get("messages", []))
+        usage = {
+            "prompt_tokens": len(prompt_text) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": len(prompt_text) // 4 + len(content) // 4,
+            "prompt_tokens_details": {"cached_tokens": state.prompt_cache.cached_chars(prompt_text) // 4}
+        }
+        model = body.get("model") or entry.get("model") or "replay"
+        return content, finish_reason, usage, model, latency
+
+    @staticmethod
+    def _completion(model: str, content: str, finish_reason: str, usage: dict) -> dict:
+        return {
+            "id": f"chatcmpl-replay-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason
+            }],
+            "usage": usage
+        }
+
+    def _upload_file(self):
+        fields = _multipart_fields(self.headers.get("Content-Type", ""), self._read_body())
+        if "file" not in fields:
+            raise ReplayError(400, "Missing the 'file' field", "invalid_request_error")
+        filename, data = fields["file"]
+        purpose = fields.get("purpose", (None, b"batch"))[1].decode("utf-8")
+        self._send_json(200, self.state.add_file(filename or "upload.jsonl", purpose, data))
+
+    def _create_batch(self):
+        body = self._read_json()
+        stored = self.state.files.get(body.get("input_file_id"))
+        if stored is None:
+            raise ReplayError(400, f"No such input file: {body.get('input_file_id')}", "invalid_request_error")
+        try:
+            lines = [json.loads(line) for line in stored[1].decode("utf-8").splitlines() if line.strip()]
+        except ValueError as e:
+            raise ReplayError(400, f"Input file is not valid JSONL: {e}", "invalid_request_error")
+        batch = {
+            "id": f"batch_replay_{uuid.uuid4().hex[:12]}",
+            "object": "batch",
+            "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0}
+        }
+        self.state.batches[batch["id"]] = batch
+        # Answered in the background, like a real batch: retrieve shows in_progress until it is done
+        threading.Thread(target=self._run_batch, args=(batch, lines), daemon=True).start()
+        self._send_json(200, batch)
+
+    def _run_batch(self, batch: dict, lines: list):
+        """Answer every request line of a batch and publish the output (and error) files."""
+        outputs = []
+        errors = []
+        for line in lines:
+            request_id = f"req_replay_{uuid.uuid4().hex[:12]}"
+            self.state.count("requests")
+            try:
+                content, finish_reason, usage, model, _ = self._answer(line.get("body", {}))
+            except ReplayError as e:
+                errors.append({"id": request_id, "custom_id": line.get("custom_id"), "response": None,
+                               "error": {"code": e.error_type, "message": e.message}})
+                continue
+            outputs.append({"id": request_id, "custom_id": line.get("custom_id"), "error": None, "response": {
+                "status_code": 200,
+                "request_id": request_id,
+                "body": self._completion(model, content, finish_reason, usage)
+            }})
+
+        def jsonl(rows):
+            return "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+
+        if outputs:
+            batch["output_file_id"] = self.state.add_file(f"{batch['id']}_output.jsonl", "batch_output", jsonl(outputs))["id"]
+        if errors:
+            batch["error_file_id"] = self.state.add_file(f"{batch['id']}_errors.jsonl", "batch_output", jsonl(errors))["id"]
+        batch["request_counts"] = {"total": len(lines), "completed": len(outputs), "failed": len(errors)}
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+    def _record(self, body: dict, key: str):
+        """Forward a request to the upstream API, store its answer and return the new entry."""
+        state = self.state
+        upstream_body = dict(body, stream=False)
+        upstream_body.pop("stream_options", None)
+        request = urllib.request.Request(
+            f"{state.upstream}/chat/completions",
+            data=json.dumps(upstream_body).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": self.headers.get("Authorization", "")},
+            method="POST"
+        )
+        started = time.monotonic()
+        try:
+            with urllib.request.urlopen(request, timeout=300) as response:
+                payload = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise ReplayError(e.code, f"Upstream error: {e.read()[:500]!r}", "upstream_error")
+        except OSError as e:
+            # URLError, refused/reset connections and timeouts: answer instead of dropping the socket
+            raise ReplayError(502, f"Upstream unreachable: {e}", "upstream_error")
+        entry = {
+            "key": key,
+            "model": payload.get("model"),
+            "content": payload["choices"][0]["message"]["content"] or "",
+            "latency": round(time.monotonic() - started, 3)
+        }
+        state.store.add(entry)
+        state.count("recorded")
+        return entry
+
+    def _stream(self, model: str, content: str, finish_reason: str, usage: dict, latency: float):
+        """Send content as server-sent chat.completion.chunk events."""
+        completion_id = f"chatcmpl-replay-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        def chunk(delta: dict, reason=None, chunk_usage=None, choices=True):
+            event = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": reason}] if choices else []}
+            if chunk_usage is not None:
+                event["usage"] = chunk_usage
+            return f"data: {json.dumps(event)}\n\n".encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(latency)
+        try:
+            self.wfile.write(chunk({"role": "assistant", "content": ""}))
+            size = 16
+            for start in range(0, len(content), size):
+                self.wfile.write(chunk({"content": content[start:start + size]}))
+                self.wfile.flush()
+                if self.state.chunk_delay:
+                    time.sleep(self.state.chunk_delay)
+            self.wfile.write(chunk({}, finish_reason))
+            if usage is not None:
+                self.wfile.write(chunk(None, chunk_usage=usage, choices=False))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the request (e.g. a losing hedged copy)
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible replay server for offline performance runs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--recordings", default="data/replay/recordings.jsonl",
+                        help="JSONL file of recorded responses keyed by prompt hash")
+    parser.add_argument("--upstream", default=None,
+                        help="Record mode: forward unknown prompts to this API (e.g. https://api.openai.com/v1) and store the answers")
+    parser.add_argument("--fallback-content", default=None,
+                        help="Content returned for prompts without a recording (default: 404)")
+    parser.add_argument("--latency", default="0",
+                        help='Latency distribution: "fixed:S", "uniform:LOW,HIGH", "normal:MEAN,SD", "lognormal:MU,SIGMA"')
+    parser.add_argument("--replay-latency", action="store_true",
+                        help="Use each recording's upstream latency instead of --latency")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--rate-malformed", type=float, default=0.0,
+                        help="Share of responses with truncated (invalid) content")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    try:
+        # Draw once so a spec missing its values (e.g. "fixed:") fails here, not on every request
+        parse_latency(args.latency)()
+    except (ValueError, IndexError) as e:
+        parser.error(f"Invalid --latency {args.latency!r}: {e}")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    server = ThreadingHTTPServer((args.host, args.port), ReplayHandler)
+    server.daemon_threads = True
+    server.replay_state = ReplayState(args)
+    server.verbose = args.verbose
+    print(f"🔁 Replay server on http://{args.host}:{args.port}/v1 "
+          f"(latency {args.latency}, 429 rate {args.rate_429}, malformed rate {args.rate_malformed})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 {json.dumps(server.replay_state.counters)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -139,8 +139,10 @@ class ValidationNode:
                 
                 df1 = pd.DataFrame(excel_data, columns=["Liability", "Asset"])
                 
-                # Read LLM output
-                df2 = pd.read_csv(llm_output_path)
+                # Use the in-memory LLM output when available, otherwise read it back
+                df2 = state["excel_outputs"].get("combined_df")
+                if df2 is None:
+                    df2 = pd.read_csv(llm_output_path)
                 
                 # Extract and hash
                 hash1, concat1 = self.hash_columns(df1, ["Liability", "Asset"])
@@ -152,7 +154,9 @@ class ValidationNode:
                 table_path = state.get("msg_outputs", {}).get("table_output")
                 if docint_df is not None and table_path:
                     df1 = docint_df
-                    df2 = pd.read_csv(table_path)
+                    df2 = state["msg_outputs"].get("table_df")
+                    if df2 is None:
+                        df2 = pd.read_csv(table_path)
                     hash1, concat1 = self.hash_columns(df1, ["Liability", "Asset"])
                     hash2, concat2 = self.hash_columns(df2, ["RIDER_VALUE", "ASSET_VALUE"])
                     match = (hash1 == hash2)
@@ -0,0 +1,146 @@
+import io
+from PIL import Image, ImageChops
+
+# Leading bytes of the image formats Document Intelligence accepts
+MAGIC_TYPES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"BM", "image/bmp"),
+)
+
+
+def detect_content_type(data, default="application/octet-stream"):
+    """Get the MIME type of encoded image bytes from their magic number."""
+    for magic, content_type in MAGIC_TYPES:
+        if data.startswith(magic):
+            return content_type
+    return default
+
+
+class AzurePayloadOptimizer:
+    """
+    Shrink table screenshots before they are uploaded to Document Intelligence.
+
+    The image is cropped to its content (uniform background margins are trimmed;
+    the highlights text above the table is kept, since it is read from the same
+    analysis), capped in size and re-encoded: PNG and other lossless sources as an optimised
+    PNG, JPEG sources as JPEG. The re-encoded image is only sent when it is smaller
+    than the original; the content type always matches the bytes that are sent.
+    """
+
+    def __init__(self, enabled=True, trim_margins=True, margin_padding=8, max_side=4000, dpi=150, jpeg_quality=95):
+        """
+        Args:
+            enabled: Preprocess images; when off the original bytes are sent as-is
+            trim_margins: Crop uniform background borders around the content
+            margin_padding: Background kept around the content, in pixels
+            max_side: Longer image sides are downscaled to this, in pixels
+            dpi: Resolution written to the re-encoded image
+            jpeg_quality: Quality used when a cropped JPEG source is re-encoded
+        """
+        self.enabled = enabled
+        self.trim_margins = trim_margins
+        self.margin_padding = margin_padding
+        self.max_side = max_side
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality
+
+    @classmethod
+    def from_config(cls, processing_config):
+        """Build the optimizer from the processing.azure_payload config section."""
+        settings = processing_config.get("azure_payload", {})
+        return cls(
+            enabled=settings.get("enabled", True),
+            trim_margins=settings.get("trim_margins", True),
+            margin_padding=settings.get("margin_padding", 8),
+            max_side=settings.get("max_side", 4000),
+            dpi=settings.get("dpi", 150),
+            jpeg_quality=settings.get("jpeg_quality", 95)
+        )
+
+    def signature(self):
+        """Settings that change the uploaded image, for the layout cache key."""
+        if not self.enabled:
+            return "raw"
+        return (f"trim={int(self.trim_margins)}:{self.margin_padding},"
+                f"max={self.max_side},"
+                f"jpeg={self.jpeg_quality}")
+
+    def content_box(self, image):
+        """
+        Get the (left, top, right, bottom) region worth sending.
+
+        Args:
+            image: Decoded image
+
+        Returns:
+            Crop box within the image
+        """
+        width, height = image.size
+        left, top, right, bottom = 0, 0, width, height
+        if self.trim_margins:
+            rgb = image.convert("RGB")
+            # The top-left pixel is the screenshot background
+            background = Image.new("RGB", rgb.size, rgb.getpixel((0, 0)))
+            bbox = ImageChops.difference(rgb, background).getbbox()
+            if bbox:
+                pad = self.margin_padding
+                left, top = max(0, bbox[0] - pad), max(0, bbox[1] - pad)
+                right, bottom = min(width, bbox[2] + pad), min(height, bbox[3] + pad)
+        return left, top, right, bottom
+
+    def prepare(self, attachment):
+        """
+        Get the bytes and content type to upload for an attachment.
+
+        Args:
+            attachment: AttachmentBuffer of the table screenshot
+
+        Returns:
+            Tuple of (image bytes, MIME type)
+        """
+        original = attachment.data
+        original_type = detect_content_type(original, "image/png")
+        if not self.enabled:
+            return original, original_type
+        jpeg = original_type == "image/jpeg"
+        try:
+            image = attachment.image()
+            box = self.content_box(image)
+            changed = box != (0, 0) + image.size
+            if jpeg and not changed and max(image.size) <= self.max_side:
+                # Re-encoding an untouched JPEG only adds a generation of loss
+                return original, original_type
+            prepared = image.crop(box) if changed else image
+            if prepared.mode not in ("RGB", "L"):
+                # Flatten transparency onto white so the text keeps its contrast
+                rgba = prepared.convert("RGBA")
+                prepared = Image.new("RGB", rgba.size, (255, 255, 255))
+                prepared.paste(rgba, mask=rgba.getchannel("A"))
+            longest = max(prepared.size)
+            if longest > self.max_side:
+                scale = self.max_side / longest
+                prepared = prepared.resize(
+                    (max(1, int(prepared.width * scale)), max(1, int(prepared.height * scale))),
+                    Image.LANCZOS
+                )
+            buffer = io.BytesIO()
+            if jpeg:
+                # Photographic sources stay JPEG; a lossless PNG of them is often several times larger
+                prepared.save(buffer, format="JPEG", quality=self.jpeg_quality, optimize=True,
+                              dpi=(self.dpi, self.dpi))
+                content_type = "image/jpeg"
+            else:
+                prepared.save(buffer, format="PNG", optimize=True, dpi=(self.dpi, self.dpi))
+                content_type = "image/png"
+            encoded = buffer.getvalue()
+        except Exception as e:
+            print(f"[DEBUG] Azure payload preprocessing failed for {attachment.name}: {e}")
+            return original, original_type
+        if len(encoded) >= len(original):
+            return original, original_type
+        print(f"[DEBUG] Azure payload for {attachment.name}: {len(original)} -> {len(encoded)} bytes "
+              f"({image.width}x{image.height} -> {prepared.width}x{prepared.height})")
+        return encoded, content_type
@@ -31,24 +31,38 @@ class ExcelProcessor:
             df_clean = df_clean.iloc[1:].reset_index(drop=True)
         return df_clean
 
+    @staticmethod
+    def extract_product_and_date_from_title(title_text):
+        """
+        Extract product type and valuation date from a "... Total Dynamic Hedge ... as of" title.
+        Also used on OCR text of MSG table images. Returns None if the text is not a title.
+        """
+        if "Total Dynamic Hedge" not in title_text or "as of" not in title_text:
+            return None
+        # Extract valuation date
+        date_match = re.search(r"as of (\d{2}/\d{2}/\d{4})", title_text)
+        valuation_date = ""
+        if date_match:
+            raw_date = date_match.group(1)
+            try:
+                valuation_date = datetime.strptime(raw_date, "%m/%d/%Y").strftime("%Y%m%d")
+            except ValueError:
+                # Not a real date (e.g. OCR noise such as 05/61/2024)
+                pass
+        # Extract product type (e.g., WB, DBIB, etc.)
+        product_match = re.search(r"([A-Z]+) Total Dynamic Hedge", title_text)
+        product_type = product_match.group(1) if product_match else ""
+        return product_type, valuation_date
+
     def wb_dbib_extract_product_and_date_from_anywhere(self, df_clean):
         """Extract product type and valuation date from anywhere in the DataFrame."""
         # Flatten the DataFrame to a list of strings
         for row in df_clean.itertuples(index=False):
             for cell in row:
-                if isinstance(cell, str) and "Total Dynamic Hedge" in cell and "as of" in cell:
-                    title_text = cell
-                    # Extract valuation date
-                    date_match = re.search(r"as of (\d{2}/\d{2}/\d{4})", title_text)
-                    if date_match:
-                        raw_date = date_match.group(1)
-                        valuation_date = datetime.strptime(raw_date, "%m/%d/%Y").strftime("%Y%m%d")
-                    else:
-                        valuation_date = ""
-                    # Extract product type (e.g., WB, DBIB, etc.)
-                    product_match = re.search(r"([A-Z]+) Total Dynamic Hedge", title_text)
-                    product_type = product_match.group(1) if product_match else ""
-                    return product_type, valuation_date
+                if isinstance(cell, str):
+                    title = self.extract_product_and_date_from_title(cell)
+                    if title is not None:
+                        return title
         # If not found, return empty strings
         return "", ""
 
@@ -1,22 +1,30 @@
 import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
-import os
-import extract_msg
-from PIL import Image
-import pytesseract
-import tempfile
-import uuid
-import io
+import asyncio
+import threading
+from types import SimpleNamespace
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
-from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
-import pandas as pd
+try:
+    import aiohttp  # noqa: F401  (transport of the async Azure client)
+    from azure.ai.documentintelligence.aio import DocumentIntelligenceClient as AsyncDocumentIntelligenceClient
+except ImportError:  # aiohttp missing: Azure calls stay synchronous
+    AsyncDocumentIntelligenceClient = None
 
 # Tesseract OCR setup - now handled by ConfigManager
 
 # Azure Document Intelligence config (loaded from config manager)
 from src.utils.config_manager import ConfigManager
+from src.utils.table_grid import select_table
+from src.processors.table_color_classifier import TableColorClassifier
+from src.processors.target_image_detector import TargetImageDetector
+from src.processors.azure_payload import AzurePayloadOptimizer
+from src.utils.attachment_buffer import AttachmentBuffer
+from src.utils.parsed_message import ParsedMessage
+from src.utils.ocr_service import get_ocr_service
+from src.utils.disk_cache import get_azure_cache
+from src.utils.async_bridge import dispatch_available, run_on_dispatch_loop, register_dispatch_closer
 
 class MsgProcessor:
     def __init__(self):
@@ -38,42 +46,161 @@ class MsgProcessor:
             endpoint=self.azure_endpoint, 
             credential=AzureKeyCredential(self.azure_key)
         )
+        # Analyze results by image hash and model, so reruns skip the Azure call
+        self.azure_cache = get_azure_cache()
+        # Concurrent files share the dispatch loop; this caps analyses in flight there
+        self.azure_max_concurrency = self.config_manager.get_azure_max_concurrency()
+        self._azure_lock = threading.Lock()
+        self._azure_semaphore = None
+        self._async_azure_client = None
+        self._azure_loop = None
+        
+        # Local header-colour classifier; the vision model is only asked when it is unsure
+        processing_config = self.config_manager.config.get("processing", {})
+        self.color_classifier = TableColorClassifier() if processing_config.get("local_color_classifier", True) else None
+        self.color_confidence_threshold = processing_config.get("color_confidence_threshold", 0.85)
+        # Staged target detection: size filter and title-band OCR before any full-page OCR
+        self.target_detector = TargetImageDetector.from_config(processing_config)
+        # Cropped, re-encoded uploads with the content type of the bytes actually sent
+        self.payload_optimizer = AzurePayloadOptimizer.from_config(processing_config)
 
     def parse_msg_attachments(self, msg_path):
-        msg = extract_msg.Message(msg_path)
-        attachments = []
-        for att in msg.attachments:
-            # Sanitize filename and handle missing/invalid names
-            filename = att.longFilename or att.shortFilename or f"attachment_{uuid.uuid4().hex}"
-            filename = filename.replace('\x00', '').replace('\0', '')
-            if not filename.strip():
-                filename = f"attachment_{uuid.uuid4().hex}"
-            # Only process image files (.png, .jpg, .jpeg)
-            if not filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                continue
-            att_path = os.path.join(tempfile.gettempdir(), filename)
-            with open(att_path, 'wb') as f:
-                f.write(att.data)
-            attachments.append(att_path)
-        return attachments
-
-    def run_tesseract_ocr(self, image_path):
-        image = Image.open(image_path)
-        text = pytesseract.image_to_string(image)
-        return text
+        # Kept in memory: no temp files to collide between concurrent workers
+        with ParsedMessage(msg_path) as message:
+            return message.attachments
+
+    def run_tesseract_ocr(self, attachment):
+        # Persistent engines with the language data loaded, not a tesseract process per image
+        return get_ocr_service().image_to_string(attachment.image())
+
+    def is_target_image_full_ocr(self, attachment):
+        """Full-page OCR check, used only when the title band was inconclusive."""
+        return self.is_target_image(self.run_tesseract_ocr(attachment))
 
     def is_target_image(self, ocr_text):
         # Use the same logic as msg_file_process.py for blue table detection
         return "Total Dynamic Hedge P&L as of" in ocr_text
 
-    def azure_ocr_func(self, image_path):
-        # Read image data
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-        poller = self.azure_client.begin_analyze_document(
-            self.azure_model, image_data, content_type="image/png"
+    @staticmethod
+    def _compact_layout(result):
+        """Keep only the parts of an analyze result the table extraction reads."""
+        return {
+            "content": getattr(result, "content", None) or "",
+            "tables": [
+                {
+                    "row_count": table.row_count,
+                    "column_count": table.column_count,
+                    "cells": [[cell.row_index, cell.column_index, cell.content] for cell in table.cells]
+                }
+                for table in (getattr(result, "tables", None) or [])
+            ]
+        }
+
+    @staticmethod
+    def _layout_from_compact(layout):
+        """Rebuild an object with the analyze result attributes from its compact form."""
+        tables = [
+            SimpleNamespace(
+                row_count=table["row_count"],
+                column_count=table["column_count"],
+                cells=[SimpleNamespace(row_index=row, column_index=column, content=content)
+                       for row, column, content in table["cells"]]
+            )
+            for table in layout["tables"]
+        ]
+        return SimpleNamespace(content=layout["content"], tables=tables)
+
+    def analyze_layout(self, attachment):
+        """
+        Run Azure Document Intelligence on an image, using the persistent result cache.
+
+        Args:
+            attachment: AttachmentBuffer of the image
+
+        Returns:
+            Object with content and tables (row_count, column_count, cells)
+        """
+        # Keyed by the original image, so cache hits skip the preprocessing too
+        cache_key = self.azure_cache.make_key(
+            attachment.sha256, self.azure_model, self.payload_optimizer.signature()
         )
-        result = poller.result()
+        cached = self.azure_cache.get(cache_key)
+        if cached is not None:
+            print(f"[DEBUG] Azure layout cache hit ({self.azure_model})")
+            return self._layout_from_compact(cached)
+
+        image_data, content_type = self.payload_optimizer.prepare(attachment)
+        if dispatch_available() and AsyncDocumentIntelligenceClient is not None:
+            # Concurrent batch mode: the worker lends its file slot to another file while this runs
+            layout = run_on_dispatch_loop(self.analyze_layout_async(image_data, content_type))
+        else:
+            poller = self.azure_client.begin_analyze_document(
+                self.azure_model, image_data, content_type=content_type
+            )
+            layout = self._compact_layout(poller.result())
+        self.azure_cache.put(cache_key, layout)
+        return self._layout_from_compact(layout)
+
+    def _azure_binding(self):
+        """
+        Get the async client and the semaphore of the running loop, creating them on first use there.
+
+        Returns:
+            Tuple of (client, semaphore bounding concurrent analyses)
+        """
+        loop = asyncio.get_running_loop()
+        with self._azure_lock:
+            if self._azure_loop is not loop:
+                # One client (and aiohttp session) per loop, closed when the dispatch loop is released
+                client = AsyncDocumentIntelligenceClient(
+                    endpoint=self.azure_endpoint,
+                    credential=AzureKeyCredential(self.azure_key)
+                )
+                self._async_azure_client = client
+                self._azure_semaphore = asyncio.Semaphore(self.azure_max_concurrency)
+                self._azure_loop = loop
+
+                async def close_client():
+                    # Analyses hold their own reference; only unbind if nothing rebound since
+                    with self._azure_lock:
+                        if self._async_azure_client is client:
+                            self._async_azure_client = None
+                            self._azure_semaphore = None
+                            self._azure_loop = None
+                    await client.close()
+
+                register_dispatch_closer(close_client)
+            return self._async_azure_client, self._azure_semaphore
+
+    async def analyze_layout_async(self, image_data, content_type="image/png"):
+        """
+        Analyze an image with the async Document Intelligence client.
+
+        Args:
+            image_data: Encoded image bytes
+            content_type: MIME type of image_data
+
+        Returns:
+            Compact layout dictionary (see _compact_layout)
+        """
+        client, slots = self._azure_binding()
+        async with slots:
+            poller = await client.begin_analyze_document(
+                self.azure_model, image_data, content_type=content_type
+            )
+            result = await poller.result()
+        return self._compact_layout(result)
+
+    def azure_ocr_func(self, image):
+        # Attachment buffer, raw image bytes or an image path
+        if isinstance(image, AttachmentBuffer):
+            attachment = image
+        elif isinstance(image, (bytes, bytearray)):
+            attachment = AttachmentBuffer("image", bytes(image))
+        else:
+            with open(image, "rb") as f:
+                attachment = AttachmentBuffer(os.path.basename(image), f.read())
+        result = self.analyze_layout(attachment)
         
         # Extract full text content from the image (for highlights)
         full_text_content = ""
@@ -93,102 +220,67 @@ class MsgProcessor:
         
         # Smart table selection instead of always taking tables[0]
         table_text = ""
+        prompt_text = ""
+        table_grid = []
         if hasattr(result, 'tables') and result.tables:
-            target_table = None
-            
             print(f"[DEBUG] Azure OCR found {len(result.tables)} tables")
-            
-            # Strategy 1: Look for table with P&L characteristics
-            for i, table in enumerate(result.tables):
-                # Extract table content to analyze
-                table_data = [[None for _ in range(table.column_count)] for _ in range(table.row_count)]
-                for cell in table.cells:
-                    table_data[cell.row_index][cell.column_index] = cell.content
-                
-                # Convert to string to check content
-                table_content = '\n'.join(['\t'.join([str(cell) if cell else '' for cell in row]) for row in table_data])
-                table_content_lower = table_content.lower()
-                
-                print(f"[DEBUG] Table {i}: {table.row_count}x{table.column_count}, preview: {table_content[:100]}...")
-                
-                # Look for P&L table indicators (in order of priority)
-                score = 0
-                
-                # High priority indicators
-                if 'liability' in table_content_lower and 'asset' in table_content_lower:
-                    score += 100
-                    print(f"[DEBUG] Table {i}: Found Liability+Asset columns (+100)")
-                elif 'rider' in table_content_lower and 'asset' in table_content_lower:
-                    score += 90
-                    print(f"[DEBUG] Table {i}: Found Rider+Asset columns (+90)")
-                
-                # Medium priority indicators
-                if 'p&l' in table_content_lower or 'p&amp;l' in table_content_lower:
-                    score += 50
-                    print(f"[DEBUG] Table {i}: Found P&L reference (+50)")
-                
-                if any(keyword in table_content_lower for keyword in ['equity', 'interest rate', 'credit']):
-                    score += 30
-                    print(f"[DEBUG] Table {i}: Found risk categories (+30)")
-                
-                # Size-based scoring (P&L tables are typically larger)
-                if table.row_count >= 10:
-                    score += 20
-                    print(f"[DEBUG] Table {i}: Large table {table.row_count} rows (+20)")
-                
-                if table.column_count >= 4:
-                    score += 10
-                    print(f"[DEBUG] Table {i}: Wide table {table.column_count} cols (+10)")
-                
-                print(f"[DEBUG] Table {i} total score: {score}")
-                
-                # Select table with highest score
-                if target_table is None or score > target_table[1]:
-                    target_table = (table, score, i)
-            
-            # Use the best table found
-            if target_table is not None:
-                best_table, best_score, best_index = target_table
-                print(f"[DEBUG] Selected table {best_index} with score {best_score}")
-                
-                # Extract the selected table
-                table_data = [[None for _ in range(best_table.column_count)] for _ in range(best_table.row_count)]
-                for cell in best_table.cells:
-                    table_data[cell.row_index][cell.column_index] = cell.content
-                df = pd.DataFrame(table_data)
-                table_text = df.to_string(index=False)
-            else:
-                print("[DEBUG] No suitable table found, using first table as fallback")
-                if result.tables:
-                    table = result.tables[0]
-                    table_data = [[None for _ in range(table.column_count)] for _ in range(table.row_count)]
-                    for cell in table.cells:
-                        table_data[cell.row_index][cell.column_index] = cell.content
-                    df = pd.DataFrame(table_data)
-                    table_text = df.to_string(index=False)
+            # Each grid is built once; only the selected one is rendered
+            best = select_table(result.tables)
+            table_text = best.text
+            prompt_text = best.prompt_text
+            table_grid = best.cells
         
-        # Return both table and full text content
+        # Return both table and full text content; prompt_text is the compact
+        # rendering for the LLM, table_text the padded one used for validation,
+        # table_grid the cell contents for the mapping rules
         return {
             'table_text': table_text,
+            'prompt_text': prompt_text,
+            'table_grid': table_grid,
             'full_text': full_text_content
         }
 
-    def process_msg(self, msg_path, llm_vision_func):
-        attachments = self.parse_msg_attachments(msg_path)
-        for att_path in attachments:
+    def classify_table_type(self, attachment, llm_vision_func):
+        """Classify a table image as blue or red, locally when the header colour is clear."""
+        if self.color_classifier is not None:
+            try:
+                label, confidence = self.color_classifier.classify(attachment.image())
+                print(f"[DEBUG] Local colour classifier: {label} (confidence {confidence:.2f})")
+                if label != "unknown" and confidence >= self.color_confidence_threshold:
+                    return label
+            except Exception as e:
+                print(f"[DEBUG] Local colour classifier failed: {e}")
+        return llm_vision_func(attachment.data)
+
+    def process_msg(self, message, llm_vision_func):
+        """
+        Find the P&L table image of a message and extract it.
+
+        Args:
+            message: ParsedMessage (shared with the highlights step) or a .msg path
+            llm_vision_func: Vision model fallback for the table type
+
+        Returns:
+            OCR result dictionary, or None when no target image was found
+        """
+        if isinstance(message, ParsedMessage):
+            attachments = message.attachments
+        else:
+            attachments = self.parse_msg_attachments(message)
+        for attachment in self.target_detector.find_targets(attachments, self.is_target_image_full_ocr):
             try:
-                ocr_text = self.run_tesseract_ocr(att_path)
-                if self.is_target_image(ocr_text):
-                    # Classify with LLM vision model
-                    table_type = llm_vision_func(att_path)
-                    # Extract table and full text with Azure OCR
-                    azure_result = self.azure_ocr_func(att_path)
-                    return {
-                        "image_path": att_path,
-                        "table_type": table_type,  # 'blue' or 'red'
-                        "table_text": azure_result['table_text'],
-                        "full_text": azure_result['full_text']
-                    }
+                # Classify by header colour, falling back to the LLM vision model
+                table_type = self.classify_table_type(attachment, llm_vision_func)
+                # Extract table and full text with Azure OCR
+                azure_result = self.azure_ocr_func(attachment)
+                return {
+                    "image_name": attachment.name,
+                    "table_type": table_type,  # 'blue' or 'red'
+                    "table_text": azure_result['table_text'],
+                    "prompt_text": azure_result['prompt_text'],
+                    "table_grid": azure_result['table_grid'],
+                    "full_text": azure_result['full_text']
+                }
             except Exception as e:
-                print(f"Error processing attachment {att_path}: {e}")
+                print(f"Error processing attachment {attachment.name}: {e}")
         return None 
\ No newline at end of file
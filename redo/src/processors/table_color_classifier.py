@@ -0,0 +1,71 @@
+import io
+import numpy as np
+from PIL import Image
+
+# Hue ranges on PIL's 0-255 HSV scale (degrees * 255 / 360)
+BLUE_HUES = (128, 185)       # ~180-260 degrees
+RED_HUES = ((0, 15), (240, 255))  # ~0-20 and ~340-360 degrees
+
+
+class TableColorClassifier:
+    """
+    Tell blue report tables from red ones by the hue of their header fill, locally.
+
+    The header band is the first run of pixel rows that are mostly saturated colour;
+    if the image has none, the top part of the image is used instead.
+    """
+
+    def __init__(self, min_saturation=90, min_value=50, row_fill=0.3, header_fraction=0.25, min_pixels=200):
+        """
+        Args:
+            min_saturation: Minimum HSV saturation (0-255) for a pixel to count as coloured
+            min_value: Minimum HSV value (0-255), so near-black text is ignored
+            row_fill: Fraction of coloured pixels that makes a pixel row part of the header band
+            header_fraction: Top share of the image used when no header band is found
+            min_pixels: Fewer blue+red pixels than this gives an 'unknown' result
+        """
+        self.min_saturation = min_saturation
+        self.min_value = min_value
+        self.row_fill = row_fill
+        self.header_fraction = header_fraction
+        self.min_pixels = min_pixels
+
+    def _header_band(self, colored):
+        filled_rows = np.flatnonzero(colored.mean(axis=1) >= self.row_fill)
+        if filled_rows.size == 0:
+            return slice(0, max(1, int(colored.shape[0] * self.header_fraction)))
+        # First contiguous run of filled rows
+        gaps = np.flatnonzero(np.diff(filled_rows) > 1)
+        end = filled_rows[gaps[0]] if gaps.size else filled_rows[-1]
+        return slice(filled_rows[0], end + 1)
+
+    def classify(self, image):
+        """
+        Classify a table image as blue or red.
+
+        Args:
+            image: PIL image, encoded image bytes, or an image path
+
+        Returns:
+            Tuple of ('blue' | 'red' | 'unknown', confidence between 0 and 1)
+        """
+        if isinstance(image, (bytes, bytearray)):
+            image = Image.open(io.BytesIO(image))
+        elif not isinstance(image, Image.Image):
+            image = Image.open(image)
+
+        hsv = np.asarray(image.convert("RGB").convert("HSV"))
+        hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+        colored = (saturation >= self.min_saturation) & (value >= self.min_value)
+
+        band = self._header_band(colored)
+        hues = hue[band][colored[band]]
+        blue = int(np.count_nonzero((hues >= BLUE_HUES[0]) & (hues <= BLUE_HUES[1])))
+        red = int(sum(np.count_nonzero((hues >= low) & (hues <= high)) for low, high in RED_HUES))
+
+        total = blue + red
+        if total < self.min_pixels:
+            return "unknown", 0.0
+        label = "blue" if blue > red else "red"
+        # Share of all coloured header pixels that have the winning hue
+        return label, max(blue, red) / hues.size
@@ -0,0 +1,204 @@
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.utils.ocr_service import get_ocr_service
+
+# Characters the P&L report title can contain ("VA Rider WB Total Dynamic Hedge P&L as of 05/01/2024")
+TITLE_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789&/:.,-()"
+# Tolerant to the spacing and case noise of a downscaled OCR pass
+TITLE_PATTERN = re.compile(r"total\s*dynamic\s*hedge\s*p\s*&?\s*l\s*as\s*of", re.IGNORECASE)
+
+# Attachment names that point at (or away from) the report table
+LIKELY_NAME = re.compile(r"p&l|pnl|p_l|hedge|table|report|dynamic", re.IGNORECASE)
+UNLIKELY_NAME = re.compile(r"logo|signature|icon|banner|footer|disclaimer", re.IGNORECASE)
+
+# Shared by all detectors so concurrent MSG files together stay within the worker limit
+_ocr_executor = None
+_ocr_executor_lock = threading.Lock()
+
+
+def get_ocr_executor(workers=None):
+    """
+    Get the process-wide thread pool for attachment OCR.
+
+    Recognition runs in the OCR service's engines (or tesseract subprocesses), which
+    release the GIL, so threads are enough to keep every core busy. The OCR service
+    turns Tesseract's own OpenMP threading off to avoid oversubscribing the cores.
+    """
+    global _ocr_executor
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            workers = workers or os.cpu_count() or 1
+            _ocr_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+        return _ocr_executor
+
+
+class TargetImageDetector:
+    """
+    Find the P&L table screenshot among a message's image attachments without
+    running full-page OCR on every logo and signature.
+
+    Stage 1 rejects images by size and aspect ratio and orders the rest by how
+    likely they are to be the table (name, then area). Stage 2 OCRs only a
+    downscaled title band with a character whitelist. Full-page OCR (stage 3)
+    runs only for the candidates stage 2 did not confirm. Candidates within a
+    stage are OCR'd concurrently; the first confirmed one is returned and the
+    queued work for the rest is cancelled.
+    """
+
+    def __init__(self, min_width=300, min_height=120, min_aspect=0.3, max_aspect=8.0,
+                 title_band_fraction=0.2, title_band_min_px=60, title_max_width=1600,
+                 full_ocr_fallback=True, ocr_workers=None):
+        """
+        Args:
+            min_width: Narrower images are rejected, in pixels
+            min_height: Shorter images are rejected, in pixels
+            min_aspect: Lowest accepted width/height ratio
+            max_aspect: Highest accepted width/height ratio
+            title_band_fraction: Share of the image height OCR'd for the title
+            title_band_min_px: Minimum title band height, in pixels
+            title_max_width: Title bands wider than this are downscaled before OCR
+            full_ocr_fallback: OCR whole candidates the title pass did not confirm
+            ocr_workers: Concurrent OCR calls (defaults to the CPU count)
+        """
+        self.min_width = min_width
+        self.min_height = min_height
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.title_band_fraction = title_band_fraction
+        self.title_band_min_px = title_band_min_px
+        self.title_max_width = title_max_width
+        self.full_ocr_fallback = full_ocr_fallback
+        self.ocr_workers = ocr_workers
+
+    @classmethod
+    def from_config(cls, processing_config):
+        """Build the detector from the processing.target_detection config section."""
+        settings = processing_config.get("target_detection", {})
+        return cls(
+            min_width=settings.get("min_width", 300),
+            min_height=settings.get("min_height", 120),
+            min_aspect=settings.get("min_aspect", 0.3),
+            max_aspect=settings.get("max_aspect", 8.0),
+            title_band_fraction=settings.get("title_band_fraction", 0.2),
+            title_band_min_px=settings.get("title_band_min_px", 60),
+            title_max_width=settings.get("title_max_width", 1600),
+            full_ocr_fallback=settings.get("full_ocr_fallback", True),
+            ocr_workers=settings.get("ocr_workers")
+        )
+
+    def plausible_size(self, size):
+        """Check image dimensions against the table screenshot limits."""
+        width, height = size
+        if width < self.min_width or height < self.min_height:
+            return False
+        return self.min_aspect <= width / height <= self.max_aspect
+
+    def rank_candidates(self, attachments):
+        """
+        Drop implausible images and order the rest, most likely table first.
+
+        Only image headers are read here, not pixel data.
+
+        Args:
+            attachments: AttachmentBuffer objects
+
+        Returns:
+            List of (attachment, size) tuples
+        """
+        candidates = []
+        for attachment in attachments:
+            try:
+                size = attachment.size
+            except Exception as e:
+                print(f"[DEBUG] Skipping unreadable attachment {attachment.name}: {e}")
+                continue
+            if not self.plausible_size(size):
+                print(f"[DEBUG] Skipping {attachment.name}: {size[0]}x{size[1]} is not a table screenshot")
+                continue
+            score = math.log(size[0] * size[1])
+            if LIKELY_NAME.search(attachment.name):
+                score += 5
+            if UNLIKELY_NAME.search(attachment.name):
+                score -= 5
+            candidates.append((score, attachment, size))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return [(attachment, size) for _, attachment, size in candidates]
+
+    def title_band_text(self, attachment):
+        """
+        OCR the top band of an image, downscaled and restricted to title characters.
+        """
+        image = attachment.image()
+        width, height = image.size
+        band_height = min(height, max(self.title_band_min_px, int(height * self.title_band_fraction)))
+        band = image.crop((0, 0, width, band_height)).convert("L")
+        if width > self.title_max_width:
+            scale = self.title_max_width / width
+            band = band.resize((self.title_max_width, max(1, int(band_height * scale))))
+        variables = {"tessedit_char_whitelist": TITLE_WHITELIST, "preserve_interword_spaces": "1"}
+        return get_ocr_service().image_to_string(band, psm=6, variables=variables)
+
+    def _title_matches(self, attachment):
+        try:
+            return bool(TITLE_PATTERN.search(self.title_band_text(attachment)))
+        except Exception as e:
+            print(f"[DEBUG] Title OCR failed for {attachment.name}: {e}")
+            return False
+
+    @staticmethod
+    def _full_ocr_matches(full_ocr_check, attachment):
+        print(f"[DEBUG] Title band inconclusive, running full OCR on {attachment.name}")
+        try:
+            return bool(full_ocr_check(attachment))
+        except Exception as e:
+            print(f"[DEBUG] Full OCR failed for {attachment.name}: {e}")
+            return False
+
+    def _confirmed(self, check, attachments):
+        """
+        Run check(attachment) for all attachments concurrently and yield the matches in rank order.
+
+        A match is held back until every higher-ranked attachment has been checked, so
+        the result does not depend on OCR timing. Returns (via StopIteration) the
+        attachments that did not match. Work not yet started is cancelled when the
+        caller stops iterating, i.e. once it accepts the top-ranked confirmed match.
+        """
+        executor = get_ocr_executor(self.ocr_workers)
+        futures = [executor.submit(check, attachment) for attachment in attachments]
+        unmatched = []
+        next_rank = 0
+        try:
+            for _ in as_completed(futures):
+                # Release the leading run of finished checks, in rank order
+                while next_rank < len(futures) and futures[next_rank].done():
+                    attachment = attachments[next_rank]
+                    matched = futures[next_rank].result()
+                    next_rank += 1
+                    if matched:
+                        yield attachment
+                    else:
+                        unmatched.append(attachment)
+        finally:
+            for future in futures:
+                future.cancel()
+        return unmatched
+
+    def find_targets(self, attachments, full_ocr_check=None):
+        """
+        Yield attachments that show the P&L report title, cheapest checks first.
+
+        Args:
+            attachments: AttachmentBuffer objects of the message's images
+            full_ocr_check: Optional callable(attachment) -> bool running full-page OCR
+
+        Yields:
+            Target attachments, title-band matches before full-OCR matches
+        """
+        candidates = [attachment for attachment, _ in self.rank_candidates(attachments)]
+        unconfirmed = yield from self._confirmed(self._title_matches, candidates)
+        if not self.full_ocr_fallback or full_ocr_check is None or not unconfirmed:
+            return
+        yield from self._confirmed(lambda attachment: self._full_ocr_matches(full_ocr_check, attachment), unconfirmed)
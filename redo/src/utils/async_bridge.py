@@ -0,0 +1,119 @@
+"""
+Async Bridge Module
+Lets synchronous workflow nodes, running in worker threads, submit coroutines to the
+event loop that drives concurrent batch processing
+"""
+
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, List, Optional
+
+_dispatch_loop: Optional[asyncio.AbstractEventLoop] = None
+_dispatch_lock = threading.Lock()
+# Coroutine functions releasing clients bound to the dispatch loop, run before it is cleared
+_dispatch_closers: List[Callable[[], Awaitable[None]]] = []
+# Processing slot held by the current worker thread, lent out while it waits on the loop
+_worker_state = threading.local()
+
+
+def set_dispatch_loop(loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """
+    Register (or clear) the event loop that owns the async API clients.
+
+    Args:
+        loop: Running event loop, or None to return to fully synchronous calls
+    """
+    global _dispatch_loop
+    with _dispatch_lock:
+        _dispatch_loop = loop
+
+
+def get_dispatch_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """Get the registered dispatch loop, if any."""
+    return _dispatch_loop
+
+
+def dispatch_available() -> bool:
+    """
+    Check whether coroutines can be dispatched from the current thread.
+
+    Returns:
+        True when a dispatch loop is running in a different thread
+    """
+    loop = _dispatch_loop
+    if loop is None or not loop.is_running():
+        return False
+    try:
+        return asyncio.get_running_loop() is not loop
+    except RuntimeError:
+        # No loop in this thread: we are a worker thread
+        return True
+
+
+def run_on_dispatch_loop(coro: Awaitable[Any]) -> Any:
+    """
+    Run a coroutine on the dispatch loop and block the calling thread for its result.
+
+    Args:
+        coro: Coroutine to run
+
+    Returns:
+        The coroutine's result (exceptions are re-raised in the caller)
+    """
+    loop = _dispatch_loop
+    if loop is None:
+        raise RuntimeError("No dispatch loop registered")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    slots = getattr(_worker_state, "slots", None)
+    if slots is None:
+        return future.result()
+    # Another file can use the slot for OCR and parsing while this one waits on the service
+    slots.release()
+    try:
+        return future.result()
+    finally:
+        slots.acquire()
+
+
+@contextmanager
+def worker_slot(slots: threading.Semaphore):
+    """
+    Hold one processing slot in a worker thread for the duration of a file.
+
+    The slot bounds CPU work only: run_on_dispatch_loop releases it while the thread
+    waits for an API call and takes it back before returning.
+
+    Args:
+        slots: Semaphore sized to the number of files processed at once
+    """
+    slots.acquire()
+    _worker_state.slots = slots
+    try:
+        yield
+    finally:
+        _worker_state.slots = None
+        slots.release()
+
+
+def register_dispatch_closer(closer: Callable[[], Awaitable[None]]) -> None:
+    """
+    Register a cleanup for a client created on the dispatch loop.
+
+    Args:
+        closer: Coroutine function closing the client; awaited on the loop before it is cleared
+    """
+    with _dispatch_lock:
+        _dispatch_closers.append(closer)
+
+
+async def close_dispatch_clients() -> None:
+    """Close every client registered for the dispatch loop; call on that loop before clearing it."""
+    with _dispatch_lock:
+        closers = list(_dispatch_closers)
+        _dispatch_closers.clear()
+    for closer in closers:
+        try:
+            await closer()
+        except Exception as e:
+            print(f"[DEBUG] Closing async client failed: {e}")
@@ -0,0 +1,66 @@
+"""
+Attachment Buffer Module
+In-memory MSG image attachments shared by the OCR, colour classifier, vision and
+Azure steps, so nothing is written to temp files and pixels are decoded only for
+images that pass the cheap size checks
+"""
+
+import io
+import hashlib
+import threading
+from typing import Optional, Tuple
+
+from PIL import Image
+
+
+class AttachmentBuffer:
+    def __init__(self, name: str, data: bytes):
+        """
+        Wrap one image attachment.
+
+        Args:
+            name: Attachment filename (for logging; never used as a path)
+            data: Encoded image bytes
+        """
+        self.name = name
+        self.data = data
+        self._image = None
+        self._decoded = False
+        self._lock = threading.RLock()
+
+    def _opened(self) -> Image.Image:
+        with self._lock:
+            if self._image is None:
+                # Parses the header only; pixels are decoded by image()
+                self._image = Image.open(io.BytesIO(self.data))
+            return self._image
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Image (width, height) from the header, without decoding pixels."""
+        return self._opened().size
+
+    @property
+    def format(self) -> Optional[str]:
+        """Image format from the header (e.g. 'PNG', 'JPEG')."""
+        return self._opened().format
+
+    def image(self) -> Image.Image:
+        """
+        Decoded image, shared by all consumers.
+
+        Callers must not modify it in place; crop/convert/resize return copies.
+        """
+        with self._lock:
+            image = self._opened()
+            if not self._decoded:
+                image.load()
+                self._decoded = True
+            return image
+
+    @property
+    def sha256(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+    def __repr__(self) -> str:
+        return f"AttachmentBuffer({self.name!r})"
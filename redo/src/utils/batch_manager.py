@@ -0,0 +1,176 @@
+"""
+Batch Manager Module
+Submits deferred LLM prompts as one OpenAI Batch API job and collects the results
+back into the LLM response cache
+"""
+
+import os
+import json
+import glob
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from src.utils.llm_client import get_llm_client
+
+
+class BatchManager:
+    def __init__(self, batch_dir: str = "data/batch"):
+        """
+        Initialize batch manager.
+
+        Args:
+            batch_dir: Directory for batch input files, results and manifests
+        """
+        self.batch_dir = batch_dir
+        os.makedirs(self.batch_dir, exist_ok=True)
+        self.llm_client = get_llm_client()
+        self.client = self.llm_client.client
+
+    def _manifest_path(self, batch_id: str) -> str:
+        return os.path.join(self.batch_dir, f"{batch_id}.json")
+
+    def _save_manifest(self, manifest: Dict[str, Any]) -> None:
+        with open(self._manifest_path(manifest["batch_id"]), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def load_manifest(self, batch_id: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Load a batch manifest.
+
+        Args:
+            batch_id: Batch to load; defaults to the most recently submitted batch
+
+        Returns:
+            Manifest dictionary, or None if no batch was found
+        """
+        if batch_id:
+            path = self._manifest_path(batch_id)
+            if not os.path.exists(path):
+                print(f"No manifest found for batch {batch_id}")
+                return None
+        else:
+            manifests = sorted(glob.glob(os.path.join(self.batch_dir, "*.json")), key=os.path.getmtime)
+            if not manifests:
+                print(f"No batch manifests found in {self.batch_dir}")
+                return None
+            path = manifests[-1]
+
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def submit(self, requests: List[Dict[str, Any]], files: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Write requests to one JSONL file, upload it and create a batch job.
+
+        Args:
+            requests: Batch API request lines (custom_id, method, url, body)
+            files: Per-file resume information (file_path plus any saved OCR result)
+
+        Returns:
+            Batch id, or None if there was nothing to submit
+        """
+        if not self.llm_client.cache.enabled:
+            print("Batch mode needs the LLM response cache; enable it in config (and drop --no-cache)")
+            return None
+
+        # Identical prompts (same cache key) only need to be sent once
+        unique_requests = {}
+        for request in requests:
+            unique_requests.setdefault(request["custom_id"], request)
+
+        if not unique_requests:
+            print("No uncached prompts to submit")
+            return None
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        input_path = os.path.join(self.batch_dir, f"batch_input_{timestamp}.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for request in unique_requests.values():
+                f.write(json.dumps(request) + "\n")
+        print(f"[DEBUG] Wrote {len(unique_requests)} batch requests to {input_path}")
+
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+
+        self._save_manifest({
+            "batch_id": batch.id,
+            "status": batch.status,
+            "submitted_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "input_file": input_path,
+            "input_file_id": input_file.id,
+            "request_count": len(unique_requests),
+            "files": files
+        })
+        return batch.id
+
+    def collect(self, batch_id: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Download a finished batch and write every response into the LLM response cache.
+
+        Args:
+            batch_id: Batch to collect; defaults to the most recently submitted batch
+
+        Returns:
+            Manifest of the collected batch, or None if it is not ready
+        """
+        # Results are handed to the pipeline through the cache, so there is nothing to collect into
+        if not self.llm_client.cache.enabled:
+            print("Batch mode needs the LLM response cache; enable it in config (and drop --no-cache)")
+            return None
+
+        manifest = self.load_manifest(batch_id)
+        if manifest is None:
+            return None
+
+        batch = self.client.batches.retrieve(manifest["batch_id"])
+        manifest["status"] = batch.status
+        self._save_manifest(manifest)
+
+        if batch.status != "completed":
+            counts = getattr(batch, "request_counts", None)
+            progress = f" ({counts.completed}/{counts.total} done)" if counts else ""
+            print(f"Batch {batch.id} is {batch.status}{progress}; try again later")
+            return None
+
+        cache = self.llm_client.cache
+
+        stored = 0
+        failed = 0
+        output_text = self.client.files.content(batch.output_file_id).text if batch.output_file_id else ""
+        output_path = os.path.join(self.batch_dir, f"batch_output_{batch.id}.jsonl")
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(output_text)
+
+        for line in output_text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                failed += 1
+                print(f"[DEBUG] Batch request {result.get('custom_id')} failed: {result.get('error')}")
+                continue
+            body = response["body"]
+            cache.put(result["custom_id"], {
+                "content": body["choices"][0]["message"]["content"].strip(),
+                "model": body.get("model"),
+                "batch_id": batch.id
+            })
+            stored += 1
+
+        if batch.error_file_id:
+            failed_lines = self.client.files.content(batch.error_file_id).text.splitlines()
+            failed += len([line for line in failed_lines if line.strip()])
+
+        print(f"Collected batch {batch.id}: {stored} responses cached, {failed} failed")
+        manifest["status"] = "collected"
+        manifest["collected_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        manifest["responses_cached"] = stored
+        manifest["responses_failed"] = failed
+        self._save_manifest(manifest)
+        return manifest
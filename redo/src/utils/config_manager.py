@@ -41,6 +41,27 @@ class ConfigManager:
     def get_openai_config(self):
         return self.secrets.get("openai", {})
     
+    def get_cache_config(self):
+        """Get persistent cache settings from config."""
+        return self.config.get("cache", {})
+    
+    def get_llm_config(self):
+        """Get LLM request settings from config."""
+        return self.config.get("llm", {})
+    
+    def get_rate_limit_config(self):
+        """Get shared OpenAI quota and retry settings from config."""
+        return self.config.get("rate_limit", {})
+    
+    def get_max_parallel_files(self):
+        """Get how many files batch modes process at once."""
+        return self.config.get("processing", {}).get("max_parallel_files", 1)
+    
+    def get_azure_max_concurrency(self):
+        """Get how many Azure analyses may be in flight at once (never fewer than parallel files)."""
+        configured = self.config.get("processing", {}).get("azure_max_concurrency", 4)
+        return max(configured, self.get_max_parallel_files())
+    
     def get_supported_extensions(self):
         """Get supported file extensions from config."""
         return self.config.get("processing", {}).get("supported_extensions", [".xlsx", ".xls", ".msg"])
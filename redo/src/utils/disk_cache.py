@@ -0,0 +1,213 @@
+"""
+Disk Cache Module
+Persistent, content-addressed JSON cache with a size cap and LRU eviction
+"""
+
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class DiskCache:
+    def __init__(self, cache_dir: str, max_size_mb: float = 256, enabled: bool = True, name: str = "cache"):
+        """
+        Initialize disk cache.
+
+        Args:
+            cache_dir: Directory holding the cache entries
+            max_size_mb: Size cap in megabytes; least recently used entries are evicted above it
+            enabled: When False, every lookup misses and nothing is written
+            name: Label used in debug output and statistics
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._size_bytes = None
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        Build a content-addressed key from arbitrary JSON-serializable parts.
+
+        Args:
+            parts: Values that together identify the cached item
+
+        Returns:
+            SHA-256 hex digest of the parts
+        """
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        # Shard by the first two hex characters to keep directories small
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a cached value.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            Cached value, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Touch the entry so eviction treats it as recently used
+            os.utime(path, None)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry.get("value")
+
+    def contains(self, key: str) -> bool:
+        """
+        Check for an entry without touching it or counting a hit/miss.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            True if the entry exists
+        """
+        return self.enabled and self._entry_path(key).exists()
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Store a value, evicting least recently used entries if over the size cap.
+
+        Args:
+            key: Cache key from make_key
+            value: JSON-serializable value
+        """
+        if not self.enabled:
+            return
+
+        path = self._entry_path(key)
+        size_before = self._current_size()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            previous_size = path.stat().st_size if path.exists() else 0
+            data = json.dumps({"key": key, "created": time.time(), "value": value}, default=str)
+            # Write to a temp file and rename so concurrent readers never see partial entries
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Failed to write {self.name} entry: {e}")
+            return
+
+        self._size_bytes = size_before - previous_size + len(data.encode("utf-8"))
+        if self._size_bytes > self.max_size_bytes:
+            self._evict()
+
+    def _iter_entries(self):
+        if not self.cache_dir.exists():
+            return
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            yield path, stat
+
+    def _current_size(self) -> int:
+        if self._size_bytes is None:
+            self._size_bytes = sum(stat.st_size for _, stat in self._iter_entries())
+        return self._size_bytes
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache is back under 90% of its cap."""
+        entries = sorted(self._iter_entries(), key=lambda item: item[1].st_mtime)
+        total = sum(stat.st_size for _, stat in entries)
+        target = int(self.max_size_bytes * 0.9)
+        removed = 0
+
+        for path, stat in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= stat.st_size
+                removed += 1
+            except OSError:
+                continue
+
+        self._size_bytes = total
+        if removed:
+            print(f"[DEBUG] {self.name}: evicted {removed} least recently used entries")
+
+    def clear(self) -> None:
+        """Delete every cache entry."""
+        for path, _ in list(self._iter_entries()):
+            try:
+                path.unlink()
+            except OSError:
+                continue
+        self._size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss statistics.
+
+        Returns:
+            Dictionary with hits, misses and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "enabled": self.enabled
+        }
+
+
+# Global instance for the LLM response cache
+_response_cache = None
+
+def get_response_cache() -> DiskCache:
+    """Get global LLM response cache instance."""
+    global _response_cache
+    if _response_cache is None:
+        from src.utils.config_manager import config_manager
+        cache_config = config_manager.get_cache_config()
+        _response_cache = DiskCache(
+            cache_config.get("llm_cache_dir", ".cache/llm_responses"),
+            max_size_mb=cache_config.get("llm_cache_max_mb", 256),
+            enabled=cache_config.get("enabled", True),
+            name="LLM response cache"
+        )
+    return _response_cache
+
+
+# Global instance for the Azure Document Intelligence result cache
+_azure_cache = None
+
+def get_azure_cache() -> DiskCache:
+    """Get global Azure analyze result cache instance."""
+    global _azure_cache
+    if _azure_cache is None:
+        from src.utils.config_manager import config_manager
+        cache_config = config_manager.get_cache_config()
+        _azure_cache = DiskCache(
+            cache_config.get("azure_cache_dir", ".cache/azure_layout"),
+            max_size_mb=cache_config.get("azure_cache_max_mb", 256),
+            enabled=cache_config.get("enabled", True),
+            name="Azure layout cache"
+        )
+    return _azure_cache
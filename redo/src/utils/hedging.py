@@ -0,0 +1,228 @@
+"""
+Hedging Module
+Per-call deadlines and hedged duplicate requests for LLM completions: a request on the
+dispatch loop still running after the recent tail latency gets a second copy (optionally
+on a fallback model), the first valid response wins and the other one is cancelled
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when no response arrives before the call deadline."""
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, percentile: float = 95.0, min_samples: int = 20):
+        """
+        Track recent completion latencies per model.
+
+        Args:
+            window: Number of recent latencies kept per model
+            percentile: Percentile reported by percentile_for
+            min_samples: Samples needed before the percentile is trusted
+        """
+        self.window = window
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile_for(self, key: str) -> Optional[float]:
+        """
+        Get the tracked latency percentile for a model.
+
+        Returns:
+            Latency in seconds, or None while there are too few samples
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(self.percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+
+class HedgePolicy:
+    def __init__(self, enabled: bool = False, deadline: float = 180.0, initial_delay: float = 30.0,
+                 min_delay: float = 2.0, max_delay: float = 60.0, fallback_model: str = None,
+                 tracker: LatencyTracker = None):
+        """
+        Initialize hedging policy.
+
+        Args:
+            enabled: Send hedged duplicates of async calls (the deadline applies either way)
+            deadline: Seconds a whole call may take, retries and hedge included (None or 0 for no limit)
+            initial_delay: Hedge delay used until enough latencies are tracked
+            min_delay: Lower bound for the hedge delay, in seconds
+            max_delay: Upper bound for the hedge delay, in seconds
+            fallback_model: Model for the hedged copy of a request (defaults to the same model)
+            tracker: Latency tracker the hedge delay is derived from
+        """
+        self.enabled = enabled
+        self.deadline = deadline or None
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.fallback_model = fallback_model
+        self.tracker = tracker or LatencyTracker()
+
+    @classmethod
+    def from_config(cls) -> "HedgePolicy":
+        """Build the hedging policy from the llm.hedging config section."""
+        from src.utils.config_manager import config_manager
+        llm_config = config_manager.get_llm_config()
+        hedge_config = llm_config.get("hedging", {})
+        return cls(
+            enabled=hedge_config.get("enabled", False),
+            deadline=hedge_config.get("deadline_seconds", 180.0),
+            initial_delay=hedge_config.get("initial_delay_seconds", 30.0),
+            min_delay=hedge_config.get("min_delay_seconds", 2.0),
+            max_delay=hedge_config.get("max_delay_seconds", 60.0),
+            fallback_model=hedge_config.get("fallback_model"),
+            tracker=LatencyTracker(
+                window=hedge_config.get("window", 200),
+                percentile=hedge_config.get("percentile", 95),
+                min_samples=hedge_config.get("min_samples", 20)
+            )
+        )
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait for a request before sending its hedged copy."""
+        tracked = self.tracker.percentile_for(model)
+        delay = self.initial_delay if tracked is None else tracked
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def deadline_at(self) -> Optional[float]:
+        """Monotonic time by which a call starting now must finish, or None."""
+        return time.monotonic() + self.deadline if self.deadline else None
+
+    @staticmethod
+    def request_options(deadline: Optional[float]) -> dict:
+        """Per-request client options that stop an HTTP request at the deadline."""
+        if deadline is None:
+            return {}
+        return {"timeout": max(0.1, deadline - time.monotonic())}
+
+    def _hedge_request(self, request: dict) -> dict:
+        if self.fallback_model:
+            return {**request, "model": self.fallback_model}
+        return request
+
+    def _wait_time(self, start: float, delay: float, deadline: Optional[float], hedged: bool) -> Optional[float]:
+        now = time.monotonic()
+        timeouts = [] if hedged else [max(0.0, start + delay - now)]
+        if deadline is not None:
+            timeouts.append(max(0.0, deadline - now))
+        return min(timeouts) if timeouts else None
+
+    def call(self, attempt: Callable[[dict, Optional[float]], Any], request: dict):
+        """
+        Run a synchronous request with the call deadline.
+
+        Synchronous calls are never hedged: a request running in a worker thread
+        cannot be cancelled, so the losing copy would keep its connection and its
+        quota until the deadline. Calls on the dispatch loop go through call_async.
+
+        Args:
+            attempt: Callable(request, deadline) making the request (with its own retries)
+            request: Chat completion arguments
+
+        Returns:
+            The response
+        """
+        return attempt(request, self.deadline_at())
+
+    async def call_async(self, attempt: Callable[[dict, Optional[float]], Any], request: dict,
+                         is_valid: Callable[[Any], bool] = None):
+        """
+        Run a request with a deadline and, if it is slow, a hedged copy.
+
+        Streaming requests are not hedged; they only get the deadline. The losing
+        request's task is cancelled, which closes its connection.
+
+        Args:
+            attempt: Callable(request, deadline) returning an awaitable that makes the request
+            request: Chat completion arguments
+            is_valid: Optional check on a response; an invalid primary response starts the hedge at once
+
+        Returns:
+            The first valid response (or the last invalid one if none was valid)
+
+        Raises:
+            DeadlineExceeded: If no response arrived before the deadline
+        """
+        deadline = self.deadline_at()
+        if not self.enabled or request.get("stream"):
+            if deadline is None:
+                return await attempt(request, deadline)
+            try:
+                return await asyncio.wait_for(attempt(request, deadline), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"No LLM response within {self.deadline:.0f}s")
+
+        async def timed(sent):
+            begin = time.monotonic()
+            response = await attempt(sent, deadline)
+            return response, time.monotonic() - begin
+
+        model = request.get("model")
+        start = time.monotonic()
+        delay = self.hedge_delay(model)
+        pending = {asyncio.ensure_future(timed(request)): request}
+        hedged = False
+        invalid_response, error = None, None
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(list(pending), timeout=self._wait_time(start, delay, deadline, hedged),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    sent = pending.pop(task)
+                    try:
+                        response, elapsed = task.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    if is_valid is None or is_valid(response):
+                        self.tracker.record(sent.get("model"), elapsed)
+                        if sent is not request:
+                            print(f"[DEBUG] Hedged request to {sent.get('model')} won after {time.monotonic() - start:.1f}s")
+                        return response
+                    invalid_response = response
+
+                if deadline is not None and time.monotonic() >= deadline and pending:
+                    raise DeadlineExceeded(f"No LLM response within {self.deadline:.0f}s")
+                if not hedged and (pending or invalid_response is not None) and \
+                        (invalid_response is not None or time.monotonic() >= start + delay):
+                    hedge = self._hedge_request(request)
+                    print(f"[DEBUG] Sending hedged request to {hedge.get('model')} after {time.monotonic() - start:.1f}s")
+                    pending[asyncio.ensure_future(timed(hedge))] = hedge
+                    hedged = True
+        finally:
+            # Cancel the loser (or everything, on deadline or caller cancellation)
+            for task in pending:
+                task.cancel()
+
+        if invalid_response is not None:
+            return invalid_response
+        raise error
+
+
+# Global instance for the hedging policy
+_hedge_policy = None
+
+def get_hedge_policy() -> HedgePolicy:
+    """Get global hedging policy instance."""
+    global _hedge_policy
+    if _hedge_policy is None:
+        _hedge_policy = HedgePolicy.from_config()
+    return _hedge_policy
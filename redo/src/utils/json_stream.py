@@ -0,0 +1,131 @@
+"""
+JSON Stream Module
+Incremental parser that yields the elements of a streamed JSON array as soon as
+each one is complete
+"""
+
+import json
+from typing import Any, List
+
+
+class StreamFormatError(ValueError):
+    """Raised as soon as a streamed response can no longer be a valid row array."""
+
+
+class JsonArrayStreamParser:
+    """
+    Feed text chunks of an LLM response and get back completed row elements.
+
+    The row array is the first '[' that begins a valid array, so a bare array
+    ([{...}, ...] or [[...], ...]) and a structured-output wrapper
+    ({"rows": [...]}) both work. Text before it (prose, code fences, or a
+    bracketed word such as "[are]") is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.array_start = None
+        self.rows_seen = 0
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.element_start = None
+
+    def _reject_candidate(self, reason: str) -> None:
+        """
+        Give up on the current '[' as the row array.
+
+        Until the first row is complete it may just be prose, so scanning resumes
+        after it; once rows were returned the stream is malformed.
+        """
+        if self.rows_seen:
+            raise StreamFormatError(reason)
+        self.pos = self.array_start
+        self.in_array = False
+        self.array_start = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.element_start = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Consume the next chunk of response text.
+
+        Args:
+            chunk: Newly received text
+
+        Returns:
+            Row elements completed by this chunk, decoded from JSON
+
+        Raises:
+            StreamFormatError: If the text cannot continue a valid row array
+        """
+        if not chunk or self.done:
+            return []
+        self.buffer += chunk
+        rows = []
+
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+
+            if not self.in_array:
+                if char == "[":
+                    self.in_array = True
+                    self.array_start = self.pos
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                if self.depth == 0:
+                    self._reject_candidate("bare string in the row array")
+                else:
+                    self.in_string = True
+            elif char in "[{":
+                if self.depth == 0:
+                    self.element_start = self.pos
+                self.depth += 1
+            elif char in "]}":
+                if self.depth == 0:
+                    if char == "}":
+                        self._reject_candidate("unbalanced '}' in the row array")
+                    else:
+                        self.done = True
+                        self.pos += 1
+                        break
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        text = self.buffer[self.element_start:self.pos + 1]
+                        try:
+                            rows.append(json.loads(text))
+                            self.rows_seen += 1
+                            self.element_start = None
+                        except json.JSONDecodeError as e:
+                            self._reject_candidate(f"malformed row {text[:80]!r}: {e}")
+            elif self.depth == 0 and not (char.isspace() or char == ","):
+                self._reject_candidate(f"unexpected {char!r} between rows")
+
+            self.pos += 1
+
+        # Completed text is no longer needed; a candidate array without rows may still be rejected
+        if self.in_array and not self.rows_seen:
+            keep = self.array_start
+        elif self.element_start is not None:
+            keep = self.element_start
+        else:
+            keep = self.pos
+        self.buffer = self.buffer[keep:]
+        self.pos -= keep
+        if self.array_start is not None:
+            self.array_start -= keep
+        if self.element_start is not None:
+            self.element_start -= keep
+        return rows
@@ -3,13 +3,84 @@ LLM Client Module
 Handles all interactions with OpenAI API for text and vision models
 """
 
+import time
 import toml
-import json
+import threading
 import base64
+import asyncio
+import hashlib
 import pandas as pd
 from io import StringIO
-from openai import OpenAI
-import re
+from src.utils.openai_factory import get_openai_client, get_async_openai_client
+from src.utils.disk_cache import get_response_cache
+from src.utils.vision_cache import get_vision_cache
+from src.utils.config_manager import config_manager
+from src.utils.async_bridge import dispatch_available, run_on_dispatch_loop, get_dispatch_loop
+from src.utils.pnl_schema import (
+    PNL_RESPONSE_FORMAT, COMPACT_RESPONSE_FORMAT, PnlRowDecoder, parse_pnl_records, parse_compact_records,
+    parse_sheet_records, multi_sheet_response_format, extract_json
+)
+from src.utils.llm_retry import RetryPolicy, RETRYABLE_ERRORS
+from src.utils.hedging import get_hedge_policy
+from src.utils.usage_stats import get_usage_stats
+from src.utils.json_stream import JsonArrayStreamParser, StreamFormatError
+from src.utils.table_serializer import estimate_tokens
+
+DEFAULT_VISION_PROMPT = "Classify this picture: is it a blue table or a red table. Return blue or red. Don't return anything else."
+
+# Errors that end a streamed attempt early so it can be retried
+STREAM_ABORT_ERRORS = (StreamFormatError,) + RETRYABLE_ERRORS
+
+
+class _StreamAttempt:
+    """Decoding state of one streamed attempt: the row parser, the raw text and the usage."""
+    
+    def __init__(self, constants: dict = None, expected_rows: int = None):
+        self.parser = JsonArrayStreamParser()
+        self.decoder = PnlRowDecoder(constants)
+        self.expected_rows = expected_rows
+        self.parts = []
+        self.usage = None
+        self.rows = 0
+        self.started = time.monotonic()
+        # Abort error of the attempt; a retryable one restarts the stream
+        self.error = None
+    
+    def feed(self, chunk) -> list:
+        """Decode one streamed chunk into the records it completes."""
+        self.usage = getattr(chunk, "usage", None) or self.usage
+        text = (chunk.choices[0].delta.content or "") if chunk.choices else ""
+        self.parts.append(text)
+        records = []
+        for row in self.parser.feed(text):
+            try:
+                record = self.decoder.decode(row)
+            except (ValueError, TypeError) as e:
+                # A row that breaks the contract is a stream format error
+                raise StreamFormatError(str(e)) from e
+            if record is not None:
+                records.append(record)
+        self.rows += len(records)
+        return records
+    
+    def finish(self):
+        """Check that the stream ended with a closed, non-empty row array."""
+        if not self.parser.done:
+            raise StreamFormatError("stream ended before the row array was closed")
+        if not self.rows and self.expected_rows != 0:
+            raise StreamFormatError("stream returned no rows")
+    
+    @property
+    def text(self) -> str:
+        return "".join(self.parts).strip()
+
+
+def deliver_rows(records, on_row=None):
+    """Hand the records of a whole (non-streamed) answer to an on_row callback."""
+    if records is not None and on_row is not None:
+        for index, record in enumerate(records):
+            on_row(index, record)
+    return records
 
 
 class LLMClient:
@@ -20,6 +91,8 @@ class LLMClient:
         self.api_key = self.openai_config.get("api_key")
         self.text_model = self.openai_config.get("model", "gpt-4o")
         self.vision_model = self.openai_config.get("vision_model", "gpt-4o")
+        # Optional OpenAI-compatible endpoint (e.g. a local stand-in server)
+        self.base_url = self.openai_config.get("base_url") or None
         self.system_prompt = self.openai_config.get(
             "system_prompt", 
             "You are a data analysis expert that helps transform and organize Excel data. Always return valid JSON arrays."
@@ -28,27 +101,202 @@ class LLMClient:
         if not self.api_key:
             raise ValueError("OpenAI API key not found in secrets file")
         
-        self.client = OpenAI(api_key=self.api_key)
+        # Process-wide pooled client; retries are handled by RetryPolicy so 429s can pause the shared quota
+        self.client = get_openai_client(self.api_key, self.base_url)
+        self.cache = get_response_cache()
+        self.vision_cache = get_vision_cache()
+        self.retry_policy = RetryPolicy.from_config()
+        # Per-call deadline and hedged duplicates for slow completions
+        self.hedging = get_hedge_policy()
+        # Prompt/cached/completion token counters for the run summary
+        self.usage = get_usage_stats()
+        self.expected_output_tokens = config_manager.get_rate_limit_config().get("estimated_output_tokens", 1000)
+        llm_config = config_manager.get_llm_config()
+        self.max_concurrency = llm_config.get("max_concurrency", 8)
+        # Schema-constrained P&L rows instead of free-form JSON text
+        self.structured_output = llm_config.get("structured_output", False)
+        # Compact [risk, greek, rider, asset] rows with the constant columns filled locally
+        self.compact_output = llm_config.get("compact_output", True)
+        self.output_tokens_per_row = llm_config.get("output_tokens_per_row", 32)
+        self.output_token_overhead = llm_config.get("output_token_overhead", 64)
+        # Stream P&L extractions and decode rows while they are generated
+        self.stream = llm_config.get("stream", False)
+        self.stream_retries = llm_config.get("stream_retries", 2)
+    
+    def pnl_response_format(self, compact: bool = False):
+        """Get the response_format used for P&L extraction prompts (None for free-form text)."""
+        if not self.structured_output:
+            return None
+        return COMPACT_RESPONSE_FORMAT if compact else PNL_RESPONSE_FORMAT
     
-    def process_text(self, prompt: str) -> dict:
+    def sheets_response_format(self, sheets: list, compact: bool = False):
+        """Get the response_format for a multi-sheet prompt (None for free-form text)."""
+        return multi_sheet_response_format(sheets, compact) if self.structured_output else None
+    
+    def max_tokens_for_rows(self, expected_rows: int = None):
         """
-        Process text prompt and return structured data.
+        Output token limit for a compact response with the given number of table rows.
         
         Args:
-            prompt: Text prompt for the LLM
+            expected_rows: Number of source table rows (upper bound on output rows)
             
         Returns:
-            Dictionary with 'table' key containing CSV string
+            max_tokens value, or None to leave the response unbounded
+        """
+        if not expected_rows:
+            return None
+        # One extra row for the header line
+        return self.output_token_overhead + (expected_rows + 1) * self.output_tokens_per_row
+    
+    def text_cache_key(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                       response_format: dict = None) -> str:
+        """
+        Build the response cache key for a text prompt.
+        
+        The prompt hash covers the table text embedded in the prompt; the template
+        version lets a prompt rewrite invalidate old entries explicitly.
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        parts = [self.text_model, system_prompt or self.system_prompt, template_version, prompt_hash]
+        if response_format:
+            # Structured and free-form responses for the same prompt are not interchangeable
+            parts.append(response_format["json_schema"]["name"])
+        return self.cache.make_key(*parts)
+    
+    def _run(self, flow):
+        """
+        Drive a request flow, making its I/O steps synchronously.
+        
+        Every request method is written once as a flow: a generator that builds the
+        request, yields each I/O step (see _perform) and parses the result. In
+        concurrent batch mode the flow runs on the dispatch loop instead, sharing the
+        async client and its request semaphore.
+        
+        Args:
+            flow: Generator returned by one of the *_flow methods
+            
+        Returns:
+            Value returned by the flow
+        """
+        if dispatch_available():
+            return run_on_dispatch_loop(get_async_llm_client()._run(flow))
+        try:
+            step = next(flow)
+            while True:
+                try:
+                    result = self._perform(step)
+                except Exception as e:
+                    step = flow.throw(e)
+                else:
+                    step = flow.send(result)
+        except StopIteration as stop:
+            return stop.value
+    
+    def _perform(self, step):
+        """
+        Make one I/O step of a request flow.
+        
+        Steps are ("complete", request, is_valid), answered with the chat completion
+        (or the open stream of a streaming request), and ("read", stream, attempt,
+        on_row), answered with the records read from the stream. Rows are handed to
+        on_row outside the stream's abort handling, so its exceptions propagate.
         """
+        if step[0] == "complete":
+            _, request, is_valid = step
+            return self._create_completion(request, is_valid)
+        _, stream, attempt, on_row = step
+        records = []
         try:
-            response = self.client.chat.completions.create(
-                model=self.text_model,
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": prompt}
-                ]
+            for chunk_records in self._read_stream(stream, attempt):
+                for record in chunk_records:
+                    if on_row is not None:
+                        on_row(len(records), record)
+                    records.append(record)
+        finally:
+            stream.close()
+        return records
+    
+    def _complete_text_flow(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                            is_valid=None, response_format: dict = None, max_tokens: int = None):
+        system_prompt = system_prompt or self.system_prompt
+        cache_key = self.text_cache_key(prompt, template_version, system_prompt, response_format)
+        cached = self._cached_content(cache_key, template_version, is_valid)
+        if cached is not None:
+            return cached
+        
+        print(f"[DEBUG] Sending prompt of ~{estimate_tokens(prompt)} tokens")
+        response = yield ("complete", self._text_request(prompt, system_prompt, response_format, max_tokens),
+                          is_valid)
+        content = self._completion_content(response)
+        
+        self._store_content(cache_key, content, template_version, is_valid)
+        return content
+    
+    def _parsed_flow(self, prompt: str, template_version: str, system_prompt: str, parse, label: str,
+                     response_format: dict = None, max_tokens: int = None):
+        """Complete a prompt whose answer is only usable (and cached) when parse accepts it."""
+        try:
+            content = yield from self._complete_text_flow(
+                prompt,
+                template_version=template_version,
+                system_prompt=system_prompt,
+                is_valid=lambda text: parse(text) is not None,
+                response_format=response_format,
+                max_tokens=max_tokens
+            )
+            print(f"[DEBUG] Raw {label} LLM response:\n{content}")
+        except Exception as e:
+            print(f"Error calling OpenAI text model: {e}")
+            return None
+        return parse(content)
+    
+    def _stream_records_flow(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                             constants: dict = None, expected_rows: int = None, on_row=None):
+        system_prompt = system_prompt or self.system_prompt
+        parse = self._records_parser(constants, expected_rows)
+        response_format, request = self._stream_request(prompt, system_prompt, constants, expected_rows)
+        cache_key = self.text_cache_key(prompt, template_version, system_prompt, response_format)
+        cached = self._cached_content(cache_key, template_version, lambda text: parse(text) is not None)
+        if cached is not None:
+            return deliver_rows(parse(cached), on_row)
+        
+        print(f"[DEBUG] Streaming prompt of ~{estimate_tokens(prompt)} tokens")
+        for attempt_number in range(self.stream_retries + 1):
+            attempt = _StreamAttempt(constants, expected_rows)
+            try:
+                stream = yield ("complete", request, None)
+            except Exception as e:
+                print(f"Error calling OpenAI text model: {e}")
+                return None
+            records = yield ("read", stream, attempt, on_row)
+            if attempt.error is not None:
+                print(f"[DEBUG] Aborted LLM stream on attempt {attempt_number + 1}: {attempt.error}")
+                continue
+            
+            self.usage.record(attempt.usage, time.monotonic() - attempt.started)
+            self._store_content(cache_key, attempt.text, template_version)
+            return records
+        
+        print("[DEBUG] LLM stream failed on every attempt")
+        return None
+    
+    def _process_text_flow(self, prompt: str, template_version: str = None, constants: dict = None,
+                           expected_rows: int = None, on_row=None):
+        if constants is not None:
+            records = yield from self._process_compact_flow(prompt, constants, template_version,
+                                                            expected_rows=expected_rows, on_row=on_row)
+            return {"table": "", "records": records} if records is not None else {"table": ""}
+        
+        if self.structured_output or self.stream:
+            records = yield from self._process_records_flow(prompt, template_version, on_row=on_row)
+            return {"table": "", "records": records} if records is not None else {"table": ""}
+        
+        try:
+            content = yield from self._complete_text_flow(
+                prompt,
+                template_version=template_version,
+                is_valid=lambda text: bool(self._extract_json_to_csv(text)["table"])
             )
-            content = response.choices[0].message.content.strip()
             print(f"[DEBUG] Raw LLM response:\n{content}")
             
             return self._extract_json_to_csv(content)
@@ -57,51 +305,392 @@ class LLMClient:
             print(f"Error calling OpenAI text model: {e}")
             return {"table": ""}
     
-    def process_vision(self, image_path: str, prompt: str = None) -> str:
+    def _process_records_flow(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                              on_row=None):
+        if self.stream:
+            return (yield from self._stream_records_flow(prompt, template_version, system_prompt, on_row=on_row))
+        records = yield from self._parsed_flow(prompt, template_version, system_prompt, self._records_parser(),
+                                               "structured", response_format=PNL_RESPONSE_FORMAT)
+        return deliver_rows(records, on_row)
+    
+    def _process_compact_flow(self, prompt: str, constants: dict, template_version: str = None,
+                              system_prompt: str = None, expected_rows: int = None, on_row=None):
+        if self.stream:
+            return (yield from self._stream_records_flow(prompt, template_version, system_prompt, constants,
+                                                         expected_rows, on_row))
+        records = yield from self._parsed_flow(
+            prompt, template_version, system_prompt, self._records_parser(constants, expected_rows), "compact",
+            response_format=self.pnl_response_format(compact=True),
+            max_tokens=self.max_tokens_for_rows(expected_rows)
+        )
+        return deliver_rows(records, on_row)
+    
+    def _process_sheets_flow(self, prompt: str, sheet_constants: dict, template_version: str = None,
+                             system_prompt: str = None, expected_rows: int = None):
+        compact = all(constants is not None for constants in sheet_constants.values())
+        parse = self._require_rows(lambda text: parse_sheet_records(text, sheet_constants), expected_rows)
+        return (yield from self._parsed_flow(
+            prompt, template_version, system_prompt, parse, "multi-sheet",
+            response_format=self.sheets_response_format(list(sheet_constants), compact),
+            max_tokens=self.max_tokens_for_rows(expected_rows) if compact else None
+        ))
+    
+    def _process_vision_flow(self, image_path, prompt: str = None):
+        if prompt is None:
+            prompt = DEFAULT_VISION_PROMPT
+        
+        try:
+            # Read and encode image
+            image_bytes = self._image_bytes(image_path)
+            
+            # The same report template recurs daily; reuse its stored classification
+            cached = self.vision_cache.lookup(image_bytes)
+            if cached is not None:
+                return cached
+            
+            response = yield ("complete", {
+                "model": self.vision_model,
+                "messages": self._vision_messages(image_bytes, prompt)
+            }, None)
+            
+            # Extract classification
+            label = self._parse_vision_content(response.choices[0].message.content)
+            self.vision_cache.store(image_bytes, label)
+            return label
+                
+        except Exception as e:
+            print(f"Error calling OpenAI vision model: {e}")
+            return "unknown"
+    
+    def complete_text(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                      is_valid=None, response_format: dict = None, max_tokens: int = None) -> str:
+        """
+        Send a text prompt and return the raw completion, using the response cache.
+        
+        Args:
+            prompt: Text prompt for the LLM
+            template_version: Version of the prompt template that built the prompt
+            system_prompt: System prompt override (defaults to the configured one)
+            is_valid: Optional check on the raw content; invalid responses are not cached
+            response_format: Optional structured-output response format
+            max_tokens: Optional output token limit
+            
+        Returns:
+            Raw completion content
+        """
+        return self._run(self._complete_text_flow(prompt, template_version, system_prompt, is_valid,
+                                                  response_format, max_tokens))
+    
+    def stream_records(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                       constants: dict = None, expected_rows: int = None, on_row=None):
+        """
+        Stream a P&L extraction, decoding and validating rows while they are generated.
+        
+        A malformed stream or a row that breaks the contract aborts the attempt at once
+        and the request is retried (llm.stream_retries times). Rows from an aborted
+        attempt are discarded; on_row sees the retry start again from index 0.
+        
+        Args:
+            prompt: Text prompt for the LLM
+            template_version: Version of the prompt template, part of the cache key
+            system_prompt: System prompt override (defaults to the configured one)
+            constants: VALUATION_DATE/PRODUCT_TYPE for a compact-contract prompt
+            expected_rows: Source table row count, used to bound compact output
+            on_row: Optional callback(index, record) called as each validated row arrives;
+                its exceptions are not treated as stream errors
+            
+        Returns:
+            List of P&L row dictionaries, or None if every attempt failed
+        """
+        return self._run(self._stream_records_flow(prompt, template_version, system_prompt, constants,
+                                                   expected_rows, on_row))
+    
+    def process_text(self, prompt: str, template_version: str = None, constants: dict = None,
+                     expected_rows: int = None, on_row=None) -> dict:
+        """
+        Process text prompt and return structured data.
+        
+        Args:
+            prompt: Text prompt for the LLM
+            template_version: Version of the prompt template, part of the cache key
+            constants: VALUATION_DATE/PRODUCT_TYPE for a compact-contract prompt
+            expected_rows: Source table row count, used to bound compact output
+            on_row: Optional callback(index, record) for each row of a records answer,
+                called as rows arrive when streaming
+            
+        Returns:
+            Dictionary with 'table' key containing CSV string, or with a
+            'records' list of typed rows when structured or compact output is used
+        """
+        return self._run(self._process_text_flow(prompt, template_version, constants, expected_rows, on_row))
+    
+    def process_records(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                        on_row=None):
+        """
+        Process text prompt with the P&L JSON schema and return typed records.
+        
+        Args:
+            prompt: Text prompt for the LLM
+            template_version: Version of the prompt template, part of the cache key
+            system_prompt: System prompt override (defaults to the configured one)
+            on_row: Optional callback(index, record) for each row, called as rows arrive when streaming
+            
+        Returns:
+            List of P&L row dictionaries, or None on failure
+        """
+        return self._run(self._process_records_flow(prompt, template_version, system_prompt, on_row))
+    
+    def process_compact(self, prompt: str, constants: dict, template_version: str = None,
+                        system_prompt: str = None, expected_rows: int = None, on_row=None):
+        """
+        Process a compact-contract prompt and return typed records.
+        
+        Args:
+            prompt: Text prompt built with compact=True
+            constants: VALUATION_DATE and PRODUCT_TYPE to fill into every row
+            template_version: Version of the prompt template, part of the cache key
+            system_prompt: System prompt override (defaults to the configured one)
+            expected_rows: Source table row count, used to derive max_tokens
+            on_row: Optional callback(index, record) for each row, called as rows arrive when streaming
+            
+        Returns:
+            List of P&L row dictionaries, or None on failure
+        """
+        return self._run(self._process_compact_flow(prompt, constants, template_version, system_prompt,
+                                                    expected_rows, on_row))
+    
+    def process_sheets(self, prompt: str, sheet_constants: dict, template_version: str = None,
+                       system_prompt: str = None, expected_rows: int = None):
+        """
+        Process a multi-sheet prompt and return typed records per sheet.
+        
+        Args:
+            prompt: Prompt with one tagged section per sheet
+            sheet_constants: Sheet name to compact constants; all None for the full contract
+            template_version: Version of the prompt template, part of the cache key
+            system_prompt: System prompt override (defaults to the configured one)
+            expected_rows: Total source row count, used to bound compact output
+            
+        Returns:
+            Dictionary of sheet name to P&L row dictionaries, or None on failure
+        """
+        return self._run(self._process_sheets_flow(prompt, sheet_constants, template_version, system_prompt,
+                                                   expected_rows))
+    
+    def process_vision(self, image_path, prompt: str = None) -> str:
         """
         Process image with vision model for classification.
         
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file, or the encoded image bytes
             prompt: Custom prompt (optional)
             
         Returns:
             Classification result as string
         """
-        if prompt is None:
-            prompt = "Classify this picture: is it a blue table or a red table. Return blue or red. Don't return anything else."
+        return self._run(self._process_vision_flow(image_path, prompt))
+    
+    def _create_completion(self, request: dict, is_valid=None):
+        """
+        Create a chat completion through the shared quota, retry policy and call deadline.
         
-        try:
-            # Read and encode image
-            with open(image_path, "rb") as f:
-                image_bytes = f.read()
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-            
-            response = self.client.chat.completions.create(
-                model=self.vision_model,
-                messages=[
-                    {"role": "user", "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
-                    ]}
-                ]
+        Args:
+            request: Chat completion arguments
+            is_valid: Optional check on the response content; only the async client's
+                hedged calls use it, synchronous calls are never hedged
+        """
+        def attempt(sent: dict, deadline):
+            return self.retry_policy.call(
+                lambda: self.client.chat.completions.create(**sent, **self.hedging.request_options(deadline)),
+                estimated_tokens=self._estimate_tokens(sent),
+                deadline=deadline
             )
+        
+        started = time.monotonic()
+        response = self.hedging.call(attempt, request)
+        if not request.get("stream"):
+            self.usage.record(getattr(response, "usage", None), time.monotonic() - started)
+        return response
+    
+    @staticmethod
+    def _response_check(is_valid):
+        """Turn a content check into a check on a chat completion response."""
+        if is_valid is None:
+            return None
+        return lambda response: is_valid((response.choices[0].message.content or "").strip())
+    
+    def _estimate_tokens(self, request: dict) -> int:
+        """Rough token cost of a request for the tokens/min bucket."""
+        tokens = 0
+        images = 0
+        for message in request["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                tokens += estimate_tokens(content)
+                continue
+            for part in content:
+                if part["type"] == "text":
+                    tokens += estimate_tokens(part["text"])
+                else:
+                    images += 1
+        # Prompt tokens, a flat allowance per image, plus the expected reply
+        return tokens + images * 765 + (request.get("max_tokens") or self.expected_output_tokens)
+    
+    def _completion_content(self, response) -> str:
+        """Get the text of a chat completion, warning when it hit the output limit."""
+        choice = response.choices[0]
+        if getattr(choice, "finish_reason", None) == "length":
+            print("[DEBUG] LLM response was cut off by max_tokens")
+        return (choice.message.content or "").strip()
+    
+    def is_cached(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                  response_format: dict = None) -> bool:
+        """Check whether a text prompt already has a cached response."""
+        return self.cache.contains(self.text_cache_key(prompt, template_version, system_prompt, response_format))
+    
+    def build_batch_request(self, prompt: str, template_version: str = None, system_prompt: str = None,
+                            response_format: dict = None, max_tokens: int = None) -> dict:
+        """
+        Build one Batch API request line for a text prompt.
+        
+        The cache key doubles as the custom_id, so collected results can be
+        written straight into the response cache.
+        
+        Args:
+            prompt: Text prompt for the LLM
+            template_version: Version of the prompt template that built the prompt
+            system_prompt: System prompt override (defaults to the configured one)
+            response_format: Optional structured-output response format
+            max_tokens: Optional output token limit
             
-            content = response.choices[0].message.content.strip().lower()
-            
-            # Extract classification
-            if "blue" in content:
-                return "blue"
-            elif "red" in content:
-                return "red"
-            else:
-                print(f"Vision model returned unexpected content: {content}")
-                return "unknown"
-                
-        except Exception as e:
-            print(f"Error calling OpenAI vision model: {e}")
+        Returns:
+            Dictionary in the Batch API JSONL request format
+        """
+        system_prompt = system_prompt or self.system_prompt
+        return {
+            "custom_id": self.text_cache_key(prompt, template_version, system_prompt, response_format),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": self._text_request(prompt, system_prompt, response_format, max_tokens)
+        }
+    
+    def _text_request(self, prompt: str, system_prompt: str, response_format: dict = None,
+                      max_tokens: int = None) -> dict:
+        """Build chat completion arguments for a text prompt."""
+        request = {
+            "model": self.text_model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ]
+        }
+        if response_format:
+            request["response_format"] = response_format
+        if max_tokens:
+            request["max_tokens"] = max_tokens
+        return request
+    
+    def _vision_messages(self, image_bytes: bytes, prompt: str) -> list:
+        """Build chat messages for an image classification prompt."""
+        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+        return [
+            {"role": "user", "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
+            ]}
+        ]
+    
+    def _cached_content(self, cache_key: str, template_version: str = None, is_valid=None):
+        """Return cached completion content, or None on a miss or an invalid entry."""
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        if is_valid is not None and not is_valid(cached["content"]):
+            print("[DEBUG] Ignoring cached LLM response that fails validation")
+            return None
+        print(f"[DEBUG] LLM cache hit ({template_version or 'unversioned'})")
+        return cached["content"]
+    
+    def _store_content(self, cache_key: str, content: str, template_version: str = None, is_valid=None):
+        """Cache completion content unless it fails validation."""
+        if is_valid is None or is_valid(content):
+            self.cache.put(cache_key, {
+                "content": content,
+                "model": self.text_model,
+                "template_version": template_version
+            })
+    
+    def _parse_vision_content(self, content: str) -> str:
+        """Reduce a vision model reply to 'blue', 'red' or 'unknown'."""
+        content = content.strip().lower()
+        if "blue" in content:
+            return "blue"
+        elif "red" in content:
+            return "red"
+        else:
+            print(f"Vision model returned unexpected content: {content}")
             return "unknown"
     
+    def _records_parser(self, constants: dict = None, expected_rows: int = None):
+        """Get the whole-response parser matching a row decoder's contract."""
+        if constants is not None:
+            return self._require_rows(lambda text: parse_compact_records(text, constants), expected_rows)
+        return self._require_rows(parse_pnl_records, expected_rows)
+    
+    @staticmethod
+    def _require_rows(parse, expected_rows: int = None):
+        """
+        Wrap a response parser so an empty answer counts as a failed response.
+        
+        Every P&L prompt asks for at least one row unless the source table is empty
+        (expected_rows == 0), so no rows - for the table or for any sheet - is
+        neither cached nor returned as a successful extraction.
+        """
+        def parse_rows(text):
+            records = parse(text)
+            if records is None or expected_rows == 0:
+                return records
+            empty = any(not rows for rows in records.values()) if isinstance(records, dict) else not records
+            if empty:
+                print("LLM response has no rows")
+                return None
+            return records
+        return parse_rows
+    
+    def _stream_request(self, prompt: str, system_prompt: str, constants: dict = None,
+                        expected_rows: int = None):
+        """Build the response format and streaming request for a P&L extraction prompt."""
+        response_format = self.pnl_response_format(compact=constants is not None)
+        max_tokens = self.max_tokens_for_rows(expected_rows) if constants is not None else None
+        request = self._text_request(prompt, system_prompt, response_format, max_tokens)
+        request["stream"] = True
+        # Final chunk carries the usage, including cached prompt tokens
+        request["stream_options"] = {"include_usage": True}
+        return response_format, request
+    
+    @staticmethod
+    def _read_stream(stream, attempt: _StreamAttempt):
+        """
+        Yield the records each chunk of a stream completes.
+        
+        An abort error ends the generator with attempt.error set. The caller's row
+        handling runs outside this error handling, so its exceptions propagate.
+        """
+        try:
+            for chunk in stream:
+                yield attempt.feed(chunk)
+            attempt.finish()
+        except STREAM_ABORT_ERRORS as e:
+            attempt.error = e
+    
+    @staticmethod
+    def _image_bytes(image) -> bytes:
+        """Get encoded image bytes from raw bytes or an image path."""
+        if isinstance(image, (bytes, bytearray)):
+            return bytes(image)
+        with open(image, "rb") as f:
+            return f.read()
+    
     def _extract_json_to_csv(self, content: str) -> dict:
         """
         Extract JSON array from LLM response and convert to CSV.
@@ -112,47 +701,144 @@ class LLMClient:
         Returns:
             Dictionary with 'table' key containing CSV string
         """
-        # Use robust JSON extraction method
-        json_match = re.search(r'(\[.*?\])', content, re.DOTALL)
+        # Decode the first complete JSON value (handles nested arrays and surrounding prose)
+        data = extract_json(content)
         
-        if json_match:
-            json_str = json_match.group(1)
-            try:
-                data = json.loads(json_str)
-                if not isinstance(data, list):
-                    print("LLM response is not a JSON array")
-                    return {"table": ""}
-                
-                # Convert JSON array to CSV format
-                df = pd.DataFrame(data)
-                csv_buffer = StringIO()
-                df.to_csv(csv_buffer, index=False)
-                csv_string = csv_buffer.getvalue()
-                
-                return {"table": csv_string.strip()}
-                
-            except json.JSONDecodeError as e:
-                print(f"JSON decoding error: {e}")
-                return {"table": ""}
-        else:
+        if data is None:
             print("No JSON array found in LLM response.")
             return {"table": ""}
+        if not isinstance(data, list):
+            print("LLM response is not a JSON array")
+            return {"table": ""}
+        
+        # Convert JSON array to CSV format
+        df = pd.DataFrame(data)
+        csv_buffer = StringIO()
+        df.to_csv(csv_buffer, index=False)
+        csv_string = csv_buffer.getvalue()
+        
+        return {"table": csv_string.strip()}
+
+
+class AsyncLLMClient(LLMClient):
+    """
+    Async variant of LLMClient built on AsyncOpenAI.
+    A semaphore bounds the number of requests in flight across all callers.
+    
+    The request methods are inherited: they build the same flows, and _run
+    awaits their I/O steps, so here they return awaitables.
+    """
+    
+    def __init__(self, secrets_file="config/secrets.toml", max_concurrency: int = None):
+        """Initialize async LLM client with configuration."""
+        super().__init__(secrets_file)
+        self.async_client = get_async_openai_client(self.api_key, self.base_url, loop=get_dispatch_loop())
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
+        # Created on first use so it binds to the loop that runs the requests
+        self._semaphore = None
+    
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+    
+    async def _create_completion(self, request: dict, is_valid=None):
+        """Async version of LLMClient._create_completion; each attempt holds a semaphore slot."""
+        async def attempt(sent: dict, deadline):
+            async def send():
+                async with self.semaphore:
+                    return await self.async_client.chat.completions.create(
+                        **sent, **self.hedging.request_options(deadline)
+                    )
+            
+            return await self.retry_policy.call_async(send, estimated_tokens=self._estimate_tokens(sent),
+                                                      deadline=deadline)
+        
+        started = time.monotonic()
+        response = await self.hedging.call_async(attempt, request, self._response_check(is_valid))
+        if not request.get("stream"):
+            self.usage.record(getattr(response, "usage", None), time.monotonic() - started)
+        return response
+    
+    async def _run(self, flow):
+        """Async version of LLMClient._run; the flow's I/O steps are awaited on this loop."""
+        try:
+            step = next(flow)
+            while True:
+                try:
+                    result = await self._perform(step)
+                except Exception as e:
+                    step = flow.throw(e)
+                else:
+                    step = flow.send(result)
+        except StopIteration as stop:
+            return stop.value
+    
+    async def _perform(self, step):
+        """Async version of LLMClient._perform; a stream holds a semaphore slot while it is read."""
+        if step[0] == "complete":
+            _, request, is_valid = step
+            return await self._create_completion(request, is_valid)
+        _, stream, attempt, on_row = step
+        records = []
+        try:
+            async with self.semaphore:
+                async for chunk_records in self._read_stream_async(stream, attempt):
+                    for record in chunk_records:
+                        if on_row is not None:
+                            on_row(len(records), record)
+                        records.append(record)
+        finally:
+            await stream.close()
+        return records
+    
+    @staticmethod
+    async def _read_stream_async(stream, attempt: _StreamAttempt):
+        """Async version of LLMClient._read_stream."""
+        try:
+            async for chunk in stream:
+                yield attempt.feed(chunk)
+            attempt.finish()
+        except STREAM_ABORT_ERRORS as e:
+            attempt.error = e
 
 
 # Global instance for backward compatibility
 _llm_client = None
+_async_llm_client = None
+_async_llm_loop = None
+_llm_client_lock = threading.Lock()
 
 def get_llm_client():
     """Get global LLM client instance."""
     global _llm_client
-    if _llm_client is None:
-        _llm_client = LLMClient()
-    return _llm_client
+    with _llm_client_lock:
+        if _llm_client is None:
+            _llm_client = LLMClient()
+        return _llm_client
+
+def get_async_llm_client():
+    """Get the async LLM client bound to the current dispatch loop."""
+    global _async_llm_client, _async_llm_loop
+    loop = get_dispatch_loop()
+    # One client per loop, so concurrent workers share its request semaphore
+    with _llm_client_lock:
+        # The underlying HTTP connections belong to one event loop, so rebuild per loop
+        if _async_llm_client is None or _async_llm_loop is not loop:
+            _async_llm_client = AsyncLLMClient()
+            _async_llm_loop = loop
+        return _async_llm_client
 
-def real_llm_func(prompt: str) -> dict:
+def real_llm_func(prompt: str, template_version: str = None, constants: dict = None,
+                  expected_rows: int = None, on_row=None) -> dict:
     """Backward compatibility function for text processing."""
-    return get_llm_client().process_text(prompt)
+    return get_llm_client().process_text(
+        prompt, template_version=template_version, constants=constants, expected_rows=expected_rows,
+        on_row=on_row
+    )
 
-def real_llm_vision_func(image_path: str) -> str:
+def real_llm_vision_func(image_path) -> str:
     """Backward compatibility function for vision processing."""
     return get_llm_client().process_vision(image_path) 
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+LLM Retry Module
+Exponential backoff with jitter for OpenAI calls, honoring retry-after and rate-limit
+reset headers and feeding 429s back into the shared rate limiter
+"""
+
+import re
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+
+from src.utils.rate_limiter import SharedRateLimiter, get_rate_limiter
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset_duration(value: str) -> Optional[float]:
+    """
+    Parse OpenAI reset durations such as "1s", "6m0s" or "20ms".
+
+    Args:
+        value: Header value
+
+    Returns:
+        Duration in seconds, or None if the value cannot be parsed
+    """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value.strip())
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def header_delay(error: Exception) -> Optional[float]:
+    """
+    Get the server-requested wait from an API error's response headers.
+
+    Args:
+        error: Exception raised by the OpenAI client
+
+    Returns:
+        Seconds to wait, or None if the server gave no hint
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    # Fall back to the reset time of whichever quota is exhausted
+    resets = []
+    for kind in ("requests", "tokens"):
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0":
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}", ""))
+            if reset is not None:
+                resets.append(reset)
+    return max(resets) if resets else None
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 rate_limiter: SharedRateLimiter = None):
+        """
+        Initialize retry policy.
+
+        Args:
+            max_retries: Retries after the first attempt
+            base_delay: Base for the exponential backoff, in seconds
+            max_delay: Upper bound for a single backoff, in seconds
+            rate_limiter: Shared quota to draw from before each attempt
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limiter = rate_limiter
+
+    @classmethod
+    def from_config(cls) -> "RetryPolicy":
+        """Build the retry policy from the rate_limit config section."""
+        from src.utils.config_manager import config_manager
+        limit_config = config_manager.get_rate_limit_config()
+        return cls(
+            max_retries=limit_config.get("max_retries", 6),
+            base_delay=limit_config.get("base_delay_seconds", 1.0),
+            max_delay=limit_config.get("max_delay_seconds", 60.0),
+            rate_limiter=get_rate_limiter() if limit_config.get("enabled", True) else None
+        )
+
+    def _delay(self, error: Exception, attempt: int) -> float:
+        requested = header_delay(error)
+        if requested is not None:
+            # Honor the server's hint, with a little jitter so workers do not retry together
+            return min(requested, self.max_delay) + random.uniform(0, min(1.0, self.base_delay))
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _on_error(self, error: Exception, attempt: int, deadline: Optional[float] = None) -> float:
+        delay = self._delay(error, attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            # No time left for another attempt; let the caller see the error now
+            raise error
+        print(f"[DEBUG] {type(error).__name__} on attempt {attempt + 1}; retrying in {delay:.1f}s")
+        return delay
+
+    def _blocks_quota(self, error: Exception) -> bool:
+        return isinstance(error, RateLimitError) and self.rate_limiter is not None
+
+    def call(self, func, estimated_tokens: int = 0, deadline: Optional[float] = None):
+        """
+        Call func() with quota admission and retries.
+
+        Args:
+            func: Zero-argument callable making one API request
+            estimated_tokens: Token cost charged against the tokens/min bucket
+            deadline: Optional time.monotonic() value after which no retry is started and
+                no quota is waited for
+
+        Returns:
+            Result of func()
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(estimated_tokens, deadline)
+            try:
+                return func()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._on_error(e, attempt, deadline)
+                if self._blocks_quota(e):
+                    # Every process backs off, not just this one
+                    self.rate_limiter.block_for(delay)
+                time.sleep(delay)
+
+    async def call_async(self, func, estimated_tokens: int = 0, deadline: Optional[float] = None):
+        """
+        Async version of call; func() must return an awaitable.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async(estimated_tokens, deadline)
+            try:
+                return await func()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._on_error(e, attempt, deadline)
+                if self._blocks_quota(e):
+                    await self.rate_limiter.block_for_async(delay)
+                await asyncio.sleep(delay)
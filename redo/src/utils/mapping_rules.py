@@ -0,0 +1,244 @@
+"""
+Mapping Rules Module
+Deterministic P&L row extraction from the mapping.yml label patterns; only rows
+whose labels no rule recognizes need the LLM
+"""
+
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import yaml
+except ImportError:  # PyYAML missing: every row goes to the LLM as before
+    yaml = None
+
+from src.utils.pnl_schema import coerce_pnl_record
+
+_INLINE_FLAGS = {"IGNORECASE": "i", "MULTILINE": "m", "DOTALL": "s", "ASCII": "a"}
+
+# Rows that never produce output: totals, subtotals and market value headers
+_SKIP_LABEL = re.compile(r"^(sub\s*)?total\b|^(bop|eop) market value", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _is_blank(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and value != value:  # NaN
+        return True
+    return str(value).strip().lower() in ("", "none", "nan")
+
+
+class MappingRules:
+    def __init__(self, rules: List[Dict[str, Any]]):
+        """
+        Compile mapping rules into a single matcher.
+
+        Each pattern becomes one named alternative anchored at the start of the label,
+        so one regex pass finds the first rule (in file order) whose pattern matches
+        anywhere in the label, the same answer as trying the rules one by one.
+
+        Args:
+            rules: Entries with pattern, risk_type, greek_type and optional flags
+        """
+        self.rules = rules
+        alternatives = []
+        for index, rule in enumerate(rules):
+            flags = "".join(_INLINE_FLAGS.get(flag.strip().upper(), "")
+                            for flag in str(rule.get("flags") or "").split("|") if flag.strip())
+            scoped = f"(?{flags}:" if flags else "(?:"
+            alternatives.append(f"(?P<r{index}>{scoped}.*?(?:{rule['pattern']})))")
+        self.matcher = re.compile("|".join(alternatives)) if alternatives else None
+
+    @classmethod
+    def from_file(cls, mapping_file: str) -> Optional["MappingRules"]:
+        """
+        Load rules from a mapping.yml file.
+
+        Returns:
+            MappingRules, or None if the file or PyYAML is unavailable
+        """
+        if yaml is None:
+            print("[DEBUG] PyYAML not installed; mapping rules disabled")
+            return None
+        path = Path(mapping_file)
+        if not path.exists():
+            print(f"[DEBUG] Mapping file not found: {path}; mapping rules disabled")
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            rules = yaml.safe_load(f) or []
+        print(f"[DEBUG] Loaded {len(rules)} mapping rules from {path}")
+        return cls(rules)
+
+    def match(self, label: str) -> Optional[Tuple[str, str]]:
+        """
+        Map a row label to (risk_type, greek_type).
+
+        Args:
+            label: Row label as shown in the table
+
+        Returns:
+            Tuple of risk and greek type, or None if no rule matches
+        """
+        if self.matcher is None or not label:
+            return None
+        found = self.matcher.match(label)
+        if found is None:
+            return None
+        rule = self.rules[int(found.lastgroup[1:])]
+        return str(rule.get("risk_type") or ""), str(rule.get("greek_type") or "")
+
+    def split_rows(self, rows: Sequence[Tuple[Any, Any, Any]], constants: Dict[str, str]
+                   ) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, str]]:
+        """
+        Extract every row a rule recognizes and list the rows that still need the LLM.
+
+        Labels are tried as-is, then prefixed with the current section (the last
+        label without values, e.g. "Equity" above "Delta"). Rows without values
+        never produce output, even when a rule matches their label.
+
+        Args:
+            rows: (label, rider value, asset value) per table row, in table order
+            constants: VALUATION_DATE and PRODUCT_TYPE for every emitted row
+
+        Returns:
+            Tuple of (row position -> P&L record, unmatched row position -> label with its section)
+        """
+        matched = {}
+        unmatched = {}
+        section = ""
+        for position, (label, rider, asset) in enumerate(rows):
+            label = "" if _is_blank(label) else _WHITESPACE.sub(" ", str(label)).strip()
+            if not label:
+                continue
+            has_values = not (_is_blank(rider) and _is_blank(asset))
+            if not has_values:
+                # Section header (or a blank total): context for the rows below it
+                if not _SKIP_LABEL.match(label):
+                    section = label
+                continue
+
+            mapping = self.match(label)
+            if mapping is None and section:
+                mapping = self.match(f"{section} {label}")
+            if mapping is not None:
+                try:
+                    matched[position] = coerce_pnl_record({
+                        **constants,
+                        "RISK_TYPE": mapping[0],
+                        "GREEK_TYPE": mapping[1],
+                        "RIDER_VALUE": None if _is_blank(rider) else rider,
+                        "ASSET_VALUE": None if _is_blank(asset) else asset
+                    })
+                    continue
+                except (TypeError, ValueError):
+                    # Unreadable value (OCR noise); let the LLM read the row
+                    pass
+
+            if _SKIP_LABEL.match(label):
+                continue
+            unmatched[position] = f"{section} {label}".strip()
+        return matched, unmatched
+
+
+def _record_key(record: Dict[str, Any]) -> Tuple[str, str]:
+    return str(record.get("RISK_TYPE") or "").lower(), str(record.get("GREEK_TYPE") or "").lower()
+
+
+def _tokens(text: str) -> set:
+    return set(_TOKEN.findall(text.lower()))
+
+
+def _place_by_label(unmatched: Dict[int, str], llm_records: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    Assign each LLM record to the unmatched row whose label shares the most words with
+    its RISK_TYPE/GREEK_TYPE; falls back to table order when a record matches no free label.
+    """
+    placed = {}
+    for record in llm_records:
+        record_tokens = _tokens(" ".join(_record_key(record)))
+        free = [position for position in unmatched if position not in placed]
+        position = max(free, key=lambda p: (len(record_tokens & _tokens(unmatched[p])), -p))
+        if not record_tokens & _tokens(unmatched[position]):
+            return dict(zip(unmatched, llm_records))
+        placed[position] = record
+    return placed
+
+
+def merge_records(matched: Dict[int, Dict[str, Any]], unmatched: Dict[int, str],
+                  llm_records: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Merge rule-extracted rows with the LLM rows for the unmatched positions, in table order.
+
+    LLM rows repeating a (RISK_TYPE, GREEK_TYPE) pair the rules already extracted are
+    dropped; the rest are placed at the unmatched row whose label they match.
+
+    Args:
+        matched: Row position -> record from the mapping rules
+        unmatched: Row position -> label of the rows that were sent to the LLM
+        llm_records: Records the LLM returned for those rows
+
+    Returns:
+        All records in table order, or None when the LLM rows do not correspond one to
+        one with the unmatched rows (the caller then uses a full-table LLM result)
+    """
+    extracted = {_record_key(record) for record in matched.values()}
+    llm_records = [record for record in llm_records if _record_key(record) not in extracted]
+    if len(llm_records) != len(unmatched):
+        print(f"[DEBUG] LLM returned {len(llm_records)} new rows for {len(unmatched)} unmatched rows; "
+              "discarding the mapping rule split")
+        return None
+    placed = {**matched, **_place_by_label(unmatched, llm_records)}
+    return [placed[position] for position in sorted(placed)]
+
+
+def find_value_columns(grid: Sequence[Sequence[Any]]) -> Optional[Tuple[int, int, int]]:
+    """
+    Locate the header row and the Liability (or Rider) and Asset columns of an OCR grid.
+
+    Returns:
+        Tuple of (header row index, rider column, asset column), or None if not found
+    """
+    for row_index, row in enumerate(grid):
+        cells = ["" if _is_blank(cell) else str(cell).strip().lower() for cell in row]
+        rider_col = next((i for i, cell in enumerate(cells) if "liability" in cell), None)
+        if rider_col is None:
+            rider_col = next((i for i, cell in enumerate(cells) if cell == "rider"), None)
+        asset_col = next((i for i, cell in enumerate(cells) if cell.startswith("asset")), None)
+        if rider_col is not None and asset_col is not None and rider_col != asset_col:
+            return row_index, rider_col, asset_col
+    return None
+
+
+def grid_rows(grid: Sequence[Sequence[Any]], rider_col: int, asset_col: int) -> List[Tuple[str, Any, Any]]:
+    """
+    Turn OCR grid rows into (label, rider value, asset value) tuples for split_rows.
+
+    The label is the text of the cells left of the value columns.
+    """
+    label_end = min(rider_col, asset_col)
+    rows = []
+    for row in grid:
+        label = " ".join(str(cell).strip() for cell in row[:label_end] if not _is_blank(cell))
+        rider = row[rider_col] if rider_col < len(row) else None
+        asset = row[asset_col] if asset_col < len(row) else None
+        rows.append((label, rider, asset))
+    return rows
+
+
+# Global instance for the mapping rules
+_mapping_rules = None
+_mapping_loaded = False
+
+def get_mapping_rules() -> Optional[MappingRules]:
+    """Get global mapping rules, or None when rule extraction is disabled or unavailable."""
+    global _mapping_rules, _mapping_loaded
+    if not _mapping_loaded:
+        from src.utils.config_manager import config_manager
+        if config_manager.config.get("processing", {}).get("mapping_rules", True):
+            mapping_file = config_manager.config.get("paths", {}).get("mapping_file", "../mapping.yml")
+            _mapping_rules = MappingRules.from_file(mapping_file)
+        _mapping_loaded = True
+    return _mapping_rules
@@ -0,0 +1,146 @@
+"""
+OCR Service Module
+Long-lived Tesseract engines with their language data loaded once, shared by the
+attachment OCR threads through a queue of idle engines; falls back to a pytesseract
+subprocess per call when the tesserocr binding is not installed
+"""
+
+import os
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import pytesseract
+
+try:
+    from tesserocr import PyTessBaseAPI, PSM
+except ImportError:  # tesserocr is optional; every call starts a tesseract process instead
+    PyTessBaseAPI = None
+
+
+class OcrService:
+    def __init__(self, workers: int = None, lang: str = "eng", tessdata_path: str = None,
+                 backend: str = "auto"):
+        """
+        Initialize the OCR service. Engines are created on first use.
+
+        Args:
+            workers: Maximum number of engines (defaults to the CPU count)
+            lang: Tesseract language(s), e.g. "eng" or "eng+fra"
+            tessdata_path: Directory holding the traineddata files (tesserocr default if None)
+            backend: "auto" (tesserocr when installed), "tesserocr" or "pytesseract"
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.lang = lang
+        self.tessdata_path = tessdata_path
+        self.backend = "pytesseract"
+        if backend in ("auto", "tesserocr") and PyTessBaseAPI is not None:
+            self.backend = "tesserocr"
+        elif backend == "tesserocr":
+            print("[DEBUG] tesserocr is not installed; OCR falls back to pytesseract")
+        if self.workers > 1:
+            # Parallelism comes from concurrent engines (or processes); OpenMP threads inside each
+            # would oversubscribe the cores. Set before the first engine or subprocess starts.
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_engine(self):
+        kwargs = {"lang": self.lang}
+        if self.tessdata_path:
+            kwargs["path"] = self.tessdata_path
+        return PyTessBaseAPI(**kwargs)
+
+    @contextmanager
+    def _engine(self, psm: Optional[int], variables: Dict[str, str]):
+        """Check out an idle engine (creating one while under the limit) set up for one call."""
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.workers
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    api = self._new_engine()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                api = self._idle.get()
+        # Engines are reused, so per-call settings are restored afterwards
+        previous = {name: api.GetVariableAsString(name) for name in variables}
+        try:
+            api.SetPageSegMode(PSM.AUTO if psm is None else psm)
+            for name, value in variables.items():
+                api.SetVariable(name, value)
+            yield api
+        finally:
+            api.Clear()
+            for name, value in previous.items():
+                api.SetVariable(name, value or "")
+            self._idle.put(api)
+
+    @staticmethod
+    def _config(psm: Optional[int], variables: Dict[str, str]) -> str:
+        options = [f"--psm {psm}"] if psm is not None else []
+        options += [f"-c {name}={value}" for name, value in variables.items()]
+        return " ".join(options)
+
+    def image_to_string(self, image, psm: int = None, variables: Dict[str, str] = None) -> str:
+        """
+        Recognize the text of an image.
+
+        Args:
+            image: PIL image
+            psm: Tesseract page segmentation mode (automatic if None)
+            variables: Tesseract variables for this call, e.g. a character whitelist
+
+        Returns:
+            Recognized text
+        """
+        variables = variables or {}
+        if self.backend != "tesserocr":
+            return pytesseract.image_to_string(image, lang=self.lang, config=self._config(psm, variables))
+        with self._engine(psm, variables) as api:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+    def close(self):
+        """Release the idle engines; new ones are created if the service is used again."""
+        while True:
+            try:
+                api = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+            with self._lock:
+                self._created -= 1
+
+
+# Global instance for the OCR service
+_ocr_service = None
+_ocr_service_lock = threading.Lock()
+
+def get_ocr_service() -> OcrService:
+    """Get global OCR service instance."""
+    global _ocr_service
+    with _ocr_service_lock:
+        if _ocr_service is None:
+            from src.utils.config_manager import config_manager
+            settings = config_manager.config.get("processing", {}).get("ocr_service", {})
+            _ocr_service = OcrService(
+                workers=settings.get("workers"),
+                lang=settings.get("lang", "eng"),
+                tessdata_path=settings.get("tessdata_path"),
+                backend=settings.get("backend", "auto")
+            )
+            # Engines hold the language data; release them when the interpreter exits
+            atexit.register(_ocr_service.close)
+            print(f"[DEBUG] OCR service: {_ocr_service.backend}, up to {_ocr_service.workers} engines")
+        return _ocr_service
@@ -0,0 +1,117 @@
+"""
+OpenAI Client Factory Module
+Process-wide OpenAI clients on a tuned keep-alive httpx connection pool, shared by
+the Excel and MSG paths so connections (and TLS sessions) are reused across files
+"""
+
+import asyncio
+import threading
+from typing import Dict, Tuple
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from src.utils.config_manager import config_manager
+from src.utils.async_bridge import register_dispatch_closer
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (installed by httpx[http2])
+        return True
+    except ImportError:
+        return False
+
+
+def _http_settings() -> Tuple[httpx.Limits, httpx.Timeout, bool]:
+    """Build pool limits, timeouts and the HTTP/2 switch from the llm.http config section."""
+    llm_config = config_manager.get_llm_config()
+    http_config = llm_config.get("http", {})
+    # Enough connections for every request the async client may have in flight
+    max_connections = http_config.get("max_connections", max(20, llm_config.get("max_concurrency", 8)))
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=http_config.get("max_keepalive_connections", max_connections),
+        keepalive_expiry=http_config.get("keepalive_expiry_seconds", 120)
+    )
+    timeout = httpx.Timeout(
+        http_config.get("read_timeout_seconds", 120),
+        connect=http_config.get("connect_timeout_seconds", 10),
+        write=http_config.get("write_timeout_seconds", 30),
+        pool=http_config.get("pool_timeout_seconds", 60)
+    )
+    http2 = http_config.get("http2", True) and _http2_available()
+    return limits, timeout, http2
+
+
+_lock = threading.Lock()
+_clients: Dict[tuple, OpenAI] = {}
+_async_clients: Dict[tuple, tuple] = {}
+
+
+def get_openai_client(api_key: str, base_url: str = None) -> OpenAI:
+    """
+    Get the shared synchronous OpenAI client for an API key and endpoint.
+
+    Retries are left to RetryPolicy, so the client itself never retries.
+
+    Args:
+        api_key: OpenAI API key
+        base_url: Optional OpenAI-compatible endpoint
+
+    Returns:
+        OpenAI client backed by the process-wide connection pool
+    """
+    key = (api_key, base_url)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            limits, timeout, http2 = _http_settings()
+            http_client = httpx.Client(limits=limits, timeout=timeout, http2=http2)
+            client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout,
+                            http_client=http_client)
+            _clients[key] = client
+            print(f"[DEBUG] Created shared OpenAI client (http2={http2}, max_connections={limits.max_connections})")
+        return client
+
+
+def get_async_openai_client(api_key: str, base_url: str = None, loop=None) -> AsyncOpenAI:
+    """
+    Get the shared AsyncOpenAI client for an API key, endpoint and event loop.
+
+    Async connections belong to the loop that opened them, so a new client is built
+    when the dispatch loop changes. Its connection pool is closed on that loop when
+    the concurrent run releases it (see async_bridge.close_dispatch_clients).
+
+    Args:
+        api_key: OpenAI API key
+        base_url: Optional OpenAI-compatible endpoint
+        loop: Event loop the client will be used on
+
+    Returns:
+        AsyncOpenAI client backed by a keep-alive connection pool
+    """
+    key = (api_key, base_url)
+    with _lock:
+        entry = _async_clients.get(key)
+        if entry is None or entry[0] is not loop:
+            if entry is not None and entry[0] is not None and entry[0].is_running():
+                # Replaced while its loop still runs: close the old pool there
+                asyncio.run_coroutine_threadsafe(entry[1].close(), entry[0])
+            limits, timeout, http2 = _http_settings()
+            http_client = httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout,
+                                 http_client=http_client)
+            entry = (loop, client)
+            _async_clients[key] = entry
+            if loop is not None:
+                register_dispatch_closer(lambda: _close_async_client(key, client))
+        return entry[1]
+
+
+async def _close_async_client(key: Tuple[str, str], client: AsyncOpenAI) -> None:
+    """Close an async client's connection pool and forget it."""
+    with _lock:
+        if _async_clients.get(key, (None, None))[1] is client:
+            del _async_clients[key]
+    await client.close()
@@ -0,0 +1,85 @@
+"""
+Parsed Message Module
+One parse of an Outlook .msg file shared by the OCR and highlights steps, closed
+deterministically instead of leaving the OLE file handle to the garbage collector
+"""
+
+import os
+import uuid
+from typing import List
+
+import extract_msg
+
+from src.utils.attachment_buffer import AttachmentBuffer
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+class ParsedMessage:
+    def __init__(self, msg_path: str):
+        """
+        Open a .msg file. Use as a context manager, or call close().
+
+        Args:
+            msg_path: Path to the .msg file
+        """
+        self.path = msg_path
+        self.filename = os.path.basename(msg_path)
+        self._msg = extract_msg.Message(msg_path)
+        self._subject = None
+        self._body = None
+        self._attachments = None
+
+    @property
+    def subject(self) -> str:
+        if self._subject is None:
+            self._subject = self._msg.subject or ""
+        return self._subject
+
+    @property
+    def body(self) -> str:
+        """HTML body, falling back to the plain text and RTF bodies, as text."""
+        if self._body is None:
+            msg = self._msg
+            body = getattr(msg, 'htmlBody', None) or msg.body or getattr(msg, 'rtfBody', None) or ""
+            if isinstance(body, bytes):
+                body = body.decode('utf-8', errors='ignore')
+            self._body = body
+        return self._body
+
+    @property
+    def attachments(self) -> List[AttachmentBuffer]:
+        """
+        Image attachments (.png, .jpg, .jpeg) as in-memory buffers.
+
+        Their bytes are read here, so the buffers stay usable after close() and
+        concurrent OCR workers never read the OLE file.
+        """
+        if self._attachments is None:
+            attachments = []
+            for att in self._msg.attachments:
+                # Sanitize filename and handle missing/invalid names
+                filename = att.longFilename or att.shortFilename or f"attachment_{uuid.uuid4().hex}"
+                filename = filename.replace('\x00', '').replace('\0', '')
+                if not filename.strip():
+                    filename = f"attachment_{uuid.uuid4().hex}"
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                attachments.append(AttachmentBuffer(filename, att.data))
+            self._attachments = attachments
+        return self._attachments
+
+    def close(self):
+        """Release the underlying file; properties already read stay available."""
+        msg, self._msg = self._msg, None
+        if msg is not None:
+            msg.close()
+
+    def __enter__(self) -> "ParsedMessage":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"ParsedMessage({self.filename!r})"
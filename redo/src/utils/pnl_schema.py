@@ -0,0 +1,332 @@
+"""
+P&L Schema Module
+JSON schema for the P&L row shape and helpers that turn LLM output into typed records
+"""
+
+import json
+import pandas as pd
+from typing import Any, Dict, List, Optional
+
+PNL_COLUMNS = ["VALUATION_DATE", "PRODUCT_TYPE", "RISK_TYPE", "GREEK_TYPE", "RIDER_VALUE", "ASSET_VALUE"]
+
+# Compact contract: the model returns only these per row; the constant columns are filled locally
+COMPACT_COLUMNS = ["RISK_TYPE", "GREEK_TYPE", "RIDER_VALUE", "ASSET_VALUE"]
+CONSTANT_COLUMNS = ["VALUATION_DATE", "PRODUCT_TYPE"]
+
+PNL_ROW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "VALUATION_DATE": {"type": "string", "description": "YYYYMMDD"},
+        "PRODUCT_TYPE": {"type": "string"},
+        "RISK_TYPE": {"type": "string"},
+        "GREEK_TYPE": {"type": "string", "description": "Empty string when not applicable"},
+        "RIDER_VALUE": {"type": "number"},
+        "ASSET_VALUE": {"type": "number"}
+    },
+    "required": PNL_COLUMNS,
+    "additionalProperties": False
+}
+
+# Structured outputs need an object at the top level, so the rows are wrapped
+PNL_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "pnl_rows",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "rows": {"type": "array", "items": PNL_ROW_SCHEMA}
+            },
+            "required": ["rows"],
+            "additionalProperties": False
+        }
+    }
+}
+
+COMPACT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "pnl_rows_compact",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "rows": {
+                    "type": "array",
+                    "items": {
+                        "type": "array",
+                        "items": {"anyOf": [{"type": "string"}, {"type": "number"}]}
+                    }
+                }
+            },
+            "required": ["rows"],
+            "additionalProperties": False
+        }
+    }
+}
+
+
+
+def multi_sheet_response_format(sheets: List[str], compact: bool = False) -> Dict[str, Any]:
+    """
+    Structured-output format for a multi-sheet prompt: one row array per sheet name.
+
+    Args:
+        sheets: Sheet names, used as the object keys
+        compact: Use compact [risk, greek, rider, asset] rows instead of row objects
+    """
+    if compact:
+        rows_schema = COMPACT_RESPONSE_FORMAT["json_schema"]["schema"]["properties"]["rows"]
+    else:
+        rows_schema = {"type": "array", "items": PNL_ROW_SCHEMA}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "pnl_sheets_compact" if compact else "pnl_sheets",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {sheet: rows_schema for sheet in sheets},
+                "required": list(sheets),
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+_DECODER = json.JSONDecoder()
+
+
+def extract_json(content: str) -> Any:
+    """
+    Decode the first complete JSON array or object in an LLM response.
+
+    Unlike a non-greedy regex this handles nested arrays and brackets inside strings,
+    and ignores any prose or code fences around the JSON.
+
+    Args:
+        content: Raw response content
+
+    Returns:
+        Decoded JSON value, or None if the content holds no JSON array or object
+    """
+    for index, char in enumerate(content):
+        if char in "[{":
+            try:
+                value, _ = _DECODER.raw_decode(content, index)
+                return value
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+def _to_float(value: Any) -> float:
+    if value is None or value == "" or value == "-":
+        return 0.0
+    if isinstance(value, str):
+        value = value.replace(",", "").strip()
+        if value.startswith("(") and value.endswith(")"):
+            value = "-" + value[1:-1]
+    return float(value)
+
+
+def coerce_pnl_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalize one P&L row to the schema types.
+
+    Args:
+        row: Row dictionary keyed by PNL_COLUMNS
+
+    Returns:
+        Row with string labels and float values
+    """
+    return {
+        "VALUATION_DATE": str(row.get("VALUATION_DATE") or ""),
+        "PRODUCT_TYPE": str(row.get("PRODUCT_TYPE") or ""),
+        "RISK_TYPE": str(row.get("RISK_TYPE") or ""),
+        "GREEK_TYPE": str(row.get("GREEK_TYPE") or ""),
+        "RIDER_VALUE": _to_float(row.get("RIDER_VALUE")),
+        "ASSET_VALUE": _to_float(row.get("ASSET_VALUE"))
+    }
+
+
+def parse_pnl_records(content: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Parse a structured-output response into typed P&L records.
+
+    Args:
+        content: Raw response content ({"rows": [...]} or a bare array)
+
+    Returns:
+        List of records, or None if the content does not match the schema
+    """
+    try:
+        data = extract_json(content)
+        rows = data.get("rows") if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            print("Structured LLM response has no rows array")
+            return None
+        return [coerce_pnl_record(row) for row in rows]
+    except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+        print(f"Structured LLM response does not match the P&L schema: {e}")
+        return None
+
+
+def parse_compact_records(content: str, constants: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Parse a compact response (header row plus [risk, greek, rider, asset] rows).
+
+    The header, when present, decides the column order, so a model that reorders the
+    columns still parses correctly.
+
+    Args:
+        content: Raw response content: a JSON array of arrays, or {"rows": [...]}
+        constants: VALUATION_DATE and PRODUCT_TYPE values to fill into every row
+
+    Returns:
+        List of records, or None if the content does not follow the compact contract
+    """
+    data = extract_json(content)
+    rows = data.get("rows") if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        print("Compact LLM response is not an array of rows")
+        return None
+
+    decoder = PnlRowDecoder(constants)
+    try:
+        return [record for record in map(decoder.decode, rows) if record is not None]
+    except (TypeError, ValueError) as e:
+        print(f"Compact LLM response does not follow the compact contract: {e}")
+        return None
+
+
+def parse_sheet_records(content: str, sheet_constants: Dict[str, Optional[Dict[str, str]]]
+                        ) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Parse a multi-sheet response ({"WB": [...], "DBIB": [...]}) into records per sheet.
+
+    Args:
+        content: Raw response content
+        sheet_constants: Sheet name to its compact constants, or to None for six-key row objects
+
+    Returns:
+        Records keyed by sheet name, or None if any sheet is missing or malformed
+    """
+    data = extract_json(content)
+    if not isinstance(data, dict):
+        print("Multi-sheet LLM response is not a JSON object")
+        return None
+
+    records = {}
+    for sheet, constants in sheet_constants.items():
+        rows = data.get(sheet)
+        if not isinstance(rows, list):
+            print(f"Multi-sheet LLM response has no rows for sheet {sheet}")
+            return None
+        decoder = PnlRowDecoder(constants)
+        try:
+            records[sheet] = [record for record in map(decoder.decode, rows) if record is not None]
+        except (TypeError, ValueError) as e:
+            print(f"Multi-sheet LLM response has malformed rows for sheet {sheet}: {e}")
+            return None
+    return records
+
+
+class PnlRowDecoder:
+    """
+    Turns response rows into typed records one at a time, so streamed rows can be
+    checked as they arrive.
+    """
+
+    # Keys a full-contract row must carry to be usable
+    REQUIRED_KEYS = {"RISK_TYPE", "RIDER_VALUE", "ASSET_VALUE"}
+
+    def __init__(self, constants: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            constants: VALUATION_DATE/PRODUCT_TYPE for compact rows; None for six-key row objects
+        """
+        self.constants = constants
+        self.columns = COMPACT_COLUMNS
+        self.first_row = True
+
+    def decode(self, row: Any) -> Optional[Dict[str, Any]]:
+        """
+        Decode one row.
+
+        Returns:
+            Typed record, or None for the compact header row
+
+        Raises:
+            ValueError: If the row does not follow the expected contract
+        """
+        first_row, self.first_row = self.first_row, False
+        if self.constants is None:
+            if not isinstance(row, dict) or not self.REQUIRED_KEYS <= set(row):
+                raise ValueError(f"row does not match the P&L schema: {row}")
+            return coerce_pnl_record(row)
+
+        if not isinstance(row, list):
+            raise ValueError(f"compact row is not an array: {row}")
+        if first_row and all(isinstance(cell, str) for cell in row) \
+                and sorted(cell.upper() for cell in row) == sorted(COMPACT_COLUMNS):
+            # The header decides the column order
+            self.columns = [cell.upper() for cell in row]
+            return None
+        if len(row) != len(self.columns):
+            raise ValueError(f"compact row has {len(row)} fields, expected {len(self.columns)}: {row}")
+        return coerce_pnl_record({**self.constants, **dict(zip(self.columns, row))})
+
+
+def records_to_dataframe(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Build a DataFrame with the standard P&L column order."""
+    return pd.DataFrame(records, columns=PNL_COLUMNS)
+
+
+def is_total_label(value: Any) -> bool:
+    """Check whether a cell marks a total/subtotal row (HY_Total is a risk type, not a total)."""
+    text = str(value).lower()
+    return "total" in text and "hy_total" not in text
+
+
+def filter_total_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop total/subtotal rows the model returned despite the prompt.
+
+    Rows are judged by RISK_TYPE when the column exists, otherwise by every cell.
+    """
+    if df.empty:
+        return df
+    if "RISK_TYPE" in df.columns:
+        mask = ~df["RISK_TYPE"].apply(is_total_label)
+    else:
+        mask = ~df.apply(lambda row: any(is_total_label(value) for value in row), axis=1)
+    return df[mask].reset_index(drop=True)
+
+
+class RowCollector:
+    """
+    on_row callback that keeps the usable rows of an answer as they arrive.
+
+    Total rows are dropped on arrival, so the table is already filtered when a
+    streamed answer ends. A retried stream starts again from index 0, which
+    discards the rows of the aborted attempt.
+    """
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+
+    def __call__(self, index: int, record: Dict[str, Any]) -> None:
+        if index == 0:
+            self.records = []
+        if not is_total_label(record.get("RISK_TYPE")):
+            self.records.append(record)
+
+    @classmethod
+    def collect(cls, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Filter the rows of an answer that was not delivered row by row."""
+        collector = cls()
+        for index, record in enumerate(records):
+            collector(index, record)
+        return collector.records
@@ -0,0 +1,193 @@
+"""
+Rate Limiter Module
+Token-bucket request quota (requests/min and tokens/min) shared by every worker
+process through a locked state file
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from src.utils.hedging import DeadlineExceeded
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    Hold an exclusive cross-process lock on a lock file.
+
+    Args:
+        lock_path: Path of the lock file (created if missing)
+    """
+    with open(lock_path, "a+") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SharedRateLimiter:
+    def __init__(self, state_file: str, requests_per_minute: float = 500, tokens_per_minute: float = 30000):
+        """
+        Initialize shared rate limiter.
+
+        Args:
+            state_file: JSON file holding the bucket levels; every process using the
+                same file draws from the same quota
+            requests_per_minute: Request quota per minute
+            tokens_per_minute: Token quota per minute
+        """
+        self.state_file = Path(state_file)
+        self.lock_file = self.state_file.with_suffix(".lock")
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+
+    def _locked(self):
+        """Hold an exclusive cross-process lock on the state file."""
+        return file_lock(self.lock_file)
+
+    def _load_state(self, now: float) -> dict:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        return {
+            "requests": state.get("requests", self.requests_per_minute),
+            "tokens": state.get("tokens", self.tokens_per_minute),
+            "updated": state.get("updated", now),
+            "blocked_until": state.get("blocked_until", 0.0)
+        }
+
+    def _save_state(self, state: dict) -> None:
+        tmp_path = self.state_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_file)
+
+    def _refill(self, state: dict, now: float) -> None:
+        elapsed = max(0.0, now - state["updated"])
+        state["requests"] = min(self.requests_per_minute,
+                                state["requests"] + elapsed * self.requests_per_minute / 60.0)
+        state["tokens"] = min(self.tokens_per_minute,
+                              state["tokens"] + elapsed * self.tokens_per_minute / 60.0)
+        state["updated"] = now
+
+    def _reserve(self, tokens: int) -> float:
+        """
+        Try to take one request and `tokens` tokens from the buckets.
+
+        Returns:
+            0 if the quota was taken, otherwise seconds to wait before retrying
+        """
+        # A single request larger than the whole bucket could never be admitted
+        tokens = min(float(tokens), self.tokens_per_minute)
+        with self._locked():
+            now = time.time()
+            state = self._load_state(now)
+            self._refill(state, now)
+
+            if state["blocked_until"] > now:
+                wait = state["blocked_until"] - now
+            elif state["requests"] >= 1 and state["tokens"] >= tokens:
+                state["requests"] -= 1
+                state["tokens"] -= tokens
+                wait = 0.0
+            else:
+                request_wait = max(0.0, (1 - state["requests"]) * 60.0 / self.requests_per_minute)
+                token_wait = max(0.0, (tokens - state["tokens"]) * 60.0 / self.tokens_per_minute)
+                wait = max(request_wait, token_wait)
+
+            self._save_state(state)
+        return wait
+
+    @staticmethod
+    def _check_deadline(wait: float, deadline: Optional[float]) -> None:
+        if deadline is not None and time.monotonic() + wait >= deadline:
+            raise DeadlineExceeded(f"Rate limit quota not available for {wait:.1f}s, past the call deadline")
+
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None) -> None:
+        """
+        Block until the quota admits one request of the given token size.
+
+        Args:
+            tokens: Token cost charged against the tokens/min bucket
+            deadline: Optional time.monotonic() value; waiting past it raises DeadlineExceeded
+        """
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            self._check_deadline(wait, deadline)
+            # Small jitter keeps waiting processes from waking in lockstep
+            time.sleep(min(wait, 5.0) + random.uniform(0, 0.05))
+
+    async def acquire_async(self, tokens: int = 0, deadline: Optional[float] = None) -> None:
+        """
+        Async version of acquire.
+
+        The file lock and state file I/O run in a worker thread, so a lock held by
+        another process does not stall the event loop.
+        """
+        while True:
+            wait = await asyncio.to_thread(self._reserve, tokens)
+            if wait <= 0:
+                return
+            self._check_deadline(wait, deadline)
+            await asyncio.sleep(min(wait, 5.0) + random.uniform(0, 0.05))
+
+    def block_for(self, seconds: float) -> None:
+        """
+        Pause the shared quota for every process, e.g. after a 429.
+
+        Args:
+            seconds: How long no new request may start
+        """
+        with self._locked():
+            now = time.time()
+            state = self._load_state(now)
+            self._refill(state, now)
+            state["blocked_until"] = max(state["blocked_until"], now + seconds)
+            self._save_state(state)
+
+    async def block_for_async(self, seconds: float) -> None:
+        """Async version of block_for; the locked file update runs in a worker thread."""
+        await asyncio.to_thread(self.block_for, seconds)
+
+
+# Global instance shared by the LLM clients in this process
+_rate_limiter = None
+
+def get_rate_limiter() -> SharedRateLimiter:
+    """Get global rate limiter instance."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        from src.utils.config_manager import config_manager
+        limit_config = config_manager.get_rate_limit_config()
+        _rate_limiter = SharedRateLimiter(
+            limit_config.get("state_file", ".cache/openai_quota.json"),
+            requests_per_minute=limit_config.get("requests_per_minute", 500),
+            tokens_per_minute=limit_config.get("tokens_per_minute", 30000)
+        )
+    return _rate_limiter
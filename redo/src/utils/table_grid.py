@@ -0,0 +1,122 @@
+"""
+Table Grid Module
+Cell grids of Azure layout tables, built once per table and scored with precompiled
+keyword patterns to pick the P&L table; text renderings are produced on demand
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from src.utils.table_serializer import serialize_table
+
+# Column pairs of the P&L table; only the first pair found scores
+_COLUMN_RULES = (
+    (re.compile(r"liability"), re.compile(r"asset"), 100, "Liability+Asset columns"),
+    (re.compile(r"rider"), re.compile(r"asset"), 90, "Rider+Asset columns"),
+)
+# (pattern, points, reason) for content anywhere in the table
+_KEYWORD_RULES = (
+    (re.compile(r"p&(?:amp;)?l"), 50, "P&L reference"),
+    (re.compile(r"equity|interest rate|credit"), 30, "risk categories"),
+)
+
+
+class TableGrid:
+    def __init__(self, cells: List[List[Optional[str]]], index: int = 0):
+        """
+        Wrap a table's cell contents.
+
+        Args:
+            cells: Rows of cell contents (None for empty cells)
+            index: Position of the table in the analyze result
+        """
+        self.cells = cells
+        self.index = index
+        self.row_count = len(cells)
+        self.column_count = len(cells[0]) if cells else 0
+        self._content = None
+        self._text = None
+        self._prompt_text = None
+
+    @classmethod
+    def from_layout_table(cls, table, index: int = 0) -> "TableGrid":
+        """Build the grid of one Azure layout table (row_count, column_count, cells)."""
+        cells = [[None] * table.column_count for _ in range(table.row_count)]
+        for cell in table.cells:
+            cells[cell.row_index][cell.column_index] = cell.content
+        return cls(cells, index)
+
+    @property
+    def content(self) -> str:
+        """Tab-separated cell text, lowercased for keyword scoring."""
+        if self._content is None:
+            self._content = "\n".join("\t".join(cell or "" for cell in row) for row in self.cells).lower()
+        return self._content
+
+    def score(self) -> Tuple[int, List[str]]:
+        """
+        Score how likely this is the P&L table.
+
+        Returns:
+            Tuple of (score, reasons)
+        """
+        content = self.content
+        score, reasons = 0, []
+        for first, second, points, reason in _COLUMN_RULES:
+            if first.search(content) and second.search(content):
+                score += points
+                reasons.append(f"{reason} (+{points})")
+                break
+        for pattern, points, reason in _KEYWORD_RULES:
+            if pattern.search(content):
+                score += points
+                reasons.append(f"{reason} (+{points})")
+        # P&L tables are typically large and wide
+        if self.row_count >= 10:
+            score += 20
+            reasons.append(f"{self.row_count} rows (+20)")
+        if self.column_count >= 4:
+            score += 10
+            reasons.append(f"{self.column_count} cols (+10)")
+        return score, reasons
+
+    @property
+    def text(self) -> str:
+        """Padded rendering (DataFrame.to_string) parsed by the validation step."""
+        if self._text is None:
+            self._text = pd.DataFrame(self.cells).to_string(index=False)
+        return self._text
+
+    @property
+    def prompt_text(self) -> str:
+        """Compact rendering for the LLM prompt."""
+        if self._prompt_text is None:
+            self._prompt_text = serialize_table(self.cells)
+        return self._prompt_text
+
+
+def select_table(tables) -> Optional[TableGrid]:
+    """
+    Build every layout table's grid once and return the highest scoring one.
+
+    Ties keep the earliest table.
+
+    Args:
+        tables: Azure layout tables
+
+    Returns:
+        The selected TableGrid, or None when there are no tables
+    """
+    best, best_score = None, None
+    for i, table in enumerate(tables or []):
+        grid = TableGrid.from_layout_table(table, i)
+        score, reasons = grid.score()
+        print(f"[DEBUG] Table {i}: {grid.row_count}x{grid.column_count}, score {score}"
+              f"{' - ' + ', '.join(reasons) if reasons else ''}")
+        if best is None or score > best_score:
+            best, best_score = grid, score
+    if best is not None:
+        print(f"[DEBUG] Selected table {best.index} with score {best_score}")
+    return best
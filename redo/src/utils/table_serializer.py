@@ -0,0 +1,109 @@
+"""
+Table Serializer Module
+Compact, token-efficient table text for LLM prompts plus a local token estimator
+"""
+
+import math
+import re
+from typing import Any, List
+
+import pandas as pd
+
+from src.utils.pnl_schema import CONSTANT_COLUMNS
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to a character heuristic
+    _ENCODING = None
+
+_NULL_STRINGS = {"", "none", "nan", "nat", "null"}
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _clean_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    text = _WHITESPACE.sub(" ", str(value)).strip()
+    return "" if text.lower() in _NULL_STRINGS else text
+
+
+def _format_rows(rows: List[List[str]], fmt: str, has_header: bool) -> str:
+    if fmt == "markdown":
+        lines = ["| " + " | ".join(cell.replace("|", "\\|") for cell in row) + " |" for row in rows]
+        if has_header and lines:
+            lines.insert(1, "|" + "---|" * len(rows[0]))
+        return "\n".join(lines)
+    return "\n".join("\t".join(row) for row in rows)
+
+
+def serialize_table(table, fmt: str = "tsv", hoist_constants: bool = True) -> str:
+    """
+    Serialize a DataFrame or a list-of-lists grid for an LLM prompt.
+
+    Empty rows, and columns blank in both header and data, are dropped; a named
+    column with no values stays, so the model sees which value is missing. Null
+    cells become empty strings and cell whitespace is collapsed. For DataFrames, the VALUATION_DATE/PRODUCT_TYPE columns
+    are written once as "NAME: value" lines above the table when they hold a single
+    value on every row; value columns always stay in the table.
+
+    Args:
+        table: pandas DataFrame, or a grid of cells (rows of values)
+        fmt: "tsv" (default) or "markdown"
+        hoist_constants: Move constant VALUATION_DATE/PRODUCT_TYPE columns above the table
+
+    Returns:
+        Compact table text
+    """
+    preamble = []
+    if isinstance(table, pd.DataFrame):
+        header = [_clean_cell(col) for col in table.columns]
+        rows = [[_clean_cell(value) for value in row] for row in table.itertuples(index=False)]
+        # Default integer column labels carry no information
+        has_header = not isinstance(table.columns, pd.RangeIndex)
+    else:
+        header = []
+        rows = [[_clean_cell(value) for value in row] for row in table]
+        has_header = False
+
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    header = header + [""] * (width - len(header))
+    keep = [i for i in range(width) if (has_header and header[i]) or any(row[i] for row in rows)]
+
+    if has_header and hoist_constants and len(rows) > 1:
+        constant = [i for i in keep if header[i] in CONSTANT_COLUMNS and len({row[i] for row in rows}) == 1]
+        preamble = [f"{header[i]}: {rows[0][i]}" for i in constant]
+        keep = [i for i in keep if i not in constant]
+
+    body = [[row[i] for i in keep] for row in rows]
+    if has_header:
+        body.insert(0, [header[i] for i in keep])
+
+    text = _format_rows(body, fmt, has_header)
+    return "\n".join(preamble + [text]) if preamble else text
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of a prompt without calling the API.
+
+    Uses tiktoken when it is installed, otherwise roughly four characters per token.
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        Estimated number of tokens
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
@@ -0,0 +1,74 @@
+"""
+Usage Stats Module
+Token usage counters for LLM calls, including the prompt tokens the provider served
+from its prompt prefix cache and the latency of calls with and without cache hits
+"""
+
+import threading
+from typing import Any, Dict
+
+
+class UsageStats:
+    def __init__(self):
+        """Initialize empty counters."""
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cached_calls = 0
+        self.cached_seconds = 0.0
+        self.uncached_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, usage, seconds: float = 0.0) -> int:
+        """
+        Add one completion's usage.
+
+        Args:
+            usage: The response's usage object (None when the provider sent none)
+            seconds: Request latency
+
+        Returns:
+            Number of cached prompt tokens in this call
+        """
+        if usage is None:
+            return 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", 0) or 0
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+            self.cached_tokens += cached
+            if cached:
+                self.cached_calls += 1
+                self.cached_seconds += seconds
+            else:
+                self.uncached_seconds += seconds
+        print(f"[DEBUG] Prompt tokens: {getattr(usage, 'prompt_tokens', 0)} ({cached} cached), {seconds:.1f}s")
+        return cached
+
+    def stats(self) -> Dict[str, Any]:
+        """Get usage counters, the cached share of prompt tokens and mean latencies."""
+        with self._lock:
+            uncached_calls = self.calls - self.cached_calls
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_share": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                "cached_latency": self.cached_seconds / self.cached_calls if self.cached_calls else None,
+                "uncached_latency": self.uncached_seconds / uncached_calls if uncached_calls else None
+            }
+
+
+# Global instance for usage stats
+_usage_stats = None
+
+def get_usage_stats() -> UsageStats:
+    """Get global usage stats instance."""
+    global _usage_stats
+    if _usage_stats is None:
+        _usage_stats = UsageStats()
+    return _usage_stats
@@ -0,0 +1,236 @@
+"""
+Vision Cache Module
+Persistent table-type classifications keyed on the exact image hash and a
+perceptual hash, so re-sent report images skip the vision model call; both
+indexes are capped and evict their least recently used entries
+"""
+
+import io
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+from src.utils.rate_limiter import file_lock
+
+# Only definite answers are worth remembering
+CACHEABLE_LABELS = ("blue", "red")
+# Red/blue difference (0-255) a grid cell needs before it counts as red or blue, above JPEG noise
+CHROMA_MARGIN = 24
+
+
+def color_dhash(image_bytes: bytes, hash_size: int = 8) -> str:
+    """
+    Difference hash computed separately on the R, G and B channels, plus chroma bits.
+
+    Gradients alone cannot tell a blue header from a red one with the same layout
+    (both get lighter towards white text), so every cell of the grid also records
+    whether red or blue clearly dominates it.
+
+    Args:
+        image_bytes: Encoded image data
+        hash_size: Grid size; each channel contributes hash_size * hash_size bits
+
+    Returns:
+        Hex string of 5 * hash_size^2 bits
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        rgb = image.convert("RGB")
+        small = rgb.resize((hash_size + 1, hash_size), Image.LANCZOS)
+        cells = rgb.resize((hash_size, hash_size), Image.BOX)
+    value = 0
+    for channel in small.split():
+        pixels = list(channel.getdata())
+        for row in range(hash_size):
+            for col in range(hash_size):
+                left = pixels[row * (hash_size + 1) + col]
+                right = pixels[row * (hash_size + 1) + col + 1]
+                value = (value << 1) | (1 if left > right else 0)
+    for red, _, blue in cells.getdata():
+        value = (value << 2) | (2 if red > blue + CHROMA_MARGIN else 0) | (1 if blue > red + CHROMA_MARGIN else 0)
+    return f"{value:0{5 * hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    """Number of differing bits between two hex hashes."""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def _touch(entries: Dict, key: str) -> None:
+    """Move an entry to the most recently used end (dicts keep insertion order)."""
+    entries[key] = entries.pop(key)
+
+
+def _evict(entries: Dict, max_entries: int) -> None:
+    """Drop the least recently used entries above max_entries."""
+    while len(entries) > max_entries:
+        del entries[next(iter(entries))]
+
+
+class VisionCache:
+    def __init__(self, index_file: str, max_distance: int = 12, enabled: bool = True,
+                 max_entries: int = 5000):
+        """
+        Initialize vision classification cache.
+
+        Args:
+            index_file: JSON file holding the exact and perceptual indexes
+            max_distance: Largest Hamming distance between perceptual hashes that counts as the same image
+            enabled: When False, every lookup misses and nothing is written
+            max_entries: Cap on each index; the perceptual lookup scans at most this many hashes
+        """
+        self.index_file = Path(index_file)
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = {}
+        return {"exact": index.get("exact", {}), "perceptual": index.get("perceptual", {})}
+
+    def _entries(self) -> Dict:
+        if self._index is None:
+            self._index = self._load()
+        return self._index
+
+    def lookup(self, image_bytes: bytes) -> Optional[str]:
+        """
+        Get the stored classification for an image.
+
+        Args:
+            image_bytes: Encoded image data
+
+        Returns:
+            'blue' or 'red', or None on a miss
+        """
+        if not self.enabled:
+            return None
+        sha = hashlib.sha256(image_bytes).hexdigest()
+        with self._lock:
+            index = self._entries()
+            label = index["exact"].get(sha)
+            if label is not None:
+                _touch(index["exact"], sha)
+                self.exact_hits += 1
+                print(f"[DEBUG] Vision cache exact hit: {label}")
+                return label
+
+        # Hashing decodes the image; other threads keep using the cache meanwhile
+        try:
+            phash = color_dhash(image_bytes)
+        except Exception as e:
+            print(f"[DEBUG] Could not hash image for vision cache: {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            index = self._entries()
+            # Nearest stored image; conflicting labels at the same distance count as a miss
+            best_distance, best_labels, best_hash = None, set(), None
+            for stored_hash, stored_label in index["perceptual"].items():
+                if len(stored_hash) != len(phash):
+                    # Written by an older hash layout; evicted as it ages out
+                    continue
+                distance = hamming_distance(phash, stored_hash)
+                if distance > self.max_distance:
+                    continue
+                if best_distance is None or distance < best_distance:
+                    best_distance, best_labels, best_hash = distance, {stored_label}, stored_hash
+                elif distance == best_distance:
+                    best_labels.add(stored_label)
+
+            if len(best_labels) == 1:
+                label = best_labels.pop()
+                self.perceptual_hits += 1
+                _touch(index["perceptual"], best_hash)
+                index["exact"][sha] = label
+                _evict(index["exact"], self.max_entries)
+                print(f"[DEBUG] Vision cache perceptual hit (distance {best_distance}): {label}")
+                return label
+
+            self.misses += 1
+            return None
+
+    def store(self, image_bytes: bytes, label: str) -> None:
+        """
+        Remember the classification of an image.
+
+        Args:
+            image_bytes: Encoded image data
+            label: Classification result; only 'blue' and 'red' are stored
+        """
+        if not self.enabled or label not in CACHEABLE_LABELS:
+            return
+        sha = hashlib.sha256(image_bytes).hexdigest()
+        try:
+            phash = color_dhash(image_bytes)
+        except Exception:
+            phash = None
+
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        # Thread lock for this process, file lock so other processes' writes are not lost
+        with self._lock, file_lock(self.index_file.with_suffix(".lock")):
+            # Merge with entries other processes wrote since this one loaded the index;
+            # this process's entries are re-inserted so its recent use order wins
+            index = self._load()
+            entries = self._entries()
+            for name in ("exact", "perceptual"):
+                for key, value in entries[name].items():
+                    index[name].pop(key, None)
+                    index[name][key] = value
+            index["exact"].pop(sha, None)
+            index["exact"][sha] = label
+            if phash is not None:
+                index["perceptual"].pop(phash, None)
+                index["perceptual"][phash] = label
+            _evict(index["exact"], self.max_entries)
+            _evict(index["perceptual"], self.max_entries)
+            self._index = index
+
+            tmp_path = self.index_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_file)
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters for monitoring."""
+        lookups = self.exact_hits + self.perceptual_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.perceptual_hits) / lookups if lookups else 0.0,
+            "enabled": self.enabled
+        }
+
+
+# Global instance for table-type classifications
+_vision_cache = None
+
+def get_vision_cache() -> VisionCache:
+    """Get global vision classification cache instance."""
+    global _vision_cache
+    if _vision_cache is None:
+        from src.utils.config_manager import config_manager
+        cache_config = config_manager.get_cache_config()
+        _vision_cache = VisionCache(
+            cache_config.get("vision_cache_file", ".cache/vision_labels.json"),
+            max_distance=cache_config.get("vision_hash_distance", 12),
+            enabled=cache_config.get("enabled", True),
+            max_entries=cache_config.get("vision_cache_max_entries", 5000)
+        )
+    return _vision_cache
@@ -1,13 +1,14 @@
 import os
 import json
-import toml
-import re
 import pandas as pd
-from openai import OpenAI
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
 from src.processors.excel_processor import ExcelProcessor
-from prompts.excel_prompts import get_llm_prompt
+from src.utils.llm_client import get_llm_client
+from src.utils.pnl_schema import records_to_dataframe, extract_json, filter_total_rows, RowCollector, CONSTANT_COLUMNS
+from src.utils.table_serializer import serialize_table
+from src.utils.mapping_rules import get_mapping_rules, merge_records
+from prompts.excel_prompts import get_llm_prompt, get_multi_sheet_llm_prompt, PROMPT_VERSION
 
 class ExcelWorkflowNode:
     def __init__(self, config_path="config/config.json", secrets_path="config/secrets.toml"):
@@ -15,62 +16,256 @@ class ExcelWorkflowNode:
         with open(config_path, "r") as f:
             self.config = json.load(f)
         
-        # Load secrets
-        self.secrets = toml.load(secrets_path)
-        
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=self.secrets["openai"]["api_key"])
-        self.model = self.secrets["openai"]["model"]
+        # Shared LLM client (model, API key and response cache come from secrets/config)
+        self.llm_client = get_llm_client()
+        self.system_prompt = "You are a data analysis expert that helps transform and organize Excel data. Always return valid JSON arrays."
         
         # Get settings from config
         self.default_sheets = self.config.get("default_sheets", ["WB", "DBIB"])
         self.output_dir = self.config.get("paths", {}).get("output_dir", "data/output")
+        # Send all cleaned sheets of a workbook in one request instead of one per sheet
+        self.multi_sheet = self.config.get("processing", {}).get("excel_multi_sheet", False)
+        # mapping.yml rules extract recognized rows without the LLM (None when disabled)
+        self.mapping_rules = get_mapping_rules()
         
         # Create output directory
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def process_with_llm(self, df):
-        """Process DataFrame with LLM using the same logic as llm_api.py."""
-        data_str = df.to_string()
-        prompt = get_llm_prompt(data_str)
+    def title_constants(self, df):
+        """Get the VALUATION_DATE/PRODUCT_TYPE values the processor found in the sheet title, or None."""
+        if df.empty or not all(col in df.columns for col in CONSTANT_COLUMNS):
+            return None
+        constants = {col: str(df[col].iloc[0]) for col in CONSTANT_COLUMNS}
+        return constants if all(value not in ("", "None", "nan") for value in constants.values()) else None
+
+    def compact_constants(self, df):
+        """
+        Get the constant columns for the compact output contract.
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a data analysis expert that helps transform and organize Excel data. Always return valid JSON arrays."},
-                    {"role": "user", "content": prompt}
-                ]
+        Returns:
+            Dictionary of constant columns, or None to use the full output contract
+        """
+        if not self.llm_client.compact_output:
+            return None
+        return self.title_constants(df)
+
+    def apply_mapping_rules(self, cleaned_sheets):
+        """
+        Extract the rows the mapping.yml rules recognize and keep the rest for the LLM.
+        
+        Sheets whose title gave no date/product type are left entirely to the LLM.
+        Unmatched rows are sent with their section label rows so the model keeps the context.
+        
+        Returns:
+            Tuple of (sheet -> (matched records by row, unmatched row labels), sheet -> DataFrame for the LLM)
+        """
+        rule_splits = {}
+        llm_sheets = dict(cleaned_sheets)
+        if self.mapping_rules is None:
+            return rule_splits, llm_sheets
+        
+        for sheet, df in cleaned_sheets.items():
+            constants = self.title_constants(df)
+            if constants is None or "Risk Type & Greeks" not in df.columns:
+                continue
+            values = [df[col] if col in df.columns else [None] * len(df) for col in ("Liability", "Asset")]
+            matched, unmatched = self.mapping_rules.split_rows(
+                list(zip(df["Risk Type & Greeks"], *values)), constants
             )
-            transformed_data = response.choices[0].message.content.strip()
-            json_match = re.search(r'(\[.*?\])', transformed_data, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
+            if not matched:
+                continue
+            rule_splits[sheet] = (matched, unmatched)
+            print(f"[DEBUG] {sheet}: {len(matched)} rows from mapping rules, {len(unmatched)} rows need the LLM")
+            if unmatched:
+                remaining = [position for position in range(len(df)) if position not in matched]
+                llm_sheets[sheet] = df.iloc[remaining].reset_index(drop=True)
             else:
-                print("No JSON array found in LLM response.")
-                return None
-            data = json.loads(json_str)
-            if not isinstance(data, list):
-                raise ValueError("LLM response is not a JSON array")
-            df_llm = pd.DataFrame(data)
-            # --- POST-PROCESSING FILTER ---
-            # Remove rows where RISK_TYPE or label contains 'Total' (except 'HY_Total')
-            def is_valid_row(row):
-                for col in row.index:
-                    val = str(row[col]).lower()
-                    if 'total' in val and 'hy_total' not in val:
-                        return False
-                return True
-            if 'RISK_TYPE' in df_llm.columns:
-                mask = df_llm['RISK_TYPE'].apply(lambda x: ('total' not in str(x).lower()) or ('hy_total' in str(x).lower()))
-                df_llm = df_llm[mask]
+                del llm_sheets[sheet]
+        return rule_splits, llm_sheets
+
+    def _sheet_result(self, sheet, rule_splits, llm_results):
+        """
+        Combine the mapping rule rows and LLM rows of a sheet.
+        
+        Returns:
+            Tuple of (DataFrame, or None if the sheet has no result; True if the partial
+            LLM answer does not line up with the rows the rules left over)
+        """
+        llm_df = llm_results.get(sheet)
+        if sheet not in rule_splits:
+            return llm_df, False
+        matched, unmatched = rule_splits[sheet]
+        if unmatched and llm_df is None:
+            return None, False
+        llm_records = llm_df.to_dict("records") if unmatched else []
+        records = merge_records(matched, unmatched, llm_records)
+        if records is None:
+            return None, True
+        return filter_total_rows(records_to_dataframe(records)), False
+
+    def build_prompt(self, df, constants=None, partial=False):
+        """
+        Build the LLM prompt for a cleaned sheet (compact contract when constants are known).
+        
+        partial=True marks a sheet reduced to the rows the mapping rules did not extract.
+        """
+        if constants is not None:
+            # The model does not need columns that are filled in locally
+            df = df.drop(columns=CONSTANT_COLUMNS)
+        data_str = serialize_table(df)
+        return get_llm_prompt(data_str, compact=constants is not None, partial=partial)
+
+    def build_multi_sheet_prompt(self, cleaned_sheets, partial_sheets=()):
+        """
+        Build one prompt for several cleaned sheets.
+        
+        Args:
+            cleaned_sheets: Sheet name -> cleaned DataFrame
+            partial_sheets: Sheets reduced to the rows the mapping rules did not extract
+        
+        Returns:
+            Tuple of (prompt, sheet name -> compact constants or None, expected output rows)
+        """
+        sheet_constants = {sheet: self.compact_constants(df) for sheet, df in cleaned_sheets.items()}
+        # One contract for the whole response: compact only if every sheet title was parsed
+        if not all(constants is not None for constants in sheet_constants.values()):
+            sheet_constants = {sheet: None for sheet in cleaned_sheets}
+        compact = all(constants is not None for constants in sheet_constants.values())
+        
+        sheet_data = {}
+        for sheet, df in cleaned_sheets.items():
+            if compact:
+                df = df.drop(columns=CONSTANT_COLUMNS)
+            sheet_data[sheet] = serialize_table(df)
+        # One header row per sheet in compact output
+        expected_rows = sum(len(df) + 1 for df in cleaned_sheets.values())
+        prompt = get_multi_sheet_llm_prompt(sheet_data, compact=compact, partial_sheets=partial_sheets)
+        return prompt, sheet_constants, expected_rows
+
+    def process_sheets_with_llm(self, cleaned_sheets, partial_sheets=()):
+        """
+        Process several cleaned sheets with a single LLM request.
+        
+        Returns:
+            Dictionary of sheet name to filtered DataFrame, or None on failure
+        """
+        prompt, sheet_constants, expected_rows = self.build_multi_sheet_prompt(cleaned_sheets, partial_sheets)
+        records = self.llm_client.process_sheets(
+            prompt, sheet_constants, PROMPT_VERSION, self.system_prompt, expected_rows=expected_rows
+        )
+        if records is None:
+            return None
+        return {sheet: filter_total_rows(records_to_dataframe(rows)) for sheet, rows in records.items()}
+
+    def process_with_llm(self, df, partial=False):
+        """Process DataFrame with LLM using the same logic as llm_api.py."""
+        constants = self.compact_constants(df)
+        prompt = self.build_prompt(df, constants, partial)
+        # Typed rows are filtered for totals as they arrive
+        rows = RowCollector()
+        
+        try:
+            if constants is not None:
+                # Compact rows; date and product type come from the sheet title
+                records = self.llm_client.process_compact(
+                    prompt, constants, PROMPT_VERSION, self.system_prompt, expected_rows=len(df), on_row=rows
+                )
+                if records is None:
+                    return None
+                return records_to_dataframe(rows.records)
+            elif self.llm_client.structured_output or self.llm_client.stream:
+                # Schema-constrained or streamed output: typed records, no regex extraction
+                records = self.llm_client.process_records(prompt, PROMPT_VERSION, self.system_prompt, on_row=rows)
+                if records is None:
+                    return None
+                return records_to_dataframe(rows.records)
             else:
-                df_llm = df_llm[df_llm.apply(is_valid_row, axis=1)]
-            return df_llm.reset_index(drop=True)
+                transformed_data = self.llm_client.complete_text(
+                    prompt,
+                    template_version=PROMPT_VERSION,
+                    system_prompt=self.system_prompt,
+                    is_valid=lambda text: isinstance(extract_json(text), list)
+                )
+                data = extract_json(transformed_data)
+                if data is None:
+                    print("No JSON array found in LLM response.")
+                    return None
+                if not isinstance(data, list):
+                    raise ValueError("LLM response is not a JSON array")
+                return filter_total_rows(pd.DataFrame(data))
         except Exception as e:
             print(f"Error processing data with LLM: {e}")
             return None
 
+    def _use_multi_sheet(self, cleaned_sheets) -> bool:
+        return self.multi_sheet and len(cleaned_sheets) > 1
+
+    def _request_sheets(self, cleaned_sheets, partial_sheets=()):
+        """
+        Get the LLM rows of several sheets: one multi-sheet request when enabled, falling
+        back to per-sheet requests if that response is unusable.
+        
+        Returns:
+            Dictionary of sheet name to filtered DataFrame for every sheet that got a result
+        """
+        llm_results = {}
+        pending_sheets = dict(cleaned_sheets)
+        if self._use_multi_sheet(cleaned_sheets):
+            print(f"Processing sheets in one request: {', '.join(cleaned_sheets)}")
+            sheet_results = self.process_sheets_with_llm(cleaned_sheets, partial_sheets)
+            if sheet_results is not None:
+                llm_results.update(sheet_results)
+                pending_sheets = {}
+            else:
+                print("Multi-sheet request failed; processing sheets one by one")
+        
+        # Process each sheet
+        for sheet, cleaned_df in pending_sheets.items():
+            try:
+                print(f"Processing sheet: {sheet}")
+                llm_result = self.process_with_llm(cleaned_df, sheet in partial_sheets)
+                if llm_result is not None:
+                    llm_results[sheet] = llm_result
+                else:
+                    print(f"No LLM result for sheet {sheet}")
+            except Exception as e:
+                print(f"Error processing sheet {sheet}: {e}")
+        return llm_results
+
+    def _defer_uncached_prompts(self, cleaned_sheets, state: dict, partial_sheets=()) -> int:
+        """
+        Record Batch API requests for every sheet whose prompt has no cached response.
+        
+        Returns:
+            Number of deferred prompts
+        """
+        if self._use_multi_sheet(cleaned_sheets):
+            prompt, sheet_constants, expected_rows = self.build_multi_sheet_prompt(cleaned_sheets, partial_sheets)
+            compact = all(constants is not None for constants in sheet_constants.values())
+            response_format = self.llm_client.sheets_response_format(list(sheet_constants), compact)
+            if self.llm_client.is_cached(prompt, PROMPT_VERSION, self.system_prompt, response_format):
+                return 0
+            max_tokens = self.llm_client.max_tokens_for_rows(expected_rows) if compact else None
+            state.setdefault("batch_requests", []).append(
+                self.llm_client.build_batch_request(prompt, PROMPT_VERSION, self.system_prompt,
+                                                    response_format, max_tokens)
+            )
+            return 1
+        
+        deferred = 0
+        for sheet, cleaned_df in cleaned_sheets.items():
+            constants = self.compact_constants(cleaned_df)
+            prompt = self.build_prompt(cleaned_df, constants, sheet in partial_sheets)
+            response_format = self.llm_client.pnl_response_format(compact=constants is not None)
+            if not self.llm_client.is_cached(prompt, PROMPT_VERSION, self.system_prompt, response_format):
+                max_tokens = self.llm_client.max_tokens_for_rows(len(cleaned_df)) if constants else None
+                state.setdefault("batch_requests", []).append(
+                    self.llm_client.build_batch_request(prompt, PROMPT_VERSION, self.system_prompt,
+                                                        response_format, max_tokens)
+                )
+                deferred += 1
+        return deferred
+
     def __call__(self, state: dict) -> dict:
         """Main node function that processes Excel files with LLM."""
         file_path = state["file_path"]
@@ -81,28 +276,56 @@ class ExcelWorkflowNode:
         all_llm_results = []
         processed_sheets = []
         
-        # Process each sheet
+        # Get cleaned and structured data for every configured sheet
+        cleaned_sheets = {}
         for sheet in self.default_sheets:
             try:
-                print(f"Processing sheet: {sheet}")
-                
-                # Get cleaned and structured data
                 cleaned_df = processor.get_cleaned_sheet(sheet)
                 if cleaned_df is not None and not cleaned_df.empty:
-                    # Process with LLM
-                    llm_result = self.process_with_llm(cleaned_df)
-                    if llm_result is not None:
-                        all_llm_results.append(llm_result)
-                        processed_sheets.append(sheet)
-                        print(f"Successfully processed {sheet}")
-                    else:
-                        print(f"No LLM result for sheet {sheet}")
+                    cleaned_sheets[sheet] = cleaned_df
                 else:
                     print(f"No cleaned data for sheet {sheet}")
-                    
             except Exception as e:
                 print(f"Error processing sheet {sheet}: {e}")
         
+        # mapping.yml rules first; only rows they do not recognize go to the LLM
+        rule_splits, llm_sheets = self.apply_mapping_rules(cleaned_sheets)
+        # Sheets reduced to their unmatched rows get the "only the rows shown" prompt
+        partial_sheets = set(rule_splits)
+        
+        # Batch submit: stop after prompt building and hand uncached prompts to the batch job
+        if state.get("defer_llm"):
+            deferred = self._defer_uncached_prompts(llm_sheets, state, partial_sheets)
+            if deferred:
+                state["excel_outputs"] = {"success": False, "deferred": True, "processed_sheets": []}
+                return state
+        
+        llm_results = self._request_sheets(llm_sheets, partial_sheets)
+        
+        sheet_results = {}
+        misaligned = {}
+        for sheet in cleaned_sheets:
+            sheet_result, realign = self._sheet_result(sheet, rule_splits, llm_results)
+            if realign:
+                misaligned[sheet] = cleaned_sheets[sheet]
+            else:
+                sheet_results[sheet] = sheet_result
+        
+        # A partial answer that does not line up with the leftover rows: ask for the whole sheet instead
+        if misaligned:
+            print(f"[DEBUG] Partial LLM answers did not line up; requesting full sheets: {', '.join(misaligned)}")
+            if state.get("defer_llm") and self._defer_uncached_prompts(misaligned, state):
+                state["excel_outputs"] = {"success": False, "deferred": True, "processed_sheets": []}
+                return state
+            sheet_results.update(self._request_sheets(misaligned))
+        
+        for sheet in cleaned_sheets:
+            sheet_result = sheet_results.get(sheet)
+            if sheet_result is not None:
+                all_llm_results.append(sheet_result)
+                processed_sheets.append(sheet)
+                print(f"Successfully processed {sheet}")
+        
         # Create combined output if we have results
         if all_llm_results:
             combined = pd.concat(all_llm_results, ignore_index=True)
@@ -115,6 +338,7 @@ class ExcelWorkflowNode:
             # Update state with results
             state["excel_outputs"] = {
                 "combined_output": combined_path,
+                "combined_df": combined,
                 "success": True,
                 "processed_sheets": processed_sheets
             }
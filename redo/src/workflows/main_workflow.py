@@ -5,8 +5,11 @@ Clean, modular design with separated concerns
 """
 
 import os
+import asyncio
 import argparse
-from typing import Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
 
 from langgraph.graph import StateGraph, END
 
@@ -17,6 +20,11 @@ from src.workflows.msg_workflow import MsgWorkflowNode
 from src.nodes.validation_node import ValidationNode
 from src.utils.config_manager import config_manager
 from src.utils.llm_client import real_llm_func, real_llm_vision_func
+from src.utils.disk_cache import get_response_cache, get_azure_cache
+from src.utils.vision_cache import get_vision_cache
+from src.utils.usage_stats import get_usage_stats
+from src.utils.async_bridge import set_dispatch_loop, close_dispatch_clients, worker_slot
+from src.utils.batch_manager import BatchManager
 from src.utils.file_manager import get_file_manager
 from src.utils.workflow_logger import WorkflowLogger
 
@@ -67,9 +75,13 @@ class DocumentProcessingWorkflow:
             }
         )
         
-        # Add validation after processing
-        self.graph.add_edge("excel_process", "validate")
-        self.graph.add_edge("msg_process", "validate")
+        # Add validation after processing (skipped when the LLM step was deferred to a batch)
+        for node in ["excel_process", "msg_process"]:
+            self.graph.add_conditional_edges(
+                node,
+                self._route_after_processing,
+                {"validate": "validate", END: END}
+            )
         self.graph.add_edge("validate", END)
     
     def _route_by_file_type(self, state: Dict[str, Any]) -> str:
@@ -92,12 +104,18 @@ class DocumentProcessingWorkflow:
             print(f"❌ Unsupported file type: {file_type}")
             return END
 
-    def process_file(self, file_path: str) -> Dict[str, Any]:
+    def _route_after_processing(self, state: Dict[str, Any]) -> str:
+        """Skip validation for files whose LLM step was deferred to a batch job."""
+        outputs = state.get("excel_outputs") or state.get("msg_outputs") or {}
+        return END if outputs.get("deferred") else "validate"
+
+    def process_file(self, file_path: str, extra_state: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Process a single file through the workflow.
         
         Args:
             file_path: Path to file to process
+            extra_state: Additional initial state (e.g. batch submit/collect settings)
             
         Returns:
             Processing results
@@ -109,7 +127,7 @@ class DocumentProcessingWorkflow:
         self.logger.log_process_start(file_path)
         
         # Initialize workflow state
-        initial_state = {"file_path": file_path}
+        initial_state = {"file_path": file_path, **(extra_state or {})}
         
         print(f"🔄 Processing file: {file_path}")
         print("=" * 60)
@@ -152,7 +170,9 @@ class DocumentProcessingWorkflow:
         """Display Excel processing results."""
         excel_outputs = result.get("excel_outputs", {})
         
-        if excel_outputs.get("success", False):
+        if excel_outputs.get("deferred", False):
+            print("⏸️  Excel LLM step deferred to batch job")
+        elif excel_outputs.get("success", False):
             print("✅ Excel processing successful!")
             print(f"📁 Output: {excel_outputs['combined_output']}")
             print(f"📊 Sheets processed: {excel_outputs['processed_sheets']}")
@@ -163,7 +183,9 @@ class DocumentProcessingWorkflow:
         """Display MSG processing results."""
         msg_outputs = result.get("msg_outputs", {})
         
-        if msg_outputs.get("success", False):
+        if msg_outputs.get("deferred", False):
+            print("⏸️  MSG LLM step deferred to batch job")
+        elif msg_outputs.get("success", False):
             print("✅ MSG processing successful!")
             print(f"📁 Highlights: {msg_outputs['highlight_output']}")
             print(f"📁 Table: {msg_outputs['table_output']}")
@@ -178,16 +200,149 @@ class WorkflowManager:
     Handles file discovery and batch processing.
     """
     
-    def __init__(self, input_dir: str = None):
+    def __init__(self, input_dir: str = None, concurrency: int = None):
         """
         Initialize workflow manager.
         
         Args:
             input_dir: Input directory override
+            concurrency: Number of files processed at once (defaults to config)
         """
         self.file_manager = get_file_manager(input_dir)
         self.workflow = DocumentProcessingWorkflow()
         self.logger = WorkflowLogger()
+        self.concurrency = max(1, concurrency or config_manager.get_max_parallel_files())
+    
+    def _process_one(self, file_path: str, error_context: str = None) -> bool:
+        """
+        Process a single file, logging failures instead of raising.
+        
+        Args:
+            file_path: Path to file to process
+            error_context: Context for the error log (None to skip error logging)
+            
+        Returns:
+            True if the file was processed successfully
+        """
+        try:
+            self.workflow.process_file(file_path)
+            return True
+        except Exception as e:
+            print(f"Failed to process {file_path}: {e}")
+            if error_context:
+                self.logger.log_error(str(e), f"{error_context}: {file_path}")
+            return False
+    
+    def _process_files(self, files: List[str], error_context: str = None):
+        """
+        Process a batch of files, sequentially or concurrently depending on self.concurrency.
+        
+        Args:
+            files: Paths of files to process
+            error_context: Context for the error log
+            
+        Returns:
+            Tuple of (successful, failed) counts
+        """
+        if self.concurrency > 1 and len(files) > 1:
+            results = asyncio.run(self._process_files_concurrently(files, error_context))
+        else:
+            results = [self._process_one(file_path, error_context) for file_path in files]
+        
+        successful = sum(1 for ok in results if ok)
+        return successful, len(results) - successful
+    
+    async def _process_files_concurrently(self, files: List[str], error_context: str = None) -> List[bool]:
+        """
+        Run files in worker threads while this event loop owns the async API clients.
+        
+        OCR and file I/O stay in the worker threads, at most self.concurrency at a time.
+        LLM and Azure calls are dispatched to this loop, and a file waiting on one gives
+        its slot to the next file, so calls from different files are in flight together.
+        """
+        print(f"⚡ Processing {len(files)} files with concurrency {self.concurrency}")
+        file_slots = threading.Semaphore(self.concurrency)
+        # Extra threads only ever wait on dispatched calls; more could not get a request slot
+        waiting = config_manager.get_azure_max_concurrency() + config_manager.get_llm_config().get("max_concurrency", 8)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency + waiting, thread_name_prefix="file")
+        loop = asyncio.get_running_loop()
+        
+        def process(file_path):
+            with worker_slot(file_slots):
+                return self._process_one(file_path, error_context)
+        
+        set_dispatch_loop(loop)
+        try:
+            return await asyncio.gather(*(loop.run_in_executor(executor, process, file_path) for file_path in files))
+        finally:
+            # Connection pools opened on this loop are closed here, not leaked with it
+            await close_dispatch_clients()
+            set_dispatch_loop(None)
+            executor.shutdown(wait=False)
+    
+    def _cache_summary(self) -> Dict[str, Any]:
+        """Get LLM response, vision and provider prompt cache counters for the summary log."""
+        usage = get_usage_stats().stats()
+        prompt_cache = {
+            "LLM Prompt Tokens": usage["prompt_tokens"],
+            "LLM Cached Prompt Tokens": usage["cached_tokens"]
+        }
+        stats = get_response_cache().stats()
+        if not stats["enabled"]:
+            return {"LLM Cache": "disabled", **prompt_cache}
+        vision_stats = get_vision_cache().stats()
+        azure_stats = get_azure_cache().stats()
+        return {
+            **prompt_cache,
+            "LLM Cache Hits": stats["hits"],
+            "LLM Cache Misses": stats["misses"],
+            "Azure Cache Hits": azure_stats["hits"],
+            "Azure Cache Misses": azure_stats["misses"],
+            "Vision Cache Exact Hits": vision_stats["exact_hits"],
+            "Vision Cache Perceptual Hits": vision_stats["perceptual_hits"],
+            "Vision Cache Misses": vision_stats["misses"]
+        }
+    
+    def _print_cache_stats(self):
+        """Print LLM response and vision cache hit rates."""
+        stats = get_response_cache().stats()
+        if stats["enabled"]:
+            print(f"💾 LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+        azure_stats = get_azure_cache().stats()
+        if azure_stats["enabled"]:
+            print(f"📄 Azure layout cache: {azure_stats['hits']} hits, {azure_stats['misses']} misses "
+                  f"({azure_stats['hit_rate']:.0%} hit rate)")
+        vision_stats = get_vision_cache().stats()
+        if vision_stats["enabled"]:
+            print(f"🖼️ Vision cache: {vision_stats['exact_hits']} exact + {vision_stats['perceptual_hits']} perceptual hits, "
+                  f"{vision_stats['misses']} misses ({vision_stats['hit_rate']:.0%} hit rate)")
+        usage = get_usage_stats().stats()
+        if usage["calls"]:
+            latency = ""
+            if usage["cached_latency"] is not None and usage["uncached_latency"] is not None:
+                latency = f"; {usage['cached_latency']:.1f}s avg with cache hit vs {usage['uncached_latency']:.1f}s without"
+            print(f"⚡ Prompt cache: {usage['cached_tokens']} of {usage['prompt_tokens']} prompt tokens cached "
+                  f"({usage['cached_share']:.0%}){latency}")
+    
+    def _finish_summary(self, total: int, successful: int, failed: int, mode: str):
+        """
+        Log and print the summary of a processing run, with the cache counters.
+        
+        Args:
+            total: Number of files in the run
+            successful: Files processed without error
+            failed: Files that raised
+            mode: Run mode for the summary log
+        """
+        self.logger.log_summary({
+            "Total Files": total,
+            "Successful": successful,
+            "Failed": failed,
+            "Mode": mode,
+            **self._cache_summary()
+        })
+        print(f"\n📊 Summary: {total} total, {successful} successful, {failed} failed")
+        self._print_cache_stats()
     
     def process_all(self):
         """Process all files in input directory."""
@@ -199,25 +354,9 @@ class WorkflowManager:
         
         print(f"Processing ALL files: {[os.path.basename(f) for f in files]}")
         
-        successful = 0
-        failed = 0
+        successful, failed = self._process_files(files)
         
-        for file_path in files:
-            try:
-                self.workflow.process_file(file_path)
-                successful += 1
-            except Exception as e:
-                print(f"Failed to process {file_path}: {e}")
-                failed += 1
-        
-        # Log summary
-        self.logger.log_summary({
-            "Total Files": len(files),
-            "Successful": successful,
-            "Failed": failed,
-            "Mode": "all"
-        })
-        print(f"\n📊 Summary: {len(files)} total, {successful} successful, {failed} failed")
+        self._finish_summary(len(files), successful, failed, "all")
     
     def process_by_date(self, date_code: str):
         """
@@ -234,26 +373,9 @@ class WorkflowManager:
         
         print(f"Processing files for date {date_code}: {[os.path.basename(f) for f in files]}")
         
-        successful = 0
-        failed = 0
+        successful, failed = self._process_files(files, error_context=f"processing file by date {date_code}")
         
-        for file_path in files:
-            try:
-                self.workflow.process_file(file_path)
-                successful += 1
-            except Exception as e:
-                print(f"Failed to process {file_path}: {e}")
-                self.logger.log_error(str(e), f"processing file by date {date_code}: {file_path}")
-                failed += 1
-        
-        # Log summary
-        self.logger.log_summary({
-            "Total Files": len(files),
-            "Successful": successful,
-            "Failed": failed,
-            "Mode": f"date ({date_code})"
-        })
-        print(f"\n📊 Summary: {len(files)} total, {successful} successful, {failed} failed")
+        self._finish_summary(len(files), successful, failed, f"date ({date_code})")
     
     def process_by_date_range(self, start_date: str, end_date: str):
         """
@@ -271,26 +393,9 @@ class WorkflowManager:
         
         print(f"Processing files in date range {start_date} to {end_date}: {[os.path.basename(f) for f in files]}")
         
-        successful = 0
-        failed = 0
+        successful, failed = self._process_files(files, error_context=f"processing file by date range {start_date}-{end_date}")
         
-        for file_path in files:
-            try:
-                self.workflow.process_file(file_path)
-                successful += 1
-            except Exception as e:
-                print(f"Failed to process {file_path}: {e}")
-                self.logger.log_error(str(e), f"processing file by date range {start_date}-{end_date}: {file_path}")
-                failed += 1
-        
-        # Log summary
-        self.logger.log_summary({
-            "Total Files": len(files),
-            "Successful": successful,
-            "Failed": failed,
-            "Mode": f"range ({start_date} to {end_date})"
-        })
-        print(f"\n📊 Summary: {len(files)} total, {successful} successful, {failed} failed")
+        self._finish_summary(len(files), successful, failed, f"range ({start_date} to {end_date})")
     
     def process_unprocessed(self, processed_log_file: str = None):
         """
@@ -310,26 +415,86 @@ class WorkflowManager:
         
         print(f"Processing UNPROCESSED files: {[os.path.basename(f) for f in files]}")
         
-        successful = 0
-        failed = 0
+        successful, failed = self._process_files(files, error_context="processing unprocessed file")
+        
+        self._finish_summary(len(files), successful, failed, "unprocessed")
+    
+    def submit_batch(self, start_date: str = None, end_date: str = None):
+        """
+        Run files up to prompt building and submit all uncached prompts as one Batch API job.
+        
+        Args:
+            start_date: Start date in YYYYMMDD format (all files if omitted)
+            end_date: End date in YYYYMMDD format (inclusive)
+        """
+        if start_date:
+            files = self.file_manager.get_files_by_date_range(start_date, end_date or start_date)
+        else:
+            files = self.file_manager.get_all_files()
+        
+        if not files:
+            print("No files found to submit")
+            return
         
+        print(f"Preparing batch for files: {[os.path.basename(f) for f in files]}")
+        
+        requests = []
+        deferred_files = []
         for file_path in files:
             try:
-                self.workflow.process_file(file_path)
+                result = self.workflow.process_file(file_path, {"defer_llm": True})
+            except Exception as e:
+                print(f"Failed to prepare {file_path}: {e}")
+                self.logger.log_error(str(e), f"preparing batch request: {file_path}")
+                continue
+            if result.get("batch_requests"):
+                requests.extend(result["batch_requests"])
+                msg_outputs = result.get("msg_outputs") or {}
+                deferred_files.append({
+                    "file_path": file_path,
+                    "msg_ocr_result": msg_outputs.get("ocr_result")
+                })
+        
+        batch_id = BatchManager().submit(requests, deferred_files)
+        if batch_id:
+            print(f"\n📦 Submitted batch {batch_id}: {len(requests)} prompts from {len(deferred_files)} files")
+            print(f"   Collect later with: python main.py --mode batch-collect --batch_id {batch_id}")
+        self.logger.log_summary({
+            "Total Files": len(files),
+            "Deferred Files": len(deferred_files),
+            "Batch Requests": len(requests),
+            "Batch ID": batch_id,
+            "Mode": "batch-submit"
+        })
+    
+    def collect_batch(self, batch_id: str = None):
+        """
+        Collect a finished batch and resume the pipeline for every deferred file.
+        
+        Args:
+            batch_id: Batch to collect (defaults to the most recent one)
+        """
+        manifest = BatchManager().collect(batch_id)
+        if manifest is None:
+            return
+        
+        successful = 0
+        failed = 0
+        for entry in manifest["files"]:
+            file_path = entry["file_path"]
+            extra_state = {}
+            if entry.get("msg_ocr_result"):
+                # Reuse the OCR result saved at submit time instead of re-running Tesseract/Azure
+                extra_state["msg_ocr_result"] = entry["msg_ocr_result"]
+            try:
+                self.workflow.process_file(file_path, extra_state)
                 successful += 1
             except Exception as e:
                 print(f"Failed to process {file_path}: {e}")
-                self.logger.log_error(str(e), f"processing unprocessed file: {file_path}")
+                self.logger.log_error(str(e), f"collecting batch {manifest['batch_id']}: {file_path}")
                 failed += 1
         
-        # Log summary
-        self.logger.log_summary({
-            "Total Files": len(files),
-            "Successful": successful,
-            "Failed": failed,
-            "Mode": "unprocessed"
-        })
-        print(f"\n📊 Summary: {len(files)} total, {successful} successful, {failed} failed")
+        self._finish_summary(len(manifest["files"]), successful, failed, f"batch-collect ({manifest['batch_id']})")
     
     def get_stats(self):
         """Display file statistics."""
@@ -352,12 +517,16 @@ Examples:
   python main_workflow.py --mode range 20240716 20240720
   python main_workflow.py --mode range 20240716 20240716
   python main_workflow.py --mode unprocessed
+  python main_workflow.py --mode all --no-cache
+  python main_workflow.py --mode range 20240701 20240731 --concurrency 8
+  python main_workflow.py --mode batch-submit 20240101 20240630
+  python main_workflow.py --mode batch-collect --batch_id batch_abc123
         """
     )
     
     parser.add_argument(
         '--mode', 
-        choices=['all', 'range', 'unprocessed', 'stats'], 
+        choices=['all', 'range', 'unprocessed', 'stats', 'batch-submit', 'batch-collect'], 
         default='range',
         help='Processing mode'
     )
@@ -383,12 +552,35 @@ Examples:
         type=str, 
         help='Tracking file for processed files'
     )
+    parser.add_argument(
+        '--batch_id',
+        type=str,
+        help='Batch to collect in batch-collect mode (defaults to the most recent submission)'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        help='Number of files processed at once (LLM requests from all files share one bounded client)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Bypass the on-disk LLM response, vision classification and Azure layout caches (always call the APIs)'
+    )
     
     args = parser.parse_args()
     
+    if args.no_cache and args.mode in ('batch-submit', 'batch-collect'):
+        parser.error(f"--no-cache cannot be used with --mode {args.mode}: batch results are delivered through the LLM cache")
+    
+    if args.no_cache:
+        get_response_cache().enabled = False
+        get_vision_cache().enabled = False
+        get_azure_cache().enabled = False
+    
     try:
         # Initialize workflow manager
-        manager = WorkflowManager(args.input_dir)
+        manager = WorkflowManager(args.input_dir, concurrency=args.concurrency)
         
         # Execute based on mode
         if args.mode == 'all':
@@ -409,6 +601,12 @@ Examples:
             
         elif args.mode == 'stats':
             manager.get_stats()
+            
+        elif args.mode == 'batch-submit':
+            manager.submit_batch(args.start_date, args.end_date)
+            
+        elif args.mode == 'batch-collect':
+            manager.collect_batch(args.batch_id)
         
         return 0
         
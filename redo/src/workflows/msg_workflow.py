@@ -1,14 +1,20 @@
 import os
 import pandas as pd
+from io import StringIO
 from src.processors.msg_processor import MsgProcessor
-import extract_msg
+from src.processors.excel_processor import ExcelProcessor
+from src.utils.llm_client import get_llm_client
+from src.utils.pnl_schema import records_to_dataframe, filter_total_rows, RowCollector
+from src.utils.table_serializer import serialize_table
+from src.utils.mapping_rules import get_mapping_rules, merge_records, find_value_columns, grid_rows
+from src.utils.parsed_message import ParsedMessage
 from bs4 import BeautifulSoup
 import re
 from datetime import datetime
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../reference code')))
-from prompts.prompt import get_llm_prompt as get_blue_llm_prompt
-from prompts.prompt2 import get_llm_prompt2 as get_red_llm_prompt
+from prompts.prompt import get_llm_prompt as get_blue_llm_prompt, PROMPT_VERSION as BLUE_PROMPT_VERSION
+from prompts.prompt2 import get_llm_prompt2 as get_red_llm_prompt, PROMPT_VERSION as RED_PROMPT_VERSION
 
 class MsgWorkflowNode:
     def __init__(self, llm_vision_func, llm_func, output_dir=None):
@@ -22,11 +28,12 @@ class MsgWorkflowNode:
         self.llm_vision_func = llm_vision_func  # Store for use in processing
         self.llm_func = llm_func  # Function to call LLM for table extraction
         self.output_dir = output_dir
+        # mapping.yml rules extract recognized rows without the LLM (None when disabled)
+        self.mapping_rules = get_mapping_rules()
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def extract_highlights(self, msg_path, azure_ocr_text=None):
-        msg = extract_msg.Message(msg_path)
-        subject = msg.subject or ""
+    def extract_highlights(self, message, azure_ocr_text=None):
+        subject = message.subject
         match = re.search(r'(\d{4})[/-](\d{2})[/-](\d{2})', subject)
         if match:
             date_str = ''.join(match.groups())
@@ -34,7 +41,7 @@ class MsgWorkflowNode:
             date_str = datetime.now().strftime('%Y%m%d')
         
         # Extract product type from filename to make highlights unique
-        filename = os.path.basename(msg_path)
+        filename = message.filename
         product_type = "UNKNOWN"
         if "DBIB" in filename.upper():
             product_type = "DBIB"
@@ -48,12 +55,7 @@ class MsgWorkflowNode:
                 product_type = "WB"
         
         # First try to extract from HTML body
-        html = getattr(msg, 'htmlBody', None) or msg.body or getattr(msg, 'rtfBody', None) or ""
-        
-        # Handle bytes HTML body
-        if isinstance(html, bytes):
-            html = html.decode('utf-8', errors='ignore')
-            
+        html = message.body
         soup = BeautifulSoup(html, 'html.parser')
         text = soup.get_text(separator='\n')
         lines = text.splitlines()
@@ -396,26 +398,93 @@ class MsgWorkflowNode:
         else:
             return None
 
+    def compact_constants(self, full_text, table_text, extracted_date=None):
+        """
+        Find VALUATION_DATE/PRODUCT_TYPE in the OCR'd table title, falling back to the
+        filename date. Returns None when either is unknown, so the full output contract is used.
+        """
+        product_type, valuation_date = "", ""
+        for line in (full_text or "").split('\n') + (table_text or "").split('\n'):
+            title = ExcelProcessor.extract_product_and_date_from_title(line)
+            if title is not None:
+                product_type, valuation_date = title
+                break
+        valuation_date = valuation_date or extracted_date
+        if not product_type or not valuation_date:
+            return None
+        return {"VALUATION_DATE": valuation_date, "PRODUCT_TYPE": product_type}
+
+    def apply_mapping_rules(self, table_grid, constants, table_type):
+        """
+        Extract the table rows the mapping.yml rules recognize.
+        
+        The rules use the blue/Excel labels (e.g. Interest_Rate/Rho); red tables use
+        their own vocabulary (Rates/Dynamic_Rho, ILP) and always go to the LLM.
+        
+        Args:
+            table_grid: Azure OCR cell contents of the selected table
+            constants: VALUATION_DATE/PRODUCT_TYPE from the table title, or None
+            table_type: 'blue' or 'red'
+        
+        Returns:
+            Tuple of (matched records by row, unmatched row labels, grid rows still for the LLM),
+            or None if the rules do not apply to this table
+        """
+        if self.mapping_rules is None or constants is None or not table_grid or table_type != "blue":
+            return None
+        columns = find_value_columns(table_grid)
+        if columns is None:
+            return None
+        header_row, rider_col, asset_col = columns
+        data_rows = table_grid[header_row + 1:]
+        matched, unmatched = self.mapping_rules.split_rows(grid_rows(data_rows, rider_col, asset_col), constants)
+        print(f"[DEBUG] {len(matched)} rows from mapping rules, {len(unmatched)} rows need the LLM")
+        if not matched:
+            return None
+        # Title and header rows stay in the prompt, as do section labels for context
+        llm_grid = table_grid[:header_row + 1] + [row for i, row in enumerate(data_rows) if i not in matched]
+        return matched, unmatched, llm_grid
+
+    def _call_llm(self, prompt, llm_kwargs):
+        """
+        Call the table extraction LLM, asking for the full response when the function supports it.
+        
+        Record answers come back with their total rows dropped; a function that takes
+        on_row filters them while a streamed answer is still being generated.
+        """
+        params = self.llm_func.__code__.co_varnames
+        kwargs = dict(llm_kwargs)
+        if 'return_full_response' in params:
+            kwargs['return_full_response'] = True
+        rows = RowCollector() if 'on_row' in params else None
+        if rows is not None:
+            kwargs['on_row'] = rows
+        output = self.llm_func(prompt, **kwargs)
+        if isinstance(output, dict) and output.get("records") is not None:
+            output["records"] = rows.records if rows is not None else RowCollector.collect(output["records"])
+        return output
+
     def __call__(self, state: dict) -> dict:
+        # The .msg file is parsed once for OCR and highlights, and closed when the node finishes
+        with ParsedMessage(state["file_path"]) as message:
+            return self._process(state, message)
+
+    def _process(self, state: dict, message: ParsedMessage) -> dict:
         file_path = state["file_path"]
         
-        # First process the MSG to get OCR results
-        result = self.processor.process_msg(file_path, self.llm_vision_func)
+        # First process the MSG to get OCR results (a batch collect run passes the saved ones)
+        result = state.get("msg_ocr_result") or self.processor.process_msg(message, self.llm_vision_func)
         if not result:
             # Still try to extract highlights even if no table found
-            highlight_path = self.extract_highlights(file_path)
+            highlight_path = self.extract_highlights(message)
             state["msg_outputs"] = {"success": False, "reason": "No target image found", "highlight_output": highlight_path}
             return state
             
         table_type = result["table_type"]
         table_text = result["table_text"]
+        # Compact rendering for the prompt; results saved before it existed only have table_text
+        prompt_table = result.get("prompt_text") or table_text
         full_text = result.get("full_text", "")
-        
-        # Now extract highlights with access to Azure OCR full text
-        highlight_path = self.extract_highlights(file_path, azure_ocr_text=full_text)
-        image_path = result["image_path"]
-        print(f"[DEBUG] Table type classified by vision model: {table_type}")
-        print("[DEBUG] Azure OCR table_text sent to LLM:\n", table_text)
         # Extract date from filename for context
         filename = os.path.basename(file_path)
         date_match = re.search(r'(\d{4})[_-](\d{1,2})[_-](\d{1,2})', filename)
@@ -424,21 +493,64 @@ class MsgWorkflowNode:
             year, month, day = date_match.groups()
             extracted_date = f"{year}{month.zfill(2)}{day.zfill(2)}"
         
+        # Compact output contract when the date and product type are known locally
+        llm_client = get_llm_client()
+        title_constants = self.compact_constants(full_text, table_text, extracted_date)
+        constants = title_constants if llm_client.compact_output else None
+        compact = constants is not None
+        
+        # mapping.yml rules first; only rows they do not recognize go to the LLM
+        rule_split = self.apply_mapping_rules(result.get("table_grid"), title_constants, table_type)
+        full_table = prompt_table
+        if rule_split is not None:
+            prompt_table = serialize_table(rule_split[2])
+        needs_llm = rule_split is None or bool(rule_split[1])
+        expected_rows = len([line for line in prompt_table.split('\n') if line.strip()])
+        
         # Use the correct prompt logic
         if table_type == "blue":
-            prompt = get_blue_llm_prompt(table_text, extracted_date)
+            # A rule split leaves only the unmatched rows: no checklist zero rows for the rest
+            prompt = get_blue_llm_prompt(prompt_table, extracted_date, compact=compact,
+                                         partial=rule_split is not None)
+            prompt_version = BLUE_PROMPT_VERSION
         else:
-            prompt = get_red_llm_prompt(table_text)
+            prompt = get_red_llm_prompt(prompt_table, compact=compact)
+            prompt_version = RED_PROMPT_VERSION
+        
+        # Batch submit: stop after OCR and prompt building, unless the answer is already cached
+        response_format = llm_client.pnl_response_format(compact=compact)
+        if state.get("defer_llm") and needs_llm and not llm_client.is_cached(prompt, prompt_version, response_format=response_format):
+            max_tokens = llm_client.max_tokens_for_rows(expected_rows) if compact else None
+            state.setdefault("batch_requests", []).append(
+                llm_client.build_batch_request(prompt, prompt_version, response_format=response_format,
+                                               max_tokens=max_tokens)
+            )
+            state["msg_outputs"] = {"success": False, "deferred": True, "table_type": table_type, "ocr_result": result}
+            return state
+        
+        # Now extract highlights with access to Azure OCR full text
+        highlight_path = self.extract_highlights(message, azure_ocr_text=full_text)
+        print(f"[DEBUG] Table type classified by vision model: {table_type}")
+        print("[DEBUG] Azure OCR table sent to LLM:\n", prompt_table)
         print("[DEBUG] LLM Prompt:\n", prompt)
         # Patch: capture full LLM response
-        llm_output = self.llm_func(prompt, return_full_response=True) if 'return_full_response' in self.llm_func.__code__.co_varnames else self.llm_func(prompt)
+        llm_kwargs = {"template_version": prompt_version}
+        if compact:
+            llm_kwargs.update(constants=constants, expected_rows=expected_rows)
+        if not needs_llm:
+            print("[DEBUG] All table rows extracted by mapping rules; skipping LLM")
+            llm_output = {"records": []}
+        else:
+            llm_output = self._call_llm(prompt, llm_kwargs)
         if isinstance(llm_output, dict) and 'full_response' in llm_output:
             print("[DEBUG] Full LLM response content:\n", llm_output['full_response'])
+        records = llm_output.get("records")
         table_csv = llm_output.get("table", "")
-        print("[DEBUG] Raw LLM table CSV output:\n", table_csv)
+        if records is None:
+            print("[DEBUG] Raw LLM table CSV output:\n", table_csv)
         base_name = os.path.splitext(os.path.basename(file_path))[0]
         table_path = os.path.join(self.output_dir, f"table_{base_name}.csv")
-        if not table_csv.strip():
+        if records is None and not table_csv.strip():
             print("[ERROR] LLM did not return a valid table CSV. Skipping table save.")
             state["msg_outputs"] = {
                 "success": False,
@@ -449,22 +561,42 @@ class MsgWorkflowNode:
             }
             return state
         try:
-            import pandas as pd
-            from io import StringIO
-            df = pd.read_csv(StringIO(table_csv))
-            # --- POST-PROCESSING FILTER ---
-            # Remove rows where RISK_TYPE or label contains 'Total' (except 'HY_Total')
-            def is_valid_row(row):
-                for col in row.index:
-                    val = str(row[col]).lower()
-                    if 'total' in val and 'hy_total' not in val:
-                        return False
-                return True
-            if 'RISK_TYPE' in df.columns:
-                mask = df['RISK_TYPE'].apply(lambda x: ('total' not in str(x).lower()) or ('hy_total' in str(x).lower()))
-                df = df[mask]
+            # Total rows ('Total' in the label, except 'HY_Total') are dropped from either answer
+            if records is not None:
+                # Structured output: typed rows, no CSV round-trip
+                df = records_to_dataframe(records)
             else:
-                df = df[df.apply(is_valid_row, axis=1)]
+                df = filter_total_rows(pd.read_csv(StringIO(table_csv)))
+            if rule_split is not None:
+                matched, unmatched, _ = rule_split
+                merged = merge_records(matched, unmatched, df.to_dict("records"))
+                if merged is not None:
+                    df = records_to_dataframe(merged)
+                else:
+                    # The partial answer does not line up with the remaining rows; ask for the whole table
+                    print("[DEBUG] Falling back to a full-table LLM request")
+                    full_kwargs = dict(llm_kwargs)
+                    if compact:
+                        full_kwargs["expected_rows"] = len([line for line in full_table.split('\n') if line.strip()])
+                    full_output = self._call_llm(
+                        get_blue_llm_prompt(full_table, extracted_date, compact=compact), full_kwargs
+                    )
+                    full_records = full_output.get("records")
+                    full_csv = full_output.get("table", "")
+                    if full_records is None and not full_csv.strip():
+                        print("[ERROR] Full-table LLM request did not return a valid table CSV.")
+                        state["msg_outputs"] = {
+                            "success": False,
+                            "table_type": table_type,
+                            "highlight_output": highlight_path,
+                            "table_output": None,
+                            "error": "LLM did not return a valid table CSV."
+                        }
+                        return state
+                    if full_records is not None:
+                        df = records_to_dataframe(full_records)
+                    else:
+                        df = filter_total_rows(pd.read_csv(StringIO(full_csv)))
             df.to_csv(table_path, index=False)
         except Exception as e:
             print(f"[ERROR] Failed to parse LLM table CSV: {e}")
@@ -491,6 +623,7 @@ class MsgWorkflowNode:
             "table_type": table_type,
             "highlight_output": highlight_path,
             "table_output": table_path,
+            "table_df": df,
             "docint_df": docint_df
         }
         return state 
\ No newline at end of file
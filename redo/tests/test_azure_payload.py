@@ -0,0 +1,111 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from src.processors.azure_payload import AzurePayloadOptimizer, detect_content_type
+from src.utils.attachment_buffer import AttachmentBuffer
+
+
+def encode(image, image_format="PNG", **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def screenshot(width=800, height=600, box=(200, 150, 400, 250), mode="RGB"):
+    """A white screenshot with one dark table block."""
+    image = Image.new(mode, (width, height), "white")
+    image.paste((20, 40, 80) if mode == "RGB" else (20, 40, 80, 255), box)
+    return image
+
+
+@pytest.mark.parametrize("image_format, expected", [
+    ("PNG", "image/png"), ("JPEG", "image/jpeg"), ("TIFF", "image/tiff"), ("BMP", "image/bmp")
+])
+def test_detect_content_type(image_format, expected):
+    assert detect_content_type(encode(Image.new("RGB", (4, 4)), image_format)) == expected
+
+
+def test_detect_content_type_default():
+    assert detect_content_type(b"GIF89a...") == "application/octet-stream"
+    assert detect_content_type(b"", "image/png") == "image/png"
+
+
+def test_content_box_trims_background_margins_with_padding():
+    optimizer = AzurePayloadOptimizer(margin_padding=8)
+    assert optimizer.content_box(screenshot()) == (192, 142, 408, 258)
+
+
+def test_content_box_padding_stays_inside_the_image():
+    optimizer = AzurePayloadOptimizer(margin_padding=50)
+    assert optimizer.content_box(screenshot(box=(10, 10, 100, 100))) == (0, 0, 150, 150)
+
+
+def test_content_box_keeps_everything_when_trimming_is_off():
+    assert AzurePayloadOptimizer(trim_margins=False).content_box(screenshot()) == (0, 0, 800, 600)
+    assert AzurePayloadOptimizer().content_box(Image.new("RGB", (50, 40), "white")) == (0, 0, 50, 40)
+
+
+def test_signature_changes_with_settings():
+    assert AzurePayloadOptimizer(enabled=False).signature() == "raw"
+    assert AzurePayloadOptimizer().signature() != AzurePayloadOptimizer(margin_padding=4).signature()
+    assert AzurePayloadOptimizer().signature() != AzurePayloadOptimizer(max_side=2000).signature()
+
+
+def test_from_config_reads_azure_payload_section():
+    optimizer = AzurePayloadOptimizer.from_config({"azure_payload": {"enabled": False, "max_side": 1000}})
+    assert not optimizer.enabled
+    assert optimizer.max_side == 1000
+    assert optimizer.margin_padding == 8
+
+
+def test_prepare_crops_png_to_content():
+    attachment = AttachmentBuffer("table.png", encode(screenshot()))
+    data, content_type = AzurePayloadOptimizer().prepare(attachment)
+    assert content_type == "image/png"
+    assert len(data) < len(attachment.data)
+    assert Image.open(io.BytesIO(data)).size == (216, 116)
+
+
+def test_prepare_disabled_sends_original():
+    attachment = AttachmentBuffer("table.png", encode(screenshot()))
+    assert AzurePayloadOptimizer(enabled=False).prepare(attachment) == (attachment.data, "image/png")
+
+
+def test_prepare_leaves_untouched_jpeg_alone():
+    # Noise has no uniform margin to trim
+    full = Image.effect_noise((300, 200), 64).convert("RGB")
+    attachment = AttachmentBuffer("table.jpg", encode(full, "JPEG", quality=60))
+    assert AzurePayloadOptimizer().prepare(attachment) == (attachment.data, "image/jpeg")
+
+
+def test_prepare_keeps_cropped_jpeg_as_jpeg():
+    attachment = AttachmentBuffer("table.jpg", encode(screenshot(), "JPEG", quality=95))
+    data, content_type = AzurePayloadOptimizer(jpeg_quality=90).prepare(attachment)
+    assert content_type == detect_content_type(data) == "image/jpeg"
+    assert Image.open(io.BytesIO(data)).width < 800
+
+
+def test_prepare_downscales_long_sides():
+    image = Image.effect_noise((600, 300), 64).convert("RGB")
+    attachment = AttachmentBuffer("table.png", encode(image))
+    data, content_type = AzurePayloadOptimizer(trim_margins=False, max_side=200).prepare(attachment)
+    assert content_type == "image/png"
+    assert Image.open(io.BytesIO(data)).size == (200, 100)
+
+
+def test_prepare_flattens_transparency_onto_white():
+    image = Image.new("RGBA", (400, 300), (0, 0, 0, 0))
+    image.paste((20, 40, 80, 255), (100, 100, 200, 200))
+    attachment = AttachmentBuffer("table.png", encode(image))
+    data, _ = AzurePayloadOptimizer(trim_margins=False, max_side=100).prepare(attachment)
+    prepared = Image.open(io.BytesIO(data))
+    assert prepared.mode == "RGB"
+    assert prepared.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_prepare_falls_back_to_original_bytes_on_undecodable_data():
+    attachment = AttachmentBuffer("broken.png", b"\x89PNG\r\n\x1a\nnot really a png")
+    assert AzurePayloadOptimizer().prepare(attachment) == (attachment.data, "image/png")
@@ -0,0 +1,77 @@
+import os
+import time
+
+from src.utils.disk_cache import DiskCache
+
+
+def make_cache(tmp_path, **kwargs):
+    return DiskCache(str(tmp_path / "cache"), **kwargs)
+
+
+def test_make_key_is_stable_and_order_sensitive():
+    key = DiskCache.make_key("prompt", "v1", {"b": 2, "a": 1})
+    assert key == DiskCache.make_key("prompt", "v1", {"a": 1, "b": 2})
+    assert key != DiskCache.make_key("v1", "prompt", {"a": 1, "b": 2})
+    assert len(key) == 64
+
+
+def test_put_get_round_trip_counts_hits_and_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.make_key("a")
+    assert cache.get(key) is None
+    cache.put(key, {"rows": [1, 2]})
+    assert cache.get(key) == {"rows": [1, 2]}
+    assert cache.contains(key)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_entries_are_sharded_by_key_prefix(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.make_key("a")
+    cache.put(key, 1)
+    assert (tmp_path / "cache" / key[:2] / f"{key}.json").exists()
+
+
+def test_disabled_cache_never_stores(tmp_path):
+    cache = make_cache(tmp_path, enabled=False)
+    key = cache.make_key("a")
+    cache.put(key, 1)
+    assert cache.get(key) is None
+    assert not cache.contains(key)
+    assert not (tmp_path / "cache").exists()
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.make_key("a")
+    cache.put(key, 1)
+    (tmp_path / "cache" / key[:2] / f"{key}.json").write_text("{not json")
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_eviction_removes_least_recently_used_by_mtime(tmp_path):
+    # Each entry is roughly 200 bytes; the cap fits about four of them
+    cache = make_cache(tmp_path, max_size_mb=900 / (1024 * 1024))
+    keys = [cache.make_key(i) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.put(key, "x" * 100)
+        path = tmp_path / "cache" / key[:2] / f"{key}.json"
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+    # Reading the oldest entry touches it, so the second oldest goes first
+    assert cache.get(keys[0]) == "x" * 100
+    cache.put(cache.make_key("new"), "x" * 100)
+
+    assert cache.contains(keys[0])
+    assert not cache.contains(keys[1])
+    assert cache.contains(cache.make_key("new"))
+
+
+def test_clear_removes_every_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    for i in range(3):
+        cache.put(cache.make_key(i), i)
+    cache.clear()
+    assert not any(cache.contains(cache.make_key(i)) for i in range(3))
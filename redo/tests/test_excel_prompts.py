@@ -0,0 +1,44 @@
+import pytest
+
+from prompts.excel_prompts import get_llm_prompt, get_multi_sheet_llm_prompt
+
+SHEETS = {"WB": "Equity\tDelta\t1\t2", "DBIB": "Credit\tHY_Total\t3\t4"}
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_single_sheet_prompt_asks_for_one_array(compact):
+    prompt = get_llm_prompt("DATA", compact=compact)
+    assert prompt.count("Return ONLY") == 1
+    assert "Return ONLY the JSON array" in prompt
+    assert "JSON object" not in prompt
+    assert prompt.rstrip().endswith("DATA")
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_multi_sheet_prompt_has_one_output_instruction(compact):
+    prompt = get_multi_sheet_llm_prompt(SHEETS, compact=compact)
+    assert prompt.count("Return ONLY") == 1
+    assert "Return ONLY the JSON object" in prompt
+    assert "Return ONLY the JSON array" not in prompt
+    assert '<sheet name="WB">\nEquity\tDelta\t1\t2\n</sheet>' in prompt
+
+
+def test_multi_sheet_instructions_are_a_shared_prefix():
+    first = get_multi_sheet_llm_prompt(SHEETS)
+    second = get_multi_sheet_llm_prompt({"Other": "x"})
+    prefix = first.split("EXCEL DATA:")[0]
+    assert second.startswith(prefix)
+
+
+def test_partial_sheets_are_marked_and_explained():
+    prompt = get_multi_sheet_llm_prompt(SHEETS, partial_sheets=("DBIB",))
+    assert '<sheet name="DBIB" partial="true">' in prompt
+    assert 'Sheets marked partial="true"' in prompt
+    assert "OUTPUT CHECKLIST" in prompt
+
+
+def test_all_partial_sheets_use_the_partial_row_rules():
+    prompt = get_multi_sheet_llm_prompt(SHEETS, partial_sheets=("WB", "DBIB"))
+    assert "ROW SELECTION:" in prompt
+    assert "OUTPUT CHECKLIST" not in prompt
+    assert prompt.count("Return ONLY") == 1
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from src.utils.hedging import DeadlineExceeded, HedgePolicy, LatencyTracker
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def sleeper(delays, calls, result=None):
+    """Build an attempt that sleeps per model and answers with the model name."""
+    async def attempt(request, deadline):
+        calls.append(request["model"])
+        await asyncio.sleep(delays[request["model"]])
+        return result(request) if result else request["model"]
+    return attempt
+
+
+def test_tracker_needs_min_samples():
+    tracker = LatencyTracker(percentile=50, min_samples=3)
+    tracker.record("m", 1.0)
+    tracker.record("m", 3.0)
+    assert tracker.percentile_for("m") is None
+    tracker.record("m", 2.0)
+    assert tracker.percentile_for("m") == 2.0
+    assert tracker.percentile_for("other") is None
+
+
+def test_hedge_delay_is_clamped():
+    tracker = LatencyTracker(percentile=100, min_samples=1)
+    policy = HedgePolicy(initial_delay=30.0, min_delay=2.0, max_delay=10.0, tracker=tracker)
+    assert policy.hedge_delay("m") == 10.0
+    tracker.record("m", 0.5)
+    assert policy.hedge_delay("m") == 2.0
+    tracker.record("m", 4.0)
+    assert policy.hedge_delay("m") == 4.0
+
+
+def test_deadline_disabled_by_zero():
+    policy = HedgePolicy(deadline=0)
+    assert policy.deadline_at() is None
+    assert HedgePolicy.request_options(None) == {}
+    assert HedgePolicy(deadline=5).deadline_at() is not None
+
+
+def test_sync_call_passes_deadline_and_never_hedges():
+    seen = []
+    policy = HedgePolicy(enabled=True, deadline=60)
+    result = policy.call(lambda request, deadline: seen.append(deadline) or "ok", {"model": "m"})
+    assert result == "ok"
+    assert len(seen) == 1 and seen[0] is not None
+
+
+def test_disabled_policy_only_applies_deadline():
+    calls = []
+    policy = HedgePolicy(deadline=0.05, initial_delay=0.01, min_delay=0.0)
+    with pytest.raises(DeadlineExceeded):
+        run(policy.call_async(sleeper({"m": 1.0}, calls), {"model": "m"}))
+    assert calls == ["m"]
+
+
+def test_slow_primary_is_hedged_on_fallback_model():
+    calls = []
+    policy = HedgePolicy(enabled=True, deadline=5, initial_delay=0.02, min_delay=0.0,
+                         fallback_model="fast")
+    result = run(policy.call_async(sleeper({"slow": 1.0, "fast": 0.0}, calls), {"model": "slow"}))
+    assert result == "fast"
+    assert calls == ["slow", "fast"]
+    assert len(policy.tracker._samples["fast"]) == 1
+
+
+def test_fast_primary_is_not_hedged():
+    calls = []
+    policy = HedgePolicy(enabled=True, deadline=5, initial_delay=1.0, min_delay=0.0)
+    assert run(policy.call_async(sleeper({"m": 0.0}, calls), {"model": "m"})) == "m"
+    assert calls == ["m"]
+
+
+def test_invalid_primary_starts_hedge_at_once():
+    calls = []
+    policy = HedgePolicy(enabled=True, deadline=5, initial_delay=10.0, min_delay=0.0, max_delay=10.0,
+                         fallback_model="b")
+    attempt = sleeper({"a": 0.0, "b": 0.0}, calls)
+    result = run(policy.call_async(attempt, {"model": "a"}, is_valid=lambda response: response == "b"))
+    assert result == "b"
+    assert calls == ["a", "b"]
+
+
+def test_streaming_requests_are_not_hedged():
+    calls = []
+    policy = HedgePolicy(enabled=True, deadline=5, initial_delay=0.0, min_delay=0.0, fallback_model="b")
+    result = run(policy.call_async(sleeper({"a": 0.05, "b": 0.0}, calls), {"model": "a", "stream": True}))
+    assert result == "a"
+    assert calls == ["a"]
+
+
+def test_errors_propagate_when_every_copy_fails():
+    async def attempt(request, deadline):
+        raise ValueError(request["model"])
+
+    policy = HedgePolicy(enabled=True, deadline=5, initial_delay=0.0, min_delay=0.0, fallback_model="b")
+    with pytest.raises(ValueError, match="a"):
+        run(policy.call_async(attempt, {"model": "a"}))
+
+
+def test_hedged_call_raises_at_deadline_and_cancels_both():
+    cancelled = []
+
+    async def attempt(request, deadline):
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            cancelled.append(request["model"])
+            raise
+
+    policy = HedgePolicy(enabled=True, deadline=0.1, initial_delay=0.01, min_delay=0.0, fallback_model="b")
+    with pytest.raises(DeadlineExceeded):
+        run(policy.call_async(attempt, {"model": "a"}))
+    assert sorted(cancelled) == ["a", "b"]
@@ -0,0 +1,122 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils.json_stream import JsonArrayStreamParser, StreamFormatError
+
+ROWS = [
+    {"RISK_TYPE": "Equity", "GREEK_TYPE": "Delta [net]", "RIDER_VALUE": 1.5},
+    {"RISK_TYPE": "Credit \"HY\"", "GREEK_TYPE": "{x}", "RIDER_VALUE": -2},
+    ["Rho", "", 3, 4],
+]
+
+
+def feed_chunks(text, size):
+    parser = JsonArrayStreamParser()
+    rows = []
+    for start in range(0, len(text), size):
+        rows.extend(parser.feed(text[start:start + size]))
+    return parser, rows
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10_000])
+def test_rows_are_the_same_for_any_chunk_boundaries(size):
+    parser, rows = feed_chunks(json.dumps(ROWS), size)
+    assert rows == ROWS
+    assert parser.done
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps({"rows": ROWS}),
+    "```json\n" + json.dumps(ROWS) + "\n```",
+    "The rows [are] below:\n" + json.dumps(ROWS),
+    "See [1] and [a, b]: " + json.dumps(ROWS),
+])
+def test_row_array_is_found_after_prose_and_wrappers(text):
+    _, rows = feed_chunks(text, 5)
+    assert rows == ROWS
+
+
+def test_rows_are_returned_as_soon_as_they_complete():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"a": 1}, {"b"') == [{"a": 1}]
+    assert parser.feed(': 2}') == [{"b": 2}]
+    assert not parser.done
+    assert parser.feed("]") == []
+    assert parser.done
+
+
+def test_text_after_the_array_is_ignored():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[[1], [2]] trailing [3]') == [[1], [2]]
+    assert parser.feed("[[4]]") == []
+
+
+def test_completed_text_is_not_kept_in_the_buffer():
+    parser = JsonArrayStreamParser()
+    parser.feed("[" + ",".join(json.dumps(row) for row in ROWS * 50))
+    assert len(parser.buffer) < 5
+
+
+@pytest.mark.parametrize("text", [
+    '[{"a": 1}, "bare string"]',
+    '[{"a": 1}, 42]',
+    '[{"a": 1}, {"b": }]',
+    '[{"a": 1}}',
+])
+def test_malformed_rows_after_the_first_raise(text):
+    with pytest.raises(StreamFormatError):
+        feed_chunks(text, 4)
+
+
+def test_empty_array():
+    parser, rows = feed_chunks('{"rows": []}', 3)
+    assert rows == [] and parser.done
+
+
+def chunk(text=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=text))] if text is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def stream_attempt(**kwargs):
+    pytest.importorskip("pandas")
+    pytest.importorskip("openai")
+    from src.utils.llm_client import _StreamAttempt
+    return _StreamAttempt(**kwargs)
+
+
+def test_stream_attempt_decodes_compact_rows_and_keeps_usage():
+    attempt = stream_attempt(constants={"VALUATION_DATE": "20240801", "PRODUCT_TYPE": "DBIB"})
+    records = []
+    for text in ['{"rows": [["RISK_TYPE", "GREEK_TYPE", "RIDER_VALUE", "ASSET_VALUE"],', ' ["Equity", "Delta", 1, 2]', "]}"]:
+        records.extend(attempt.feed(chunk(text)))
+    attempt.feed(chunk(usage={"prompt_tokens": 10}))
+    attempt.finish()
+    assert [record["RISK_TYPE"] for record in records] == ["Equity"]
+    assert attempt.usage == {"prompt_tokens": 10}
+    assert attempt.text.startswith('{"rows"')
+
+
+def test_stream_attempt_rejects_rows_that_break_the_contract():
+    attempt = stream_attempt(constants={"VALUATION_DATE": "20240801", "PRODUCT_TYPE": "DBIB"})
+    with pytest.raises(StreamFormatError):
+        attempt.feed(chunk('[["Equity", "Delta", 1]]'))
+
+
+def test_stream_attempt_finish_requires_a_closed_non_empty_array():
+    unclosed = stream_attempt()
+    unclosed.feed(chunk('[{"RISK_TYPE": "Equity", "RIDER_VALUE": 1, "ASSET_VALUE": 2}'))
+    with pytest.raises(StreamFormatError):
+        unclosed.finish()
+
+    empty = stream_attempt()
+    empty.feed(chunk("[]"))
+    with pytest.raises(StreamFormatError):
+        empty.finish()
+
+    # An empty source table may legitimately produce no rows
+    expected_empty = stream_attempt(expected_rows=0)
+    expected_empty.feed(chunk("[]"))
+    expected_empty.finish()
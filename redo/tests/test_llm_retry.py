@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+openai = pytest.importorskip("openai")
+
+from src.utils import llm_retry
+from src.utils.llm_retry import RetryPolicy, header_delay, parse_reset_duration
+
+
+def api_error(headers=None, status=429):
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1s", 1.0), ("20ms", 0.02), ("6m0s", 360.0), ("1h2m", 3720.0), ("1.5s", 1.5), ("", None), ("soon", None)
+])
+def test_parse_reset_duration(value, expected):
+    assert parse_reset_duration(value) == expected
+
+
+def test_header_delay_prefers_retry_after_ms():
+    assert header_delay(api_error({"retry-after-ms": "250", "retry-after": "9"})) == 0.25
+
+
+def test_header_delay_reads_retry_after_seconds():
+    assert header_delay(api_error({"retry-after": "3"})) == 3.0
+
+
+def test_header_delay_uses_the_exhausted_quota_reset():
+    headers = {
+        "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s",
+        "x-ratelimit-remaining-tokens": "10", "x-ratelimit-reset-tokens": "1m"
+    }
+    assert header_delay(api_error(headers)) == 2.0
+
+
+def test_header_delay_without_hint():
+    assert header_delay(api_error()) is None
+    assert header_delay(ValueError("no response")) is None
+
+
+class FakeLimiter:
+    def __init__(self):
+        self.acquired = []
+        self.blocked = []
+
+    def acquire(self, tokens=0, deadline=None):
+        self.acquired.append((tokens, deadline))
+
+    def block_for(self, seconds):
+        self.blocked.append(seconds)
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(llm_retry.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_call_retries_and_blocks_the_shared_quota(no_sleep):
+    limiter = FakeLimiter()
+    policy = RetryPolicy(max_retries=3, base_delay=0.0, rate_limiter=limiter)
+    outcomes = [api_error({"retry-after": "2"}), "ok"]
+
+    def func():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert policy.call(func, estimated_tokens=42) == "ok"
+    assert limiter.acquired == [(42, None), (42, None)]
+    assert limiter.blocked == no_sleep == [2.0]
+
+
+def test_call_gives_up_after_max_retries(no_sleep):
+    policy = RetryPolicy(max_retries=2, base_delay=0.01)
+    calls = []
+
+    def func():
+        calls.append(1)
+        raise api_error()
+
+    with pytest.raises(openai.RateLimitError):
+        policy.call(func)
+    assert len(calls) == 3
+
+
+def test_call_does_not_retry_past_the_deadline(no_sleep, monkeypatch):
+    monkeypatch.setattr(llm_retry.time, "monotonic", lambda: 100.0)
+    policy = RetryPolicy(max_retries=5, base_delay=0.0)
+    calls = []
+
+    def func():
+        calls.append(1)
+        raise api_error({"retry-after": "10"})
+
+    with pytest.raises(openai.RateLimitError):
+        policy.call(func, deadline=105.0)
+    assert len(calls) == 1
+
+
+def test_non_retryable_errors_propagate(no_sleep):
+    policy = RetryPolicy(max_retries=5)
+    with pytest.raises(ValueError):
+        policy.call(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+    assert no_sleep == []
+
+
+def test_backoff_is_bounded_by_max_delay():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    error = SimpleNamespace()
+    assert all(0 <= policy._delay(error, attempt) <= 4.0 for attempt in range(10))
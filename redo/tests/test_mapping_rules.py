@@ -0,0 +1,109 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("yaml")
+
+from src.utils.mapping_rules import MappingRules, find_value_columns, grid_rows, merge_records
+
+# mapping.yml lives next to the redo/ project, where the default config points
+MAPPING_FILE = Path(__file__).resolve().parents[2] / "mapping.yml"
+CONSTANTS = {"VALUATION_DATE": "20240801", "PRODUCT_TYPE": "WB"}
+
+
+@pytest.fixture(scope="module")
+def rules():
+    if not MAPPING_FILE.exists():
+        pytest.skip("mapping.yml not available")
+    return MappingRules.from_file(str(MAPPING_FILE))
+
+
+@pytest.mark.parametrize("label, expected", [
+    ("Equity Delta", ("Equity", "Delta")),
+    ("equity - delta P&L", ("Equity", "Delta")),
+    ("Equity Gamma Residual", ("Equity", "Gamma_Residual")),
+    ("Dynamic Rho", ("Interest_Rate", "Rho")),
+    ("HY Total", ("Credit", "HY_Total")),
+    ("Passage of Time", ("Passage_Of_Time", "")),
+    ("Fund Basis & Fund Mapping", ("Fund_Basis_Fund_Mapping", "")),
+    ("Something new", None),
+])
+def test_match_against_mapping_yml(rules, label, expected):
+    assert rules.match(label) == expected
+
+
+def test_first_rule_in_file_order_wins():
+    rules = MappingRules([
+        {"pattern": "Delta", "risk_type": "First", "greek_type": "A"},
+        {"pattern": "^Equity Delta$", "risk_type": "Second", "greek_type": "B"},
+    ])
+    assert rules.match("Equity Delta") == ("First", "A")
+
+
+def test_flags_are_scoped_to_their_rule():
+    rules = MappingRules([
+        {"pattern": "^delta$", "risk_type": "Strict", "greek_type": ""},
+        {"pattern": "^gamma$", "risk_type": "Loose", "greek_type": "", "flags": "IGNORECASE"},
+    ])
+    assert rules.match("Delta") is None
+    assert rules.match("GAMMA") == ("Loose", "")
+
+
+def test_split_rows_uses_sections_and_skips_totals(rules):
+    rows = [
+        ("Equity", None, None),          # section header
+        ("Delta", "1,234", "(5)"),       # "Equity Delta"
+        ("Mystery Greek", "7", "8"),     # needs the LLM
+        ("Total Equity", "9", "9"),      # never output
+        ("Passage of Time", "-", None),  # dash is a value of zero
+        ("Blank Row", None, None),
+    ]
+    matched, unmatched = rules.split_rows(rows, CONSTANTS)
+    assert sorted(matched) == [1, 4]
+    assert matched[1]["RISK_TYPE"] == "Equity" and matched[1]["GREEK_TYPE"] == "Delta"
+    assert (matched[1]["RIDER_VALUE"], matched[1]["ASSET_VALUE"]) == (1234.0, -5.0)
+    assert matched[1]["PRODUCT_TYPE"] == "WB"
+    assert matched[4]["RIDER_VALUE"] == 0.0
+    assert unmatched == {2: "Equity Mystery Greek"}
+
+
+def test_unreadable_values_go_to_the_llm(rules):
+    matched, unmatched = rules.split_rows([("Equity Delta", "12O.5", "1")], CONSTANTS)
+    assert matched == {}
+    assert unmatched == {0: "Equity Delta"}
+
+
+def record(risk, greek, rider=1.0):
+    return {**CONSTANTS, "RISK_TYPE": risk, "GREEK_TYPE": greek, "RIDER_VALUE": rider, "ASSET_VALUE": 0.0}
+
+
+def test_merge_records_places_llm_rows_by_label_in_table_order():
+    matched = {0: record("Equity", "Delta"), 3: record("Credit", "HY_Total")}
+    unmatched = {1: "Equity Vanna", 2: "New Business"}
+    # The LLM answered out of order and repeated a rule-extracted pair
+    llm_records = [record("New_Business", ""), record("Equity", "Delta"), record("Equity", "Vanna")]
+    merged = merge_records(matched, unmatched, llm_records)
+    assert [(r["RISK_TYPE"], r["GREEK_TYPE"]) for r in merged] == [
+        ("Equity", "Delta"), ("Equity", "Vanna"), ("New_Business", ""), ("Credit", "HY_Total")
+    ]
+
+
+def test_merge_records_falls_back_to_table_order_without_label_overlap():
+    merged = merge_records({}, {0: "Row A", 1: "Row B"}, [record("X", "1"), record("Y", "2")])
+    assert [r["RISK_TYPE"] for r in merged] == ["X", "Y"]
+
+
+def test_merge_records_rejects_a_row_count_mismatch():
+    assert merge_records({}, {0: "Row A", 1: "Row B"}, [record("X", "1")]) is None
+
+
+def test_find_value_columns_and_grid_rows():
+    grid = [
+        ["WB Total Dynamic Hedge P&L", "", "", ""],
+        ["", "", "Liability", "Asset"],
+        ["Equity", "Delta", "1", "2"],
+    ]
+    assert find_value_columns(grid) == (1, 2, 3)
+    assert grid_rows(grid[2:], 2, 3) == [("Equity Delta", "1", "2")]
+    assert find_value_columns([["Label", "Daily Net"]]) is None
@@ -0,0 +1,152 @@
+import shutil
+import threading
+
+import pytest
+
+pytest.importorskip("pytesseract")
+Image = pytest.importorskip("PIL.Image")
+
+from src.utils import ocr_service
+from src.utils.ocr_service import OcrService
+
+
+class FakeEngine:
+    """Stand-in for PyTessBaseAPI recording the calls made on it."""
+
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.variables = {"tessedit_char_whitelist": ""}
+        self.psm = None
+        self.ended = False
+        FakeEngine.instances.append(self)
+
+    def GetVariableAsString(self, name):
+        return self.variables.get(name)
+
+    def SetVariable(self, name, value):
+        self.variables[name] = value
+
+    def SetPageSegMode(self, psm):
+        self.psm = psm
+
+    def SetImage(self, image):
+        self.image = image
+
+    def GetUTF8Text(self):
+        return f"psm={self.psm} whitelist={self.variables['tessedit_char_whitelist']}"
+
+    def Clear(self):
+        pass
+
+    def End(self):
+        self.ended = True
+
+
+@pytest.fixture
+def fake_tesserocr(monkeypatch):
+    FakeEngine.instances = []
+    monkeypatch.setattr(ocr_service, "PyTessBaseAPI", FakeEngine)
+    monkeypatch.setattr(ocr_service, "PSM", type("PSM", (), {"AUTO": 3}), raising=False)
+    return FakeEngine
+
+
+def test_falls_back_to_pytesseract_without_tesserocr(monkeypatch):
+    monkeypatch.setattr(ocr_service, "PyTessBaseAPI", None)
+    assert OcrService(workers=1, backend="auto").backend == "pytesseract"
+    assert OcrService(workers=1, backend="tesserocr").backend == "pytesseract"
+
+
+def test_backend_selection_with_tesserocr(fake_tesserocr):
+    assert OcrService(workers=1).backend == "tesserocr"
+    assert OcrService(workers=1, backend="pytesseract").backend == "pytesseract"
+
+
+def test_limits_openmp_threads_only_for_parallel_engines(monkeypatch):
+    # setenv first so the variable is restored after the test
+    monkeypatch.setenv("OMP_THREAD_LIMIT", "")
+    monkeypatch.delenv("OMP_THREAD_LIMIT")
+    OcrService(workers=1)
+    assert "OMP_THREAD_LIMIT" not in ocr_service.os.environ
+    OcrService(workers=4)
+    assert ocr_service.os.environ["OMP_THREAD_LIMIT"] == "1"
+
+
+def test_config_string():
+    assert OcrService._config(None, {}) == ""
+    assert OcrService._config(7, {"tessedit_char_whitelist": "0123"}) == "--psm 7 -c tessedit_char_whitelist=0123"
+
+
+def test_pytesseract_backend_passes_lang_and_config(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ocr_service, "PyTessBaseAPI", None)
+    monkeypatch.setattr(ocr_service.pytesseract, "image_to_string",
+                        lambda image, lang, config: calls.append((lang, config)) or "text")
+    service = OcrService(workers=1, lang="eng+fra")
+    assert service.image_to_string(Image.new("L", (10, 10)), psm=6) == "text"
+    assert calls == [("eng+fra", "--psm 6")]
+
+
+def test_engines_are_reused_and_settings_restored(fake_tesserocr):
+    service = OcrService(workers=2, lang="eng", tessdata_path="/tessdata")
+    image = Image.new("L", (10, 10))
+    assert service.image_to_string(image, psm=7, variables={"tessedit_char_whitelist": "01"}) == "psm=7 whitelist=01"
+    assert service.image_to_string(image) == "psm=3 whitelist="
+    assert len(fake_tesserocr.instances) == 1
+    assert fake_tesserocr.instances[0].kwargs == {"lang": "eng", "path": "/tessdata"}
+
+
+def test_engine_count_is_capped_by_workers(fake_tesserocr):
+    service = OcrService(workers=2)
+    release = threading.Event()
+    started = threading.Barrier(3)
+
+    def hold():
+        with service._engine(None, {}):
+            started.wait(timeout=5)
+            release.wait(timeout=5)
+
+    threads = [threading.Thread(target=hold) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    started.wait(timeout=5)
+    # Both engines are checked out; a third call waits for one instead of creating it
+    waiter = threading.Thread(target=service.image_to_string, args=(Image.new("L", (4, 4)),))
+    waiter.start()
+    waiter.join(timeout=0.1)
+    assert waiter.is_alive()
+    release.set()
+    for thread in threads + [waiter]:
+        thread.join(timeout=5)
+    assert len(fake_tesserocr.instances) == 2
+
+
+def test_failed_engine_creation_frees_its_slot(fake_tesserocr, monkeypatch):
+    service = OcrService(workers=1)
+    monkeypatch.setattr(service, "_new_engine", lambda: (_ for _ in ()).throw(RuntimeError("no traineddata")))
+    with pytest.raises(RuntimeError):
+        service.image_to_string(Image.new("L", (4, 4)))
+    assert service._created == 0
+
+
+def test_close_ends_idle_engines(fake_tesserocr):
+    service = OcrService(workers=1)
+    service.image_to_string(Image.new("L", (4, 4)))
+    service.close()
+    assert fake_tesserocr.instances[0].ended
+    assert service._created == 0
+    service.image_to_string(Image.new("L", (4, 4)))
+    assert len(fake_tesserocr.instances) == 2
+
+
+@pytest.mark.skipif(shutil.which("tesseract") is None, reason="tesseract is not installed")
+def test_recognizes_text_with_tesseract():
+    from PIL import ImageDraw
+
+    image = Image.new("L", (200, 60), 255)
+    ImageDraw.Draw(image).text((10, 20), "12345", fill=0)
+    image = image.resize((800, 240))
+    service = OcrService(workers=1)
+    assert "123" in service.image_to_string(image, psm=7, variables={"tessedit_char_whitelist": "0123456789"})
+    service.close()
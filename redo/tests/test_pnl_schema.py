@@ -0,0 +1,158 @@
+import json
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from src.utils.pnl_schema import (
+    PNL_COLUMNS, PnlRowDecoder, RowCollector, coerce_pnl_record, extract_json, filter_total_rows,
+    multi_sheet_response_format, parse_compact_records, parse_pnl_records, parse_sheet_records,
+    records_to_dataframe
+)
+
+ROW = {"VALUATION_DATE": "20240801", "PRODUCT_TYPE": "DBIB", "RISK_TYPE": "Equity",
+       "GREEK_TYPE": "Delta", "RIDER_VALUE": 123.45, "ASSET_VALUE": -6}
+
+
+def test_extract_json_skips_prose_and_fences():
+    content = 'Here you go [sic]:\n```json\n{"rows": [{"a": "[x]"}]}\n```'
+    assert extract_json(content) == {"rows": [{"a": "[x]"}]}
+
+
+def test_extract_json_returns_none_without_json():
+    assert extract_json("no table here") is None
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (None, 0.0), ("", 0.0), ("-", 0.0), ("1,234.5", 1234.5), ("(12.5)", -12.5), (7, 7.0)
+])
+def test_coerce_pnl_record_values(raw, expected):
+    record = coerce_pnl_record(dict(ROW, RIDER_VALUE=raw))
+    assert record["RIDER_VALUE"] == expected
+    assert isinstance(record["ASSET_VALUE"], float)
+
+
+def test_coerce_pnl_record_blank_labels():
+    assert coerce_pnl_record(dict(ROW, GREEK_TYPE=None))["GREEK_TYPE"] == ""
+
+
+def test_parse_pnl_records_accepts_wrapper_and_bare_array():
+    assert parse_pnl_records('{"rows": [%s]}' % json.dumps(ROW)) == [coerce_pnl_record(ROW)]
+    assert parse_pnl_records("[%s]" % json.dumps(ROW)) == [coerce_pnl_record(ROW)]
+
+
+def test_parse_pnl_records_rejects_non_numeric_values():
+    assert parse_pnl_records('[%s]' % json.dumps(dict(ROW, RIDER_VALUE="n/a"))) is None
+
+
+def test_parse_pnl_records_without_rows_array():
+    assert parse_pnl_records('{"data": 1}') is None
+
+
+def test_row_decoder_requires_schema_keys():
+    decoder = PnlRowDecoder()
+    assert decoder.decode(ROW)["RISK_TYPE"] == "Equity"
+    with pytest.raises(ValueError):
+        decoder.decode({"RISK_TYPE": "Equity"})
+
+
+def test_records_to_dataframe_column_order():
+    df = records_to_dataframe([coerce_pnl_record(ROW)])
+    assert list(df.columns) == PNL_COLUMNS
+
+
+def test_empty_row_list_is_a_failed_extraction():
+    from src.utils.llm_client import LLMClient
+
+    parse = LLMClient._require_rows(parse_pnl_records)
+    assert parse('{"rows": []}') is None
+    assert parse("[]") is None
+    assert parse("[%s]" % json.dumps(ROW)) == [coerce_pnl_record(ROW)]
+    # An empty source table legitimately yields no rows
+    assert LLMClient._require_rows(parse_pnl_records, expected_rows=0)("[]") == []
+
+
+def test_empty_sheet_fails_a_multi_sheet_extraction():
+    from src.utils.llm_client import LLMClient
+
+    parse = LLMClient._require_rows(lambda text: {"WB": [ROW], "DBIB": []})
+    assert parse("ignored") is None
+
+
+CONSTANTS = {"VALUATION_DATE": "20240801", "PRODUCT_TYPE": "DBIB"}
+
+
+def test_parse_compact_records_fills_constants_and_coerces_values():
+    content = '[["RISK_TYPE", "GREEK_TYPE", "RIDER_VALUE", "ASSET_VALUE"], ["Equity", "Delta", "1,234.5", "(2)"]]'
+    assert parse_compact_records(content, CONSTANTS) == [{
+        "VALUATION_DATE": "20240801", "PRODUCT_TYPE": "DBIB", "RISK_TYPE": "Equity",
+        "GREEK_TYPE": "Delta", "RIDER_VALUE": 1234.5, "ASSET_VALUE": -2.0
+    }]
+
+
+def test_parse_compact_records_follows_a_reordered_header():
+    content = '{"rows": [["asset_value", "RISK_TYPE", "GREEK_TYPE", "RIDER_VALUE"], [5, "Credit", "", "-"]]}'
+    record = parse_compact_records(content, CONSTANTS)[0]
+    assert (record["RISK_TYPE"], record["RIDER_VALUE"], record["ASSET_VALUE"]) == ("Credit", 0.0, 5.0)
+
+
+def test_parse_compact_records_without_header():
+    records = parse_compact_records('[["Passage_Of_Time", "", 1, 2]]', CONSTANTS)
+    assert records[0]["GREEK_TYPE"] == "" and records[0]["ASSET_VALUE"] == 2.0
+
+
+@pytest.mark.parametrize("content", [
+    '[["Equity", "Delta", 1]]',
+    '[{"RISK_TYPE": "Equity"}]',
+    '[["Equity", "Delta", "abc", 1]]',
+    '{"data": []}',
+])
+def test_parse_compact_records_rejects_contract_violations(content):
+    assert parse_compact_records(content, CONSTANTS) is None
+
+
+def test_parse_sheet_records_per_sheet_contract():
+    content = json.dumps({
+        "WB": [["RISK_TYPE", "GREEK_TYPE", "RIDER_VALUE", "ASSET_VALUE"], ["Equity", "Delta", 1, 2]],
+        "DBIB": [ROW]
+    })
+    records = parse_sheet_records(content, {"WB": CONSTANTS, "DBIB": None})
+    assert records["WB"][0]["PRODUCT_TYPE"] == "DBIB"
+    assert records["DBIB"] == [coerce_pnl_record(ROW)]
+
+
+def test_parse_sheet_records_missing_sheet_fails():
+    assert parse_sheet_records(json.dumps({"WB": []}), {"WB": None, "DBIB": None}) is None
+
+
+def test_multi_sheet_response_format_requires_every_sheet():
+    schema = multi_sheet_response_format(["WB", "DBIB"], compact=True)["json_schema"]["schema"]
+    assert schema["required"] == ["WB", "DBIB"]
+    assert schema["properties"]["WB"]["items"]["type"] == "array"
+
+
+def test_filter_total_rows_keeps_hy_total():
+    df = pd.DataFrame({"RISK_TYPE": ["Equity", "Total Equity", "HY_Total", "Sub Total"], "RIDER_VALUE": [1, 2, 3, 4]})
+    filtered = filter_total_rows(df)
+    assert list(filtered["RISK_TYPE"]) == ["Equity", "HY_Total"]
+    assert list(filtered.index) == [0, 1]
+
+
+def test_filter_total_rows_without_risk_column_checks_every_cell():
+    df = pd.DataFrame([["Delta", "1"], ["Grand total", "2"]])
+    assert len(filter_total_rows(df)) == 1
+
+
+def test_row_collector_drops_totals_and_restarts_on_a_retry():
+    collector = RowCollector()
+    collector(0, record_for("Equity"))
+    collector(1, record_for("Total Equity"))
+    # A retried stream delivers from index 0 again
+    collector(0, record_for("Credit"))
+    collector(1, record_for("HY_Total"))
+    assert [r["RISK_TYPE"] for r in collector.records] == ["Credit", "HY_Total"]
+    assert RowCollector.collect([record_for("Total"), record_for("Rho")]) == [record_for("Rho")]
+
+
+def record_for(risk_type):
+    return dict(ROW, RISK_TYPE=risk_type)
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from src.utils import rate_limiter as rate_limiter_module
+from src.utils.hedging import DeadlineExceeded
+from src.utils.rate_limiter import SharedRateLimiter
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, "time", clock.time)
+    return clock
+
+
+def make_limiter(tmp_path, **kwargs):
+    return SharedRateLimiter(str(tmp_path / "quota.json"), **kwargs)
+
+
+def test_reserve_takes_from_full_buckets(tmp_path, clock):
+    limiter = make_limiter(tmp_path, requests_per_minute=60, tokens_per_minute=600)
+    assert limiter._reserve(100) == 0
+    state = json.loads((tmp_path / "quota.json").read_text())
+    assert state["requests"] == 59
+    assert state["tokens"] == 500
+
+
+def test_empty_bucket_reports_the_refill_wait(tmp_path, clock):
+    limiter = make_limiter(tmp_path, requests_per_minute=60, tokens_per_minute=600)
+    assert limiter._reserve(600) == 0
+    # 300 tokens refill at 10 tokens/s
+    assert limiter._reserve(300) == pytest.approx(30.0)
+
+
+def test_buckets_refill_with_elapsed_time(tmp_path, clock):
+    limiter = make_limiter(tmp_path, requests_per_minute=60, tokens_per_minute=600)
+    assert limiter._reserve(600) == 0
+    clock.now += 30
+    assert limiter._reserve(300) == 0
+
+
+def test_oversized_request_is_capped_at_the_bucket(tmp_path, clock):
+    limiter = make_limiter(tmp_path, requests_per_minute=60, tokens_per_minute=600)
+    assert limiter._reserve(10_000) == 0
+
+
+def test_limiters_on_one_file_share_the_quota(tmp_path, clock):
+    first = make_limiter(tmp_path, requests_per_minute=1, tokens_per_minute=1000)
+    second = make_limiter(tmp_path, requests_per_minute=1, tokens_per_minute=1000)
+    assert first._reserve(0) == 0
+    assert second._reserve(0) == pytest.approx(60.0)
+
+
+def test_block_for_pauses_every_request(tmp_path, clock):
+    limiter = make_limiter(tmp_path)
+    limiter.block_for(12)
+    assert limiter._reserve(0) == pytest.approx(12.0)
+    clock.now += 12
+    assert limiter._reserve(0) == 0
+
+
+def test_acquire_raises_when_the_wait_passes_the_deadline(tmp_path, clock, monkeypatch):
+    limiter = make_limiter(tmp_path)
+    limiter.block_for(30)
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", lambda: 50.0)
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(deadline=60.0)
+
+
+def test_acquire_waits_then_admits(tmp_path, clock, monkeypatch):
+    limiter = make_limiter(tmp_path)
+    limiter.block_for(3)
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(rate_limiter_module.time, "sleep", sleep)
+    limiter.acquire()
+    assert len(sleeps) == 1 and sleeps[0] >= 3
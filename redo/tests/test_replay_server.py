@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from replay_server import (
+    CACHE_MIN_PREFIX_CHARS, CACHE_PREFIX_STEP_CHARS, PromptCacheSimulator, RecordingStore, ReplayHandler,
+    ReplayState, parse_latency, request_key
+)
+
+MESSAGES = [{"role": "user", "content": "Extract the table"}]
+
+
+def chat_body(content="Extract the table", **extra):
+    return dict({"model": "gpt-test", "messages": [{"role": "user", "content": content}]}, **extra)
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Start replay servers on free ports; yields a factory returning each base URL."""
+    servers = []
+
+    def start(**options):
+        args = SimpleNamespace(**dict({
+            "recordings": str(tmp_path / f"recordings{len(servers)}.jsonl"), "latency": "0",
+            "replay_latency": False, "chunk_delay": 0.0, "rate_429": 0.0, "rate_malformed": 0.0,
+            "fallback_content": None, "upstream": None
+        }, **options))
+        server = ThreadingHTTPServer(("127.0.0.1", 0), ReplayHandler)
+        server.daemon_threads = True
+        server.replay_state = ReplayState(args)
+        server.verbose = False
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1", server.replay_state
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(url, data, content_type="application/json"):
+    """POST and return (status, body bytes), without raising on error statuses."""
+    if not isinstance(data, bytes):
+        data = json.dumps(data).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": content_type}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read(), dict(response.headers)
+    except urllib.error.HTTPError as e:
+        return e.code, e.read(), dict(e.headers)
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def record(state, body, content):
+    state.store.add({"key": request_key(body), "model": "gpt-test", "content": content, "latency": 0.0})
+
+
+@pytest.mark.parametrize("spec, low, high", [
+    ("0", 0.0, 0.0), ("fixed:0.25", 0.25, 0.25), ("uniform:1,2", 1.0, 2.0), ("normal:0,0.001", 0.0, 0.01)
+])
+def test_parse_latency(spec, low, high):
+    sampler = parse_latency(spec)
+    assert all(low <= sampler() <= high for _ in range(20))
+
+
+def test_parse_latency_rejects_unknown_distribution():
+    with pytest.raises(ValueError):
+        parse_latency("poisson:3")
+
+
+def test_request_key_ignores_model_but_not_schema():
+    body = {"model": "a", "messages": MESSAGES, "response_format": {"type": "json_schema", "json_schema": {"name": "rows"}}}
+    assert request_key(body) == request_key(dict(body, model="b"))
+    assert request_key(body) != request_key(dict(body, response_format={"type": "json_object"}))
+    assert request_key(body) != request_key(dict(body, messages=[{"role": "user", "content": "other"}]))
+
+
+def test_recording_store_persists_entries(tmp_path):
+    path = tmp_path / "nested" / "recordings.jsonl"
+    store = RecordingStore(str(path))
+    store.add({"key": "k", "model": "m", "content": "[]", "latency": 0.1})
+    assert RecordingStore(str(path)).get("k")["content"] == "[]"
+
+
+def test_prompt_cache_simulator_reports_shared_prefix():
+    cache = PromptCacheSimulator()
+    prefix = "x" * (CACHE_MIN_PREFIX_CHARS + CACHE_PREFIX_STEP_CHARS)
+    assert cache.cached_chars(prefix + "first") == 0
+    assert cache.cached_chars(prefix + "second") == len(prefix)
+    assert cache.cached_chars("short prompt") == 0
+
+
+def test_replays_recorded_response(serve):
+    url, state = serve()
+    record(state, chat_body(), '[{"RISK_TYPE": "Delta"}]')
+    status, data, _ = post(f"{url}/chat/completions", chat_body(model="fallback-model"))
+    completion = json.loads(data)
+    assert status == 200
+    assert completion["model"] == "fallback-model"
+    assert completion["choices"][0]["message"]["content"] == '[{"RISK_TYPE": "Delta"}]'
+    assert state.counters["replayed"] == 1
+
+
+def test_miss_is_404_unless_fallback_content(serve):
+    url, _ = serve()
+    status, data, _ = post(f"{url}/chat/completions", chat_body())
+    assert status == 404
+    assert json.loads(data)["error"]["type"] == "replay_miss"
+
+    url, state = serve(fallback_content="[]")
+    status, data, _ = post(f"{url}/chat/completions", chat_body())
+    assert status == 200
+    assert json.loads(data)["choices"][0]["message"]["content"] == "[]"
+    assert state.counters["misses"] == 1
+
+
+def test_records_from_upstream_then_replays(serve):
+    upstream_url, _ = serve(fallback_content="recorded answer")
+    url, state = serve(upstream=upstream_url)
+    status, data, _ = post(f"{url}/chat/completions", chat_body(stream=True))
+    assert status == 200
+    assert state.counters["recorded"] == 1
+    assert state.store.get(request_key(chat_body()))["content"] == "recorded answer"
+
+    status, data, _ = post(f"{url}/chat/completions", chat_body())
+    assert json.loads(data)["choices"][0]["message"]["content"] == "recorded answer"
+    assert state.counters["replayed"] == 1
+
+
+def test_unreachable_upstream_is_502(serve):
+    url, _ = serve(upstream="http://127.0.0.1:9/v1")
+    status, data, _ = post(f"{url}/chat/completions", chat_body())
+    assert status == 502
+    assert json.loads(data)["error"]["type"] == "upstream_error"
+
+
+def test_injected_429_carries_rate_limit_headers(serve):
+    url, state = serve(rate_429=1.0, fallback_content="[]")
+    status, data, headers = post(f"{url}/chat/completions", chat_body())
+    assert status == 429
+    assert json.loads(data)["error"]["type"] == "rate_limit_exceeded"
+    assert headers["retry-after-ms"] == "1000"
+    assert state.counters["429"] == 1
+
+
+def test_injected_malformed_response_is_truncated(serve):
+    url, state = serve(rate_malformed=1.0, fallback_content='[{"RISK_TYPE": "Delta"}]')
+    completion = json.loads(post(f"{url}/chat/completions", chat_body())[1])
+    choice = completion["choices"][0]
+    assert choice["finish_reason"] == "length"
+    assert len(choice["message"]["content"]) < len('[{"RISK_TYPE": "Delta"}]')
+    assert state.counters["malformed"] == 1
+
+
+@pytest.mark.parametrize("data", [b"{not json", b"[1, 2]"])
+def test_malformed_request_body_is_400(serve, data):
+    url, _ = serve(fallback_content="[]")
+    status, body, _ = post(f"{url}/chat/completions", data)
+    assert status == 400
+    assert json.loads(body)["error"]["type"] == "invalid_request_error"
+
+
+def test_unknown_paths_are_404(serve):
+    url, _ = serve()
+    assert post(f"{url}/embeddings", {})[0] == 404
+    assert get(f"{url}/models")[0] == 404
+
+
+def test_streams_chunks_with_usage(serve):
+    content = "0123456789" * 5
+    url, _ = serve(fallback_content=content)
+    _, data, _ = post(f"{url}/chat/completions", chat_body(stream=True, stream_options={"include_usage": True}))
+    events = [line[len("data: "):] for line in data.decode("utf-8").split("\n\n") if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+    assert text == content
+    assert chunks[-2]["choices"][0]["finish_reason"] == "stop"
+    assert chunks[-1]["choices"] == [] and chunks[-1]["usage"]["completion_tokens"] == len(content) // 4
+
+
+def test_stats_endpoint(serve):
+    url, state = serve(fallback_content="[]")
+    post(f"{url}/chat/completions", chat_body())
+    stats = json.loads(get(f"{url}/stats")[1])
+    assert stats["requests"] == 1 and stats["recordings"] == 0
+
+
+def upload(url, data, purpose="batch"):
+    boundary = "replay-test-boundary"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"purpose\"\r\n\r\n{purpose}\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"input.jsonl\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8") + data + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return post(f"{url}/files", body, f"multipart/form-data; boundary={boundary}")
+
+
+def test_batch_answers_each_line_from_recordings(serve):
+    url, state = serve()
+    record(state, chat_body("known"), "[]")
+    lines = [
+        {"custom_id": "a", "method": "POST", "url": "/v1/chat/completions", "body": chat_body("known")},
+        {"custom_id": "b", "method": "POST", "url": "/v1/chat/completions", "body": chat_body("unknown")}
+    ]
+    status, data, _ = upload(url, "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8"))
+    assert status == 200
+    input_file = json.loads(data)
+    assert input_file["purpose"] == "batch" and input_file["filename"] == "input.jsonl"
+
+    batch = json.loads(post(f"{url}/batches", {"input_file_id": input_file["id"], "endpoint": "/v1/chat/completions"})[1])
+    for _ in range(100):
+        batch = json.loads(get(f"{url}/batches/{batch['id']}")[1])
+        if batch["status"] == "completed":
+            break
+        time.sleep(0.02)
+    assert batch["request_counts"] == {"total": 2, "completed": 1, "failed": 1}
+
+    output = [json.loads(line) for line in get(f"{url}/files/{batch['output_file_id']}/content")[1].splitlines()]
+    assert output[0]["custom_id"] == "a"
+    assert output[0]["response"]["body"]["choices"][0]["message"]["content"] == "[]"
+    errors = [json.loads(line) for line in get(f"{url}/files/{batch['error_file_id']}/content")[1].splitlines()]
+    assert errors[0]["custom_id"] == "b" and errors[0]["error"]["code"] == "replay_miss"
+
+
+def test_batch_rejects_unknown_or_invalid_input(serve):
+    url, _ = serve()
+    assert post(f"{url}/batches", {"input_file_id": "file-missing"})[0] == 400
+    input_file = json.loads(upload(url, b"not jsonl\n")[1])
+    assert post(f"{url}/batches", {"input_file_id": input_file["id"]})[0] == 400
+    assert post(f"{url}/files", b"plain", "text/plain")[0] == 400
+    assert get(f"{url}/files/file-missing/content")[0] == 404
+    assert get(f"{url}/batches/batch-missing")[0] == 404
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("numpy")
+
+from src.processors.table_color_classifier import TableColorClassifier
+
+BLUE = (31, 78, 121)
+RED = (192, 0, 0)
+
+
+def table_image(header_color, body_color=None, header_top=0, width=300, height=160):
+    """A white table with a filled header band, white header text and an optional coloured body."""
+    image = Image.new("RGB", (width, height), "white")
+    image.paste(header_color, (0, header_top, width, header_top + 30))
+    for x in range(10, width, 60):
+        image.paste((255, 255, 255), (x, header_top + 10, x + 30, header_top + 18))
+    if body_color is not None:
+        image.paste(body_color, (0, height - 40, width, height))
+    return image
+
+
+def test_blue_and_red_headers():
+    classifier = TableColorClassifier()
+    label, confidence = classifier.classify(table_image(BLUE))
+    assert label == "blue" and confidence > 0.9
+    label, confidence = classifier.classify(table_image(RED))
+    assert label == "red" and confidence > 0.9
+
+
+def test_header_band_decides_over_coloured_body_rows():
+    # A red highlight lower in the table does not outvote the blue header
+    label, _ = TableColorClassifier().classify(table_image(BLUE, body_color=RED))
+    assert label == "blue"
+
+
+def test_header_below_a_white_title_area():
+    label, _ = TableColorClassifier().classify(table_image(RED, header_top=50))
+    assert label == "red"
+
+
+def test_uncoloured_image_is_unknown():
+    image = Image.new("RGB", (300, 160), "white")
+    image.paste((60, 60, 60), (0, 0, 300, 30))
+    assert TableColorClassifier().classify(image) == ("unknown", 0.0)
+
+
+def test_accepts_encoded_bytes_and_paths(tmp_path):
+    buffer = io.BytesIO()
+    table_image(BLUE).save(buffer, format="PNG")
+    path = tmp_path / "table.png"
+    path.write_bytes(buffer.getvalue())
+    classifier = TableColorClassifier()
+    assert classifier.classify(buffer.getvalue())[0] == "blue"
+    assert classifier.classify(str(path))[0] == "blue"
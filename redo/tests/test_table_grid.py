@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from src.utils.table_grid import TableGrid, select_table
+
+
+def layout_table(rows):
+    """An Azure-style layout table of the given rows; None cells are left out, like empty cells."""
+    cells = [SimpleNamespace(row_index=r, column_index=c, content=value)
+             for r, row in enumerate(rows) for c, value in enumerate(row) if value is not None]
+    return SimpleNamespace(row_count=len(rows), column_count=len(rows[0]), cells=cells)
+
+
+PNL_ROWS = [["Risk Type", "Rider", "Liability", "Asset"]] + [["Equity", "1", "2", "3"]] * 9
+
+
+def test_from_layout_table_places_cells_and_keeps_gaps():
+    grid = TableGrid.from_layout_table(layout_table([["a", None], [None, "d"]]), index=3)
+    assert grid.cells == [["a", None], [None, "d"]]
+    assert (grid.row_count, grid.column_count, grid.index) == (2, 2, 3)
+    assert grid.content == "a\t\n\td"
+
+
+def test_score_counts_only_the_first_column_pair():
+    score, reasons = TableGrid(PNL_ROWS).score()
+    # Liability+Asset (100) wins over Rider+Asset; equity (30), 10 rows (20), 4 cols (10)
+    assert score == 160
+    assert reasons[0] == "Liability+Asset columns (+100)"
+    assert not any(reason.startswith("Rider") for reason in reasons)
+
+
+def test_score_matches_keywords_case_insensitively():
+    score, reasons = TableGrid([["Rider", "ASSET"], ["P&amp;L", "Interest Rate"]]).score()
+    assert score == 90 + 50 + 30
+    assert reasons == ["Rider+Asset columns (+90)", "P&L reference (+50)", "risk categories (+30)"]
+
+
+def test_score_of_an_unrelated_table():
+    assert TableGrid([["Name", "Date"], ["x", "y"]]).score() == (0, [])
+    assert TableGrid([]).score() == (0, [])
+
+
+def test_renderings_are_cached():
+    grid = TableGrid([["Risk", "Value"], ["Equity", None]])
+    assert grid.text is grid.text
+    assert "Equity" in grid.text
+    assert grid.prompt_text is grid.prompt_text
+    assert "Equity" in grid.prompt_text
+
+
+def test_select_table_picks_the_highest_score():
+    tables = [layout_table([["Name", "Date"]]), layout_table(PNL_ROWS), layout_table([["Rider", "Asset"]])]
+    best = select_table(tables)
+    assert best.index == 1
+    assert best.cells[0][2] == "Liability"
+
+
+def test_select_table_keeps_the_earliest_on_a_tie():
+    tables = [layout_table([["a", "b"]]), layout_table([["c", "d"]])]
+    assert select_table(tables).index == 0
+
+
+def test_select_table_without_tables():
+    assert select_table([]) is None
+    assert select_table(None) is None
@@ -0,0 +1,56 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from src.utils.table_serializer import estimate_tokens, serialize_table
+
+
+def test_grid_drops_empty_rows_and_columns_and_cleans_cells():
+    grid = [
+        ["Equity", None, "  1.5 ", "nan"],
+        [None, None, None, None],
+        ["Rho\n", "", "2", "-"],
+    ]
+    assert serialize_table(grid) == "Equity\t1.5\t\nRho\t2\t-"
+
+
+def test_dataframe_keeps_named_columns_without_values():
+    df = pd.DataFrame({"Risk": ["Delta", "Rho"], "Liability": [1, 2], "Asset": [None, None], "": [None, None]})
+    assert serialize_table(df, hoist_constants=False) == "Risk\tLiability\tAsset\nDelta\t1\t\nRho\t2\t"
+
+
+def test_constant_columns_are_hoisted_above_the_table():
+    df = pd.DataFrame({
+        "VALUATION_DATE": ["20240801", "20240801"],
+        "PRODUCT_TYPE": ["DBIB", "DBIB"],
+        "RISK_TYPE": ["Equity", "Credit"],
+        "RIDER_VALUE": [1.0, 1.0]
+    })
+    text = serialize_table(df)
+    assert text.splitlines()[:3] == ["VALUATION_DATE: 20240801", "PRODUCT_TYPE: DBIB", "RISK_TYPE\tRIDER_VALUE"]
+    # Value columns stay in the table even when constant
+    assert text.endswith("Equity\t1.0\nCredit\t1.0")
+
+
+def test_varying_constant_column_stays_in_the_table():
+    df = pd.DataFrame({"PRODUCT_TYPE": ["DBIB", "WB"], "RISK_TYPE": ["Equity", "Credit"]})
+    assert serialize_table(df) == "PRODUCT_TYPE\tRISK_TYPE\nDBIB\tEquity\nWB\tCredit"
+
+
+def test_range_index_columns_are_not_a_header():
+    df = pd.DataFrame([["a", "b"], ["c", "d"]])
+    assert serialize_table(df) == "a\tb\nc\td"
+
+
+def test_markdown_format_escapes_pipes():
+    df = pd.DataFrame({"Risk": ["P|L"], "Value": [1]})
+    assert serialize_table(df, fmt="markdown") == "| Risk | Value |\n|---|---|\n| P\\|L | 1 |"
+
+
+def test_empty_table_serializes_to_nothing():
+    assert serialize_table([[None, ""], []]) == ""
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert 0 < estimate_tokens("Equity\tDelta\t1.5") <= len("Equity\tDelta\t1.5")
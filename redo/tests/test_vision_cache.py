@@ -0,0 +1,84 @@
+import io
+import hashlib
+import json
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from src.utils.vision_cache import VisionCache, color_dhash, hamming_distance
+
+
+def table_png(header_color, width=240, height=120, marker=None):
+    """Encode a small table-like image: coloured header band over a white body."""
+    image = Image.new("RGB", (width, height), "white")
+    image.paste(header_color, (0, 0, width, height // 4))
+    for x in range(0, width, 40):
+        image.paste((40, 40, 40), (x, height // 4, x + 2, height))
+    if marker is not None:
+        # A pixel that changes the exact hash but not the perceptual one
+        image.putpixel((width - 1, height - 1), marker)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+BLUE = (40, 80, 200)
+RED = (200, 40, 40)
+
+
+def make_cache(tmp_path, **kwargs):
+    return VisionCache(str(tmp_path / "vision.json"), **kwargs)
+
+
+def test_color_dhash_tells_header_colours_apart():
+    blue, red = color_dhash(table_png(BLUE)), color_dhash(table_png(RED))
+    assert len(blue) == 80
+    assert hamming_distance(blue, color_dhash(table_png(BLUE, marker=(0, 0, 0)))) == 0
+    assert hamming_distance(blue, red) > 12
+
+
+def test_exact_and_perceptual_hits(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store(table_png(BLUE), "blue")
+    assert cache.lookup(table_png(BLUE)) == "blue"
+    assert cache.lookup(table_png(BLUE, marker=(1, 2, 3))) == "blue"
+    assert cache.lookup(table_png(RED)) is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["perceptual_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_only_definite_labels_are_stored(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store(table_png(BLUE), "unknown")
+    assert cache.lookup(table_png(BLUE)) is None
+    assert not (tmp_path / "vision.json").exists()
+
+
+def test_disabled_cache(tmp_path):
+    cache = make_cache(tmp_path, enabled=False)
+    cache.store(table_png(BLUE), "blue")
+    assert cache.lookup(table_png(BLUE)) is None
+
+
+def test_index_is_shared_through_the_file(tmp_path):
+    make_cache(tmp_path).store(table_png(BLUE), "blue")
+    other = make_cache(tmp_path)
+    other.store(table_png(RED), "red")
+    index = json.loads((tmp_path / "vision.json").read_text())
+    assert sorted(index["exact"].values()) == ["blue", "red"]
+    assert make_cache(tmp_path).lookup(table_png(BLUE)) == "blue"
+
+
+def test_indexes_evict_least_recently_used_entries(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2, max_distance=0)
+    first, second, third = (table_png(color) for color in (BLUE, RED, (40, 200, 80)))
+    cache.store(first, "blue")
+    cache.store(second, "red")
+    # Using the first entry makes the second one the least recently used
+    assert cache.lookup(first) == "blue"
+    cache.store(third, "blue")
+
+    index = json.loads((tmp_path / "vision.json").read_text())
+    assert list(index["exact"]) == [hashlib.sha256(image).hexdigest() for image in (first, third)]
+    assert len(index["perceptual"]) == 2